@@ -0,0 +1 @@
+"""Offline load testing for LIBRIS; see ``benchmarks.load_test``."""
@@ -0,0 +1,157 @@
+"""
+Synthetic uploads for the benchmarks.
+
+Reading lists are generated from the bundled catalog and written as
+plain text, as a minimal text-based PDF, or as a minimal Word document,
+without needing any PDF or DOCX writing library.
+"""
+
+import csv
+import io
+import random
+import zipfile
+
+from libris.catalog import CATALOG_CSV, format_year
+
+FILLER = (
+    "Students should read the assigned chapters before each seminar and come "
+    "prepared to discuss the central arguments and their historical context."
+)
+
+
+def catalog_citations():
+    """``Title - Author - Date`` lines for every catalog record."""
+    with open(CATALOG_CSV, newline="", encoding="utf-8") as handle:
+        return [
+            f"{row['title']} - {row['author']} - {format_year(int(row['year']))}"
+            for row in csv.DictReader(handle)
+        ]
+
+
+def reading_list_pages(pages, citations_per_page=8, seed=0):
+    """A reading list as a list of pages, each a list of lines."""
+    rng = random.Random(seed)
+    citations = catalog_citations()
+    return [
+        [f"Week {number + 1}", FILLER]
+        + rng.sample(citations, min(citations_per_page, len(citations)))
+        + [FILLER]
+        for number in range(pages)
+    ]
+
+
+def text_bytes(pages):
+    return "\n\n".join("\n".join(lines) for lines in pages).encode("utf-8")
+
+
+def _pdf_string(line):
+    text = line.encode("latin-1", "replace").decode("latin-1")
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def pdf_bytes(pages):
+    """A text-based PDF with one page per entry of ``pages``."""
+    objects = []
+    page_ids = []
+    font_id = 3
+    for lines in pages:
+        stream = "BT /F1 10 Tf 14 TL 50 790 Td " + " ".join(
+            f"{_pdf_string(line)} Tj T*" for line in lines
+        ) + " ET"
+        content = stream.encode("latin-1")
+        content_id = 4 + len(objects)
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        )
+        page_id = 4 + len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (font_id, content_id)
+        )
+        page_ids.append(page_id)
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode("ascii")
+    header = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(header + objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+    return out.getvalue()
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def _xml_escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def docx_bytes(pages):
+    """A Word document with one paragraph per line."""
+    paragraphs = "".join(
+        f"<w:p><w:r><w:t xml:space=\"preserve\">{_xml_escape(line)}</w:t></w:r></w:p>"
+        for lines in pages
+        for line in lines
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{paragraphs}</w:body></w:document>"
+    )
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _RELS)
+        archive.writestr("word/document.xml", document)
+    return out.getvalue()
+
+
+WRITERS = {"txt": text_bytes, "pdf": pdf_bytes, "docx": docx_bytes}
+
+
+def generate_uploads(formats, sizes, seed=0):
+    """
+    One upload per (format, size) pair.
+
+    Args:
+        formats: Extensions from ``WRITERS``
+        sizes: Page counts
+
+    Returns:
+        list: (filename, bytes) tuples
+    """
+    uploads = []
+    for index, fmt in enumerate(formats):
+        for size in sizes:
+            pages = reading_list_pages(size, seed=seed * 10007 + index * 101 + size)
+            uploads.append((f"reading_list_{size}p.{fmt}", WRITERS[fmt](pages)))
+    return uploads
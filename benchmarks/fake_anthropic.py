@@ -0,0 +1,250 @@
+"""
+An offline stand-in for ``anthropic.Anthropic``.
+
+Implements the parts of the client LIBRIS uses (``messages.create``,
+``messages.stream`` and ``messages.count_tokens``) with a simple latency
+model: a fixed time to first token, then output at a fixed token rate.
+Extraction requests are answered with a table of the citations found in
+the prompt, or with a tool call listing them when a tool is forced, so
+downstream parsing and merging do real work. Like the API, a reply
+longer than the request's ``max_tokens`` is cut off there and reported
+with ``stop_reason="max_tokens"``. Response event hooks (the rate
+limiter's header reader) are called after every response.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+_CITATION = re.compile(r"^(.+?) - (.+?) - (\d{1,4}(?: BC| AD)?)\s*$", re.MULTILINE)
+
+TABLE_HEADER = (
+    "| Publication Date | Author | Book Title | Key Themes / Notes | Source |\n"
+    "|-----------------|--------|------------|-------------------|--------|\n"
+)
+
+ANALYSIS_REPLY = (
+    "**Patterns observed:** the results span several eras, with a cluster of works "
+    "on ethics and political philosophy. **Suggested next steps:** compare the "
+    "classical sources with their early-modern reception, then narrow by tradition."
+)
+
+
+def count_tokens(value):
+    """Rough token count of request content (4 characters per token)."""
+    if isinstance(value, str):
+        return len(value) // 4
+    if isinstance(value, dict):
+        return count_tokens(value.get("text", "")) + count_tokens(value.get("content", ""))
+    if isinstance(value, list):
+        return sum(count_tokens(item) for item in value)
+    return 0
+
+
+def _prompt_text(messages):
+    parts = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content)
+    return "\n".join(parts)
+
+
+def reply_for(kwargs):
+    """The text the fake model answers with."""
+    prompt = _prompt_text(kwargs["messages"])
+    citations = _CITATION.findall(prompt)
+    if citations or prompt.startswith("Document:"):
+        rows = [f"| {date} | {author} | {title} | | 📄 |" for title, author, date in citations]
+        return TABLE_HEADER + "\n".join(rows)
+    return ANALYSIS_REPLY
+
+
+def tool_input_for(kwargs):
+    """The ``record_entries`` input the fake model answers with when a tool is forced."""
+    citations = _CITATION.findall(_prompt_text(kwargs["messages"]))
+    return {
+        "entries": [
+            {"date": date, "author": author, "title": title, "themes": [], "source": "user_document"}
+            for title, author, date in citations
+        ]
+    }
+
+
+def output_limit(kwargs):
+    """Characters of output allowed by the request's ``max_tokens`` (4 per token)."""
+    return kwargs.get("max_tokens", 4096) * 4
+
+
+def truncate_tool_input(tool_input, limit):
+    """The entries that fit in ``limit`` characters of JSON, as a cut-off call would carry."""
+    entries = []
+    size = len('{"entries": []}')
+    for entry in tool_input["entries"]:
+        size += len(json.dumps(entry)) + 2
+        if size > limit:
+            break
+        entries.append(entry)
+    return {"entries": entries}
+
+
+class FakeBackend:
+    """
+    Latency model and call counters shared by every fake client.
+
+    Args:
+        first_token: Seconds before the first output token
+        tokens_per_second: Output rate after the first token
+        error_rate: Share of calls that fail with ``FakeOverloaded``
+    """
+
+    def __init__(self, first_token=0.3, tokens_per_second=80.0, error_rate=0.0, seed=0):
+        self.first_token = first_token
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def _record(self, kwargs, text):
+        usage = SimpleNamespace(
+            input_tokens=count_tokens(kwargs.get("system", "")) + count_tokens(kwargs["messages"]),
+            output_tokens=max(1, len(text) // 4),
+            cache_read_input_tokens=0,
+            cache_creation_input_tokens=0,
+        )
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += usage.input_tokens
+            self.output_tokens += usage.output_tokens
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise FakeOverloaded("Overloaded")
+        return usage
+
+    def message(self, kwargs):
+        tool = (kwargs.get("tool_choice") or {}).get("name")
+        tool_input = tool_input_for(kwargs) if tool else None
+        text = json.dumps(tool_input) if tool else reply_for(kwargs)
+        truncated = len(text) > output_limit(kwargs)
+        if truncated:
+            text = text[:output_limit(kwargs)]
+            if tool:
+                tool_input = truncate_tool_input(tool_input, output_limit(kwargs))
+        usage = self._record(kwargs, text)
+        time.sleep(self.first_token + usage.output_tokens / self.tokens_per_second)
+        tool_use = None
+        if tool:
+            tool_use = SimpleNamespace(type="tool_use", id="toolu_fake", name=tool, input=tool_input)
+        return _message(kwargs, text, usage, tool_use, "max_tokens" if truncated else None)
+
+
+class FakeOverloaded(Exception):
+    """Simulated 529 response."""
+
+    status_code = 529
+
+
+def _message(kwargs, text, usage, tool_use=None, stop_reason=None):
+    return SimpleNamespace(
+        id="msg_fake",
+        model=kwargs.get("model", "fake"),
+        role="assistant",
+        content=[tool_use or SimpleNamespace(type="text", text=text)],
+        stop_reason=stop_reason or ("tool_use" if tool_use else "end_turn"),
+        usage=usage,
+    )
+
+
+class FakeStream:
+    """Context manager mimicking ``MessageStream``."""
+
+    def __init__(self, backend, kwargs, on_response=None):
+        self._backend = backend
+        self._kwargs = kwargs
+        self._on_response = on_response or (lambda status_code: None)
+        text = reply_for(kwargs)
+        self._truncated = len(text) > output_limit(kwargs)
+        self._text = text[:output_limit(kwargs)]
+
+    def __enter__(self):
+        try:
+            self._usage = self._backend._record(self._kwargs, self._text)
+        except FakeOverloaded:
+            self._on_response(FakeOverloaded.status_code)
+            raise
+        self._on_response(200)
+        time.sleep(self._backend.first_token)
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        # About four characters per token, a few tokens per event
+        step = 16
+        delay = step / 4 / self._backend.tokens_per_second
+        for start in range(0, len(self._text), step):
+            time.sleep(delay)
+            yield self._text[start:start + step]
+
+    def get_final_message(self):
+        return _message(self._kwargs, self._text, self._usage, stop_reason="max_tokens" if self._truncated else None)
+
+
+class FakeMessages:
+    def __init__(self, backend, on_response):
+        self._backend = backend
+        self._on_response = on_response
+
+    def create(self, **kwargs):
+        try:
+            message = self._backend.message(kwargs)
+        except FakeOverloaded:
+            self._on_response(FakeOverloaded.status_code)
+            raise
+        self._on_response(200)
+        return message
+
+    def stream(self, **kwargs):
+        return FakeStream(self._backend, kwargs, self._on_response)
+
+    def count_tokens(self, **kwargs):
+        return SimpleNamespace(
+            input_tokens=count_tokens(kwargs.get("system", "")) + count_tokens(kwargs["messages"])
+        )
+
+
+class FakeAnthropic:
+    """
+    Drop-in for ``anthropic.Anthropic`` backed by a FakeBackend.
+
+    Args:
+        backend: FakeBackend shared by every fake client
+        event_hooks: httpx-style hooks; "response" hooks get each response
+    """
+
+    def __init__(self, backend=None, event_hooks=None, **kwargs):
+        self.backend = backend or FakeBackend()
+        self._response_hooks = (event_hooks or {}).get("response", [])
+        self.messages = FakeMessages(self.backend, self._respond)
+
+    def with_options(self, **kwargs):
+        # The fake never retries, so every copy is the same client
+        return self
+
+    def _respond(self, status_code):
+        response = SimpleNamespace(headers={}, status_code=status_code)
+        for hook in self._response_hooks:
+            hook(response)
+
+    def close(self):
+        pass
@@ -0,0 +1,386 @@
+"""
+Offline load test for LIBRIS.
+
+Simulates concurrent sessions running catalog searches with a streamed
+analysis, follow-up chat turns, uploads of generated text, PDF and Word
+reading lists, and exports, against a fake Anthropic API, so capacity
+can be measured without network access or spending tokens. The sessions
+go through the components the app ships: clients from the ClientPool
+behind the per-key rate limiter, uploads on a JobQueue over a shared
+worker pool and document store, and conversations kept in a
+SessionStore that spills to disk and compacted to the history budget.
+Reports throughput, per-operation latency percentiles, peak RSS, rate
+limiter, job and session memory figures, and the per-stage timings
+recorded by ``libris.metrics``.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.load_test --sessions 8 --operations 20
+    python -m benchmarks.load_test --first-token 0.5 --tokens-per-second 60 --json report.json
+
+PDF and Word uploads need ``pypdf`` and ``python-docx`` from
+requirements.txt; leave them out with ``--formats txt`` otherwise.
+"""
+
+import argparse
+import json
+import mimetypes
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.documents import generate_uploads
+from benchmarks.fake_anthropic import FakeAnthropic, FakeBackend
+from libris.aliases import AliasIndex
+from libris.catalog import Catalog
+from libris.client import ClientPool, ClientPoolConfig
+from libris.documents import DocumentStore, content_digest
+from libris.exporters import EXPORT_FORMATS
+from libris.extraction import ExtractionLimits
+from libris.history import HistoryBudget, build_request
+from libris.jobs import DONE, FAILED, JobQueue, QueueConfig
+from libris.metrics import REGISTRY, api_call, record_usage
+from libris.processing import ChunkingConfig
+from libris.prompt_cache import cached_system, usage_from_response, with_cache_breakpoints
+from libris.prompts import DOCUMENT_PROMPT, LIBRIS_SYSTEM_PROMPT, analysis_message
+from libris.ratelimit import RateLimitConfig, backoff_delay, is_retryable, retry_after
+from libris.retrieval import LEXICAL, RetrievalConfig, catalog_index, catalog_search
+from libris.records import Entry
+from libris.response_cache import MemoryBackend, ResponseCache
+from libris.routing import CHAT, EXTRACTION, SEARCH, Route
+from libris.session_store import SessionStore, SessionStoreConfig, SpillStore
+
+SEARCH_ROUTE = Route(SEARCH, "fake-model", 1000)
+CHAT_ROUTE = Route(CHAT, "fake-model", 1000)
+EXTRACTION_ROUTE = Route(EXTRACTION, "fake-model", 4000)
+
+# Every session shares one key, as on a deployment with a single API key
+API_KEY = "sk-load-test"
+
+FOLLOW_UPS = [
+    "Which of these would you read first?",
+    "How do the works in your last answer relate to each other?",
+    "Summarise the works from my document in two sentences each.",
+]
+
+QUERIES = [
+    "Ancient Greek philosophy",
+    "Social contract theory",
+    "Buddhist ethics",
+    "Medieval Islamic philosophy",
+    "Confucian virtue",
+    "Natural law",
+    "18th century political philosophy",
+    "Stoicism",
+    "existentialism",
+    "theory of knowledge",
+]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (Linux reports KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def call_model(client, rate_limits, operation, request, stream=False):
+    """
+    One model call, retried with backoff when throttled as the app does.
+    Returns the reply text.
+    """
+    attempt = 0
+    while True:
+        try:
+            if stream:
+                with api_call(operation), client.messages.stream(**request) as reply:
+                    text = "".join(reply.text_stream)
+                    response = reply.get_final_message()
+            else:
+                with api_call(operation):
+                    response = client.messages.create(**request)
+                text = response.content[0].text
+            break
+        except Exception as e:
+            if attempt >= rate_limits.max_retries or not is_retryable(e):
+                raise
+            time.sleep(backoff_delay(attempt, rate_limits.backoff_base, rate_limits.backoff_cap, retry_after(e)))
+            attempt += 1
+    record_usage(operation, usage_from_response(response))
+    return text
+
+
+class Harness:
+    """Shared state of one load-test run: the process-wide resources."""
+
+    def __init__(self, args):
+        self.args = args
+        self.backend = FakeBackend(args.first_token, args.tokens_per_second, args.error_rate, args.seed)
+        self.rate_limits = RateLimitConfig(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+        self.pool = ClientPool(
+            ClientPoolConfig(),
+            self.rate_limits,
+            client_factory=lambda api_key, event_hooks: FakeAnthropic(self.backend, event_hooks=event_hooks),
+        )
+        self.catalog = Catalog.from_csv(aliases=AliasIndex.from_csv())
+        # BM25 keeps runs offline and repeatable whether or not an embedding model is installed
+        self.retrieval = RetrievalConfig(model=LEXICAL)
+        self.index = catalog_index(self.catalog, self.retrieval)
+        self.cache = ResponseCache(ttl=None) if args.response_cache else None
+        # A store that keeps nothing stands in for a disabled one
+        self.store = DocumentStore(ResponseCache(MemoryBackend(max_entries=args.document_store), ttl=None))
+        self.chunking = ChunkingConfig(concurrency=args.chunk_concurrency)
+        self.limits = ExtractionLimits(workers=1)
+        self.queue_config = QueueConfig(workers=args.job_workers)
+        self.job_executor = ThreadPoolExecutor(max_workers=args.job_workers, thread_name_prefix="libris-job")
+        self.budget = HistoryBudget()
+        self.spill_dir = tempfile.TemporaryDirectory(prefix="libris-load-")
+        self.session_config = SessionStoreConfig(
+            max_resident_bytes=args.session_bytes, path=f"{self.spill_dir.name}/sessions.sqlite3"
+        )
+        self.spill = SpillStore.from_config(self.session_config)
+        self.uploads = generate_uploads(args.formats, args.pages, args.seed)
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds, error=None):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(seconds)
+            if error is not None:
+                key = f"{operation}: {type(error).__name__}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def search(self, session):
+        query = session.rng.choice(QUERIES)
+        search = catalog_search(self.catalog, self.index, query, self.retrieval)
+        session.results = [Entry.from_catalog(record) for record in search.records]
+
+        key = search.analysis_key(SEARCH_ROUTE.model)
+        text = self.cache.get(key) if self.cache is not None else None
+        if text is None:
+            request = {
+                "model": SEARCH_ROUTE.model,
+                "max_tokens": SEARCH_ROUTE.max_tokens,
+                "system": cached_system(LIBRIS_SYSTEM_PROMPT),
+                "messages": with_cache_breakpoints([
+                    {"role": "user", "content": analysis_message(query, search.table)}
+                ]),
+            }
+            text = call_model(session.client, self.rate_limits, "stream", request, stream=True)
+            if self.cache is not None:
+                self.cache.set(key, text)
+        session.record_turn(query, text)
+
+    def chat(self, session):
+        message = session.rng.choice(FOLLOW_UPS)
+        request = build_request(
+            session.client, session.history.for_request(), message, CHAT_ROUTE, self.budget, LIBRIS_SYSTEM_PROMPT
+        )
+        session.record_turn(message, call_model(session.client, self.rate_limits, "chat", request))
+
+    def upload(self, session):
+        filename, data = session.rng.choice(self.uploads)
+        file_type = mimetypes.guess_type(filename)[0] or ""
+        job = session.jobs.submit(session.client, filename, file_type, data, content_digest(data), in_chat=True)
+        while not job.finished:
+            time.sleep(0.01)
+        session.jobs.collect_finished()
+        session.jobs.clear_finished()
+        if job.status == FAILED:
+            raise job.error
+        if job.status == DONE:
+            session.results = job.entries
+            document = DOCUMENT_PROMPT.format(filename=filename, content=job.text)
+            session.record_turn(document, job.report, document=filename)
+
+    def export(self, session):
+        for _, renderer, _, _ in EXPORT_FORMATS.values():
+            renderer(session.results)
+
+
+class Session:
+    """One simulated user with its own conversation and job queue."""
+
+    def __init__(self, harness, number, seed):
+        self.number = number
+        self.rng = random.Random(seed * 7919 + number)
+        self.results = []
+        self.client = harness.pool.get(API_KEY)
+        self.history = SessionStore(f"load-{number}", harness.spill, harness.session_config)
+        self.jobs = JobQueue(
+            harness.job_executor,
+            harness.store,
+            EXTRACTION_ROUTE,
+            harness.chunking,
+            harness.limits,
+            harness.queue_config,
+        )
+
+    def record_turn(self, user_message, assistant_message, document=None):
+        user_entry = {"role": "user", "content": user_message}
+        if document:
+            user_entry["document"] = document
+        self.history.append(user_entry)
+        self.history.append({"role": "assistant", "content": assistant_message})
+
+
+def run_session(harness, session, operations, mix):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    for _ in range(operations):
+        operation = session.rng.choices(names, weights)[0]
+        if operation == "export" and not session.results:
+            operation = "search"
+        started = time.perf_counter()
+        try:
+            getattr(harness, operation)(session)
+        except Exception as e:
+            harness.record(operation, time.perf_counter() - started, e)
+        else:
+            harness.record(operation, time.perf_counter() - started)
+        if harness.args.think_time:
+            time.sleep(session.rng.uniform(0, harness.args.think_time))
+
+
+def run(args):
+    """Run the load test and return the report as a dict."""
+    harness = Harness(args)
+    sessions = [Session(harness, number, args.seed) for number in range(args.sessions)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="session") as pool:
+        futures = [
+            pool.submit(run_session, harness, session, args.operations, args.mix)
+            for session in sessions
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+    pool_stats = harness.pool.stats()
+    memory = [session.history.stats() for session in sessions]
+    harness.job_executor.shutdown()
+    harness.spill_dir.cleanup()
+
+    operations = {
+        name: {
+            "count": len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "mean": sum(values) / len(values),
+        }
+        for name, values in sorted(harness.latencies.items())
+    }
+    total = sum(len(values) for values in harness.latencies.values())
+    return {
+        "sessions": args.sessions,
+        "operations_per_session": args.operations,
+        "elapsed_seconds": elapsed,
+        "throughput_ops_per_second": total / elapsed if elapsed else 0.0,
+        "operations": operations,
+        "errors": harness.errors,
+        "model_calls": harness.backend.calls,
+        "input_tokens": harness.backend.input_tokens,
+        "output_tokens": harness.backend.output_tokens,
+        "peak_rss_mb": peak_rss_mb(),
+        "rate_limiter": pool_stats["rate_limits"],
+        "session_resident_bytes": sum(stats["resident_bytes"] for stats in memory),
+        "session_spilled_bytes": sum(stats["spilled_bytes"] for stats in memory),
+        "session_spilled_messages": sum(stats["spilled_messages"] for stats in memory),
+        "stages": [row for row in REGISTRY.summary() if "mean" in row],
+    }
+
+
+def format_report(report):
+    lines = [
+        f"LIBRIS load test: {report['sessions']} sessions x {report['operations_per_session']} operations",
+        f"Elapsed {report['elapsed_seconds']:.1f}s, throughput {report['throughput_ops_per_second']:.2f} ops/s, "
+        f"peak RSS {report['peak_rss_mb']:.1f} MB",
+        f"Model calls {report['model_calls']}, tokens in {report['input_tokens']:,} / out {report['output_tokens']:,}",
+        f"Sessions hold {report['session_resident_bytes']:,} bytes, {report['session_spilled_messages']} messages "
+        f"({report['session_spilled_bytes']:,} bytes) spilled to disk",
+    ]
+    for limits in report["rate_limiter"]:
+        lines.append(
+            f"Rate limiter: {limits['waited']} calls waited {limits['wait_seconds']:.1f}s in all, "
+            f"{limits['throttled']} throttled"
+        )
+    lines.extend([
+        "",
+        f"{'operation':<12}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}",
+    ])
+    for name, stats in report["operations"].items():
+        lines.append(
+            f"{name:<12}{stats['count']:>7}{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}"
+            f"{stats['p99'] * 1000:>10.1f}{stats['mean'] * 1000:>10.1f}"
+        )
+    if report["errors"]:
+        lines.append("")
+        lines.extend(f"error {name}: {count}" for name, count in sorted(report["errors"].items()))
+    lines.extend(["", f"{'stage':<44}{'count':>7}{'mean':>12}{'p95':>12}"])
+    for row in report["stages"]:
+        label = row["metric"] + (f" [{row['labels']}]" if row["labels"] else "")
+        lines.append(f"{label:<44}{row['count']:>7}{row['mean']:>12.4g}{row['p95']:>12.4g}")
+    return "\n".join(lines)
+
+
+def parse_mix(text):
+    """``search=5,chat=2,upload=2,export=3`` -> weights by operation."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("search", "chat", "upload", "export"):
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    parser.add_argument("--operations", type=int, default=20, help="operations per session")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("search=5,chat=2,upload=2,export=3"))
+    parser.add_argument("--formats", type=lambda text: text.split(","), default=["txt", "pdf", "docx"])
+    parser.add_argument("--pages", type=lambda text: [int(n) for n in text.split(",")], default=[2, 20, 100],
+                        help="page counts of the generated uploads")
+    parser.add_argument("--first-token", type=float, default=0.3, help="fake time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="fake output token rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake calls that fail")
+    parser.add_argument("--chunk-concurrency", type=int, default=ChunkingConfig.concurrency)
+    parser.add_argument("--job-workers", type=int, default=QueueConfig.workers, help="shared document job workers")
+    parser.add_argument("--rpm", type=int, default=RateLimitConfig.requests_per_minute,
+                        help="rate limiter requests per minute (0 disables it)")
+    parser.add_argument("--tpm", type=int, default=RateLimitConfig.tokens_per_minute,
+                        help="rate limiter input tokens per minute")
+    parser.add_argument("--session-bytes", type=int, default=SessionStoreConfig.max_resident_bytes,
+                        help="resident conversation bytes per session before spilling")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max pause between operations (s)")
+    parser.add_argument("--no-response-cache", dest="response_cache", action="store_false")
+    parser.add_argument("--no-document-store", dest="document_store", action="store_const", const=0, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+    return 1 if report["errors"] and not args.error_rate else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
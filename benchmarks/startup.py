@@ -0,0 +1,143 @@
+"""
+Cold-start budget for the Streamlit script.
+
+Imports ``streamlit_app`` in fresh interpreters, the way a newly started
+container does before rendering its first page, and reports the median
+import time, the slowest imports from ``python -X importtime``, and any
+heavy packages that were loaded eagerly. Exits non-zero when the median
+exceeds the budget or a package that should load lazily was imported.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --budget-ms 1500 --json startup.json
+
+Needs the packages in requirements.txt.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Loaded on first use of the API or of a file type, never at startup
+LAZY_MODULES = ("anthropic", "httpx", "httpx2", "pypdf", "docx", "lxml", "sentence_transformers", "torch")
+
+DEFAULT_BUDGET_MS = 1500
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _repo_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module="streamlit_app", importtime=False):
+    """
+    Import ``module`` in a fresh interpreter.
+
+    Returns:
+        tuple: (probe result dict, ``-X importtime`` output or "")
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", _PROBE.format(module=module)]
+    completed = subprocess.run(
+        command, cwd=_repo_root(), capture_output=True, text=True, check=False
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{completed.stderr[-2000:]}")
+    # Streamlit may log to stdout when run outside `streamlit run`; the probe prints last
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result, completed.stderr if importtime else ""
+
+
+def slowest_imports(importtime_output, top=10):
+    """Top-level packages by cumulative import time, in milliseconds."""
+    totals = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        # A package's own line includes everything imported while loading it
+        if cumulative.isdigit() and "." not in name:
+            totals[name] = max(totals.get(name, 0), int(cumulative) / 1000)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def run(args):
+    """Measure the cold start and return the report as a dict."""
+    # Untimed first run: writes bytecode and warms the OS file cache, as in a built image
+    measure(args.module)
+    timings = []
+    eager = set()
+    for _ in range(args.runs):
+        result, _ = measure(args.module)
+        timings.append(result["seconds"] * 1000)
+        eager.update(
+            name for name in result["modules"] if name.split(".")[0] in LAZY_MODULES
+        )
+    _, importtime = measure(args.module, importtime=True)
+    median = statistics.median(timings)
+    return {
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": median,
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+        "budget_ms": args.budget_ms,
+        "within_budget": median <= args.budget_ms,
+        "eager_imports": sorted({name.split(".")[0] for name in eager}),
+        "slowest_imports": slowest_imports(importtime),
+    }
+
+
+def format_report(report):
+    lines = [
+        f"Cold start of {report['module']}: median {report['median_ms']:.0f} ms "
+        f"(min {report['min_ms']:.0f}, max {report['max_ms']:.0f}, {report['runs']} runs), "
+        f"budget {report['budget_ms']:.0f} ms",
+        "",
+        f"{'package':<24}{'import ms':>12}",
+    ]
+    lines.extend(f"{name:<24}{ms:>12.1f}" for name, ms in report["slowest_imports"])
+    lines.append("")
+    if report["eager_imports"]:
+        lines.append("FAIL: imported at startup: " + ", ".join(report["eager_imports"]))
+    if not report["within_budget"]:
+        lines.append("FAIL: startup exceeds the budget")
+    if report["within_budget"] and not report["eager_imports"]:
+        lines.append("OK")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="streamlit_app", help="module to import")
+    parser.add_argument("--runs", type=int, default=5, help="timed imports (the median is reported)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+    return 0 if report["within_budget"] and not report["eager_imports"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
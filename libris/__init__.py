@@ -0,0 +1,6 @@
+"""
+LIBRIS support package.
+
+Everything that does not need Streamlit lives here so it can be shared by
+the web app, background workers and offline tooling.
+"""
@@ -0,0 +1,104 @@
+"""
+Transliteration and concept-synonym expansion for catalog search.
+
+The system prompt promises that "Confucius" finds "Kong Fuzi" and that
+"justice" reaches "dharma" and "dikaiosyne", but that was left to the
+model. ``AliasIndex`` compiles the groups in ``data/aliases.csv`` (author
+transliterations, title variants, cross-tradition concepts and spelling
+variants) into a hash of folded token sequences. The catalog expands each
+query locally before retrieval, so these matches are deterministic and
+cost no tokens.
+"""
+
+import csv
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from libris.text import tokenize
+
+ALIASES_CSV = Path(__file__).parent / "data" / "aliases.csv"
+
+
+@dataclass
+class AliasGroup:
+    """Names that should find one another; the first is the preferred form."""
+
+    kind: str
+    names: list = field(default_factory=list)
+
+
+@dataclass
+class Expansion:
+    """A phrase of the query and the names it was expanded to."""
+
+    phrase: str
+    tokens: tuple
+    alternatives: list = field(default_factory=list)
+
+    @property
+    def added(self):
+        """Alternatives other than the phrase itself, for display."""
+        return [name for name in self.alternatives if tuple(tokenize(name)) != self.tokens]
+
+
+class AliasIndex:
+    """
+    Alias groups keyed by folded token sequence.
+
+    Args:
+        groups: AliasGroup objects
+    """
+
+    def __init__(self, groups):
+        self.groups = list(groups)
+        self._lookup = {}
+        for number, group in enumerate(self.groups):
+            for name in group.names:
+                key = tuple(tokenize(name))
+                if key:
+                    self._lookup.setdefault(key, []).append(number)
+        self.max_tokens = max((len(key) for key in self._lookup), default=0)
+
+    @classmethod
+    def from_csv(cls, path=ALIASES_CSV):
+        """Load ``kind,names`` rows with ``;``-separated names."""
+        with open(path, newline="", encoding="utf-8") as handle:
+            return cls(
+                AliasGroup(row["kind"], [name.strip() for name in row["names"].split(";") if name.strip()])
+                for row in csv.DictReader(handle)
+            )
+
+    def __len__(self):
+        return len(self._lookup)
+
+    def lookup(self, tokens):
+        """Groups containing exactly the folded ``tokens``."""
+        return [self.groups[number] for number in self._lookup.get(tuple(tokens), [])]
+
+    def match(self, tokens):
+        """
+        Find alias phrases in a token sequence, longest first.
+
+        Returns:
+            tuple: (list of Expansion, tokens not covered by any phrase)
+        """
+        expansions = []
+        rest = []
+        position = 0
+        while position < len(tokens):
+            for length in range(min(self.max_tokens, len(tokens) - position), 0, -1):
+                phrase = tuple(tokens[position:position + length])
+                groups = self.lookup(phrase)
+                if groups:
+                    names = [name for group in groups for name in group.names]
+                    expansions.append(Expansion(" ".join(phrase), phrase, list(dict.fromkeys(names))))
+                    position += length
+                    break
+            else:
+                rest.append(tokens[position])
+                position += 1
+        return expansions, rest
+
+    def expand(self, query):
+        """Alias expansions found in ``query``."""
+        return self.match(tokenize(query))[0]
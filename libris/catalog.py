@@ -0,0 +1,367 @@
+"""
+Local bibliographic catalog.
+
+Records live in SQLite next to an inverted index (``postings``) over the
+folded tokens of each record's author, title, themes, tradition and era.
+Searches are answered locally in a few milliseconds; the model is only
+asked to comment on the rows that come back. With an ``AliasIndex``,
+transliterations and concept synonyms in the query are expanded before
+retrieval (see ``libris.aliases``).
+"""
+
+import csv
+import math
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from libris.records import BASE_SOURCE, CENTURY, century_years
+from libris.text import GENERIC_TERMS, STOPWORDS, stem, tokenize
+
+CATALOG_CSV = Path(__file__).parent / "data" / "catalog.csv"
+
+# Relative weight of a query term matching each field; a tradition or
+# subject ("Buddhist ethics") says more about a work than a title word
+FIELD_WEIGHTS = {"author": 3.0, "tradition": 3.0, "themes": 2.0, "title": 1.5, "era": 0.5}
+
+# Added to a term's best field weight for each other field it matches, so
+# a work named after a subject ranks above others only tagged with it
+EXTRA_FIELD_WEIGHT = 0.25
+
+# Share of a field weight added for generic query words ("philosophy"),
+# which only order records that match the other terms equally
+GENERIC_WEIGHT = 0.25
+
+# Below this many records matching every term, partial matches are included
+MIN_FULL_MATCHES = 5
+
+ERAS = (
+    ("ancient", None, 499),
+    ("medieval", 500, 1499),
+    ("early modern", 1500, 1799),
+    ("modern", 1800, 1944),
+    ("contemporary", 1945, None),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    year INTEGER,
+    date TEXT NOT NULL,
+    author TEXT NOT NULL,
+    title TEXT NOT NULL,
+    themes TEXT NOT NULL,
+    tradition TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_year ON records (year);
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    field TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS postings_token ON postings (token);
+"""
+
+_YEAR_RANGE = re.compile(r"\b(\d{3,4})\s*(?:-|–|to)\s*(\d{3,4})\b")
+
+
+def era_of(year):
+    """Return the era label for a year (negative years are BC)."""
+    if year is None:
+        return ""
+    for name, start, end in ERAS:
+        if (start is None or year >= start) and (end is None or year <= end):
+            return name
+    return ""
+
+
+def format_year(year):
+    """Render a year as a display date ("380 BC", "1651")."""
+    return f"{-year} BC" if year < 0 else str(year)
+
+
+def parse_date_hints(query):
+    """
+    Pull a date range out of a free-text query.
+
+    Understands "18th century", "5th century BC" and "1600-1700".
+
+    Returns:
+        tuple: (remaining query, year_from or None, year_to or None)
+    """
+    match = CENTURY.search(query)
+    if match:
+        year_from, year_to = century_years(int(match.group(1)), bool(match.group(2)))
+        return (query[:match.start()] + query[match.end():]).strip(), year_from, year_to
+
+    match = _YEAR_RANGE.search(query)
+    if match:
+        low, high = sorted((int(match.group(1)), int(match.group(2))))
+        return (query[:match.start()] + query[match.end():]).strip(), low, high
+
+    return query, None, None
+
+
+@dataclass
+class SearchResult:
+    """Rows returned by a catalog search and how they were found."""
+
+    query: str
+    records: list = field(default_factory=list)
+    terms: list = field(default_factory=list)
+    year_from: int = None
+    year_to: int = None
+    elapsed_ms: float = 0.0
+    expansions: list = field(default_factory=list)
+
+
+class Catalog:
+    """
+    SQLite-backed catalog with an inverted index.
+
+    One connection is shared by every Streamlit session; a lock serialises
+    access to it.
+
+    Args:
+        path: SQLite database path
+        aliases: Optional AliasIndex used to expand queries
+    """
+
+    def __init__(self, path=":memory:", aliases=None):
+        self.aliases = aliases
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+
+    @classmethod
+    def from_csv(cls, csv_path=CATALOG_CSV, db_path=":memory:", aliases=None):
+        """Open ``db_path`` and load ``csv_path`` into it if it is empty."""
+        catalog = cls(db_path, aliases)
+        if len(catalog) == 0:
+            with open(csv_path, newline="", encoding="utf-8") as handle:
+                catalog.add_records(csv.DictReader(handle))
+        return catalog
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def add_records(self, rows, source=BASE_SOURCE):
+        """
+        Insert records and index them.
+
+        Args:
+            rows: Iterable of dicts with year, date, author, title, themes
+                (``;``-separated) and tradition
+            source: Source indicator stored with each record
+        """
+        with self._lock, self._conn:
+            for row in rows:
+                year = int(row["year"]) if str(row.get("year", "")).strip() else None
+                cursor = self._conn.execute(
+                    "INSERT INTO records (year, date, author, title, themes, tradition, source)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        year,
+                        row.get("date") or (format_year(year) if year is not None else ""),
+                        row["author"],
+                        row["title"],
+                        row.get("themes", ""),
+                        row.get("tradition", ""),
+                        row.get("source") or source,
+                    ),
+                )
+                record_id = cursor.lastrowid
+                fields = {
+                    "author": row["author"],
+                    "title": row["title"],
+                    "themes": row.get("themes", "").replace(";", " "),
+                    "tradition": row.get("tradition", ""),
+                    "era": era_of(year),
+                }
+                postings = {
+                    (token, record_id, name)
+                    for name, value in fields.items()
+                    for token in tokenize(value)
+                    if token not in STOPWORDS
+                }
+                self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+
+    def records(self):
+        """Every record as a dict, in insertion order."""
+        with self._lock:
+            return self._fetch(None, None, None)
+
+    def _query_terms(self, query):
+        """
+        Split a query into terms.
+
+        Returns:
+            tuple: (term labels, alternatives per term as token tuples,
+            alias expansions, generic words left out of the terms)
+        """
+        tokens = tokenize(query)
+        expansions, tokens = self.aliases.match(tokens) if self.aliases is not None else ([], tokens)
+        words = [token for token in tokens if token not in STOPWORDS]
+        specific = [token for token in words if token not in GENERIC_TERMS]
+        # "Philosophy" alone is still a valid query
+        generic = list(dict.fromkeys(token for token in words if token in GENERIC_TERMS)) if specific else []
+        words = list(dict.fromkeys(specific or ([] if expansions else words)))
+
+        labels = words + [expansion.phrase for expansion in expansions]
+        alternatives = [[(word,)] for word in words]
+        for expansion in expansions:
+            options = [
+                tuple(token for token in tokenize(name) if token not in STOPWORDS)
+                for name in expansion.alternatives
+            ]
+            alternatives.append(list(dict.fromkeys(option for option in options if option)))
+        return labels, alternatives, expansions, generic
+
+    def _match_term(self, term):
+        """
+        Return {record_id: weight} for one query term: the best field it
+        matches, plus ``EXTRA_FIELD_WEIGHT`` for each other field.
+        """
+        prefix = stem(term) if len(term) >= 4 else term
+        if len(prefix) >= 4:
+            rows = self._conn.execute(
+                "SELECT record_id, field FROM postings WHERE token >= ? AND token < ?",
+                (prefix, prefix + "\uffff"),
+            )
+        else:
+            rows = self._conn.execute(
+                "SELECT record_id, field FROM postings WHERE token = ?", (term,)
+            )
+        fields = {}
+        for record_id, name in rows:
+            fields.setdefault(record_id, set()).add(name)
+        return {
+            record_id: max(FIELD_WEIGHTS[name] for name in names) + EXTRA_FIELD_WEIGHT * (len(names) - 1)
+            for record_id, names in fields.items()
+        }
+
+    def _match_alternatives(self, alternatives):
+        """
+        Return {record_id: weight} for records matching any alternative.
+
+        A multi-word alternative ("kong fuzi") needs every word to match;
+        it scores as its weakest word.
+        """
+        matches = {}
+        for tokens in alternatives:
+            found = None
+            for token in tokens:
+                hits = self._match_term(token)
+                if found is None:
+                    found = hits
+                else:
+                    found = {rid: min(weight, hits[rid]) for rid, weight in found.items() if rid in hits}
+                if not found:
+                    break
+            for record_id, weight in (found or {}).items():
+                matches[record_id] = max(matches.get(record_id, 0.0), weight)
+        return matches
+
+    def search(self, query, year_from=None, year_to=None, limit=50):
+        """
+        Find records matching ``query``.
+
+        Records are ranked by how many query terms they match, then by field
+        weights, then by generic query words ("philosophy") they also
+        match. Records matching every term are preferred; when there are
+        too few of those, records matching at least half the terms are
+        returned too.
+
+        Args:
+            query: Free-text query; date hints such as "18th century" are
+                turned into a year filter, and alias phrases count as one
+                term matching any of their alternatives
+            year_from: Earliest year to include (negative for BC)
+            year_to: Latest year to include
+            limit: Maximum number of records to return
+
+        Returns:
+            SearchResult: Matching records as dicts, best first
+        """
+        started = time.perf_counter()
+        text, hint_from, hint_to = parse_date_hints(query)
+        year_from = year_from if year_from is not None else hint_from
+        year_to = year_to if year_to is not None else hint_to
+        terms, alternatives, expansions, generic = self._query_terms(text)
+
+        with self._lock:
+            coverage = {}
+            scores = {}
+            for options in alternatives:
+                for record_id, weight in self._match_alternatives(options).items():
+                    coverage[record_id] = coverage.get(record_id, 0) + 1
+                    scores[record_id] = scores.get(record_id, 0.0) + weight
+            for word in generic:
+                # On the word's root, so "philosophy" also finds "philosopher-kings"
+                root = word[:-1] if word.endswith("y") else word
+                for record_id, weight in self._match_term(root).items():
+                    if record_id in coverage:
+                        scores[record_id] += weight * GENERIC_WEIGHT
+
+            if terms:
+                candidates = [rid for rid, hits in coverage.items() if hits == len(terms)]
+                if len(candidates) < MIN_FULL_MATCHES:
+                    needed = max(1, math.ceil(len(terms) / 2))
+                    candidates = [rid for rid, hits in coverage.items() if hits >= needed]
+            elif year_from is not None or year_to is not None:
+                candidates = None  # date-only query
+            else:
+                candidates = []
+
+            records = self._fetch(candidates, year_from, year_to)
+
+        records.sort(key=lambda rec: (
+            -coverage.get(rec["id"], 0),
+            -scores.get(rec["id"], 0.0),
+            rec["year"] if rec["year"] is not None else 0,
+        ))
+        return SearchResult(
+            query=query,
+            records=records[:limit],
+            terms=terms,
+            year_from=year_from,
+            year_to=year_to,
+            elapsed_ms=(time.perf_counter() - started) * 1000,
+            expansions=expansions,
+        )
+
+    def _fetch(self, record_ids, year_from, year_to):
+        clauses, params = [], []
+        if record_ids is not None:
+            if not record_ids:
+                return []
+            clauses.append(f"id IN ({','.join('?' * len(record_ids))})")
+            params.extend(record_ids)
+        if year_from is not None:
+            clauses.append("year >= ?")
+            params.append(year_from)
+        if year_to is not None:
+            clauses.append("year <= ?")
+            params.append(year_to)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn.execute(f"SELECT * FROM records{where}", params)
+        return [dict(row) for row in rows]
+
+
+def records_to_markdown(records):
+    """Render records as the LIBRIS results table."""
+    lines = [
+        "| Publication Date | Author | Book Title | Key Themes / Notes | Source |",
+        "|-----------------|--------|------------|-------------------|--------|",
+    ]
+    for rec in records:
+        cells = [rec["date"], rec["author"], rec["title"], rec["themes"].replace(";", ", "), rec["source"]]
+        lines.append("| " + " | ".join(cell.replace("|", "/") for cell in cells) + " |")
+    return "\n".join(lines)
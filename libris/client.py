@@ -0,0 +1,158 @@
+"""
+Shared Anthropic client pool.
+
+Creating ``anthropic.Anthropic`` per request throws away the underlying
+HTTP connection pool, so every search paid a fresh TCP + TLS handshake.
+``ClientPool`` keeps one client per API key for the life of the process,
+each backed by a keep-alive connection pool sized from the settings
+below and, when limits are configured, a per-key ``RateLimiter`` shared by
+every session using that key. Message requests are sent without the
+SDK's retries, since callers retry them behind the limiter; token
+counting and batch calls keep the SDK's retries. The connection pool is
+the SDK's own ``DefaultHttpxClient``, so it always matches the HTTP
+library the installed SDK is built on. ``anthropic`` is imported when the
+first client is built, keeping it off the app's cold-start path.
+"""
+
+import hashlib
+import threading
+from dataclasses import dataclass
+
+from libris.ratelimit import LimitedClient, RateLimiter
+from libris.settings import env_float, env_int
+
+
+@dataclass(frozen=True)
+class ClientPoolConfig:
+    """Connection and timeout settings shared by pooled clients."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 120.0
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from ``LIBRIS_HTTP_*`` environment variables."""
+        return cls(
+            max_connections=env_int("LIBRIS_HTTP_MAX_CONNECTIONS", cls.max_connections),
+            max_keepalive_connections=env_int(
+                "LIBRIS_HTTP_MAX_KEEPALIVE", cls.max_keepalive_connections
+            ),
+            keepalive_expiry=env_float("LIBRIS_HTTP_KEEPALIVE_EXPIRY", cls.keepalive_expiry),
+            connect_timeout=env_float("LIBRIS_HTTP_CONNECT_TIMEOUT", cls.connect_timeout),
+            read_timeout=env_float("LIBRIS_HTTP_READ_TIMEOUT", cls.read_timeout),
+        )
+
+
+def _key_id(api_key):
+    """Return a short, non-reversible identifier for an API key."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class ClientPool:
+    """
+    Thread-safe registry of Anthropic clients keyed by API key.
+
+    Streamlit runs every session's script in its own thread, so lookups and
+    inserts are guarded by a lock. Clients themselves are safe to share.
+
+    Args:
+        config: ClientPoolConfig
+        rate_limits: RateLimitConfig for each key's limiter, or None
+        client_factory: Optional ``(api_key, event_hooks)`` callable that
+            builds the SDK client instead (the load test passes a fake)
+    """
+
+    def __init__(self, config=None, rate_limits=None, client_factory=None):
+        self.config = config or ClientPoolConfig()
+        self.rate_limits = rate_limits
+        self.client_factory = client_factory
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._limiters = {}
+        self._hits = 0
+        self._misses = 0
+
+    def _build(self, api_key, limiter=None):
+        event_hooks = limiter.event_hooks() if limiter is not None else None
+        client = (self.client_factory or self._sdk_client)(api_key, event_hooks)
+        return LimitedClient(client, limiter)
+
+    def _sdk_client(self, api_key, event_hooks):
+        import anthropic
+
+        cfg = self.config
+        # Limits from the SDK's HTTP library, whichever it is
+        limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=cfg.max_connections,
+            max_keepalive_connections=cfg.max_keepalive_connections,
+            keepalive_expiry=cfg.keepalive_expiry,
+        )
+        http_client = anthropic.DefaultHttpxClient(
+            limits=limits,
+            timeout=anthropic.Timeout(cfg.read_timeout, connect=cfg.connect_timeout),
+            event_hooks=event_hooks,
+        )
+        return anthropic.Anthropic(api_key=api_key, http_client=http_client)
+
+    def get(self, api_key):
+        """
+        Return the pooled client for ``api_key``, creating it on first use.
+
+        Args:
+            api_key: Anthropic API key
+
+        Returns:
+            LimitedClient: An anthropic.Anthropic client whose HTTP
+                connections are reused
+        """
+        key = _key_id(api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._hits += 1
+                return client
+            self._misses += 1
+            limiter = None
+            if self.rate_limits is not None and self.rate_limits.enabled:
+                limiter = self._limiters[key] = RateLimiter(self.rate_limits)
+            client = self._build(api_key, limiter)
+            self._clients[key] = client
+            return client
+
+    def stats(self):
+        """Return a snapshot of pool usage for display."""
+        with self._lock:
+            clients = dict(self._clients)
+            limiters = list(self._limiters.values())
+            stats = {
+                "clients": len(clients),
+                "hits": self._hits,
+                "misses": self._misses,
+                "max_connections": self.config.max_connections,
+                "max_keepalive_connections": self.config.max_keepalive_connections,
+            }
+        stats["open_connections"] = sum(
+            _open_connections(client) for client in clients.values()
+        )
+        stats["rate_limits"] = [limiter.stats() for limiter in limiters]
+        return stats
+
+    def close(self):
+        """Close every pooled client and its HTTP connections."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+def _open_connections(client):
+    """Best-effort count of live connections held by a client's transport."""
+    http_client = getattr(client, "_client", None)
+    transport = getattr(http_client, "_transport", None)
+    pool = getattr(transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return len(connections) if connections is not None else 0
@@ -0,0 +1,321 @@
+"""
+Fuzzy de-duplication of bibliographic entries.
+
+Reading lists cite the same work in different ways ("Summa Theologica -
+Aquinas, 1274" and "Summa Theologiae, Thomas Aquinas"), so exact-match
+de-duplication let repeats through, within a document and across every
+document a user uploads. ``EntryCollection`` normalises titles and
+authors, only compares an entry with those sharing its author key or a
+nearby year bucket, scores title and author similarity, and merges
+matches while remembering which documents each work came from. It is
+updated incrementally as each document is processed.
+"""
+
+import re
+from dataclasses import dataclass, field, replace
+from difflib import SequenceMatcher
+
+from libris.settings import env_float
+from libris.text import STOPWORDS, tokenize
+
+# Entries scoring at least this much are treated as the same work
+MATCH_THRESHOLD = env_float("LIBRIS_DEDUP_THRESHOLD", 0.85)
+
+# Width in years of the date blocks; neighbouring blocks are compared too
+YEAR_BUCKET = 50
+
+# Dates further apart than this make a match less likely
+YEAR_TOLERANCE = 200
+
+_ARTICLES = {"the", "a", "an", "le", "la", "les", "il", "el", "der", "die", "das"}
+_NAME_SUFFIXES = {"jr", "sr", "ii", "iii", "iv"}
+_UNKNOWN_AUTHORS = {"anonymous", "anon", "unknown", "various"}
+
+_BRACKETED = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+_SUBTITLE = re.compile(r"\s*(?::|;|\s[-–—]\s|,\s*or\s).*$", re.IGNORECASE)
+
+
+def normalize_title(title, aliases=None):
+    """
+    Folded title words without brackets, subtitle or leading article,
+    mapped to the preferred form of a known title variant when an
+    AliasIndex is given.
+    """
+    words = tokenize(_SUBTITLE.sub("", _BRACKETED.sub(" ", title or "")))
+    if aliases is not None:
+        groups = [group for group in aliases.lookup(words) if group.kind == "title"]
+        if groups:
+            words = tokenize(groups[0].names[0])
+    if len(words) > 1 and words[0] in _ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+def _first_author(author):
+    author = re.split(r";|&|\band\b", author or "")[0].strip()
+    # "Hobbes, Thomas" -> "Thomas Hobbes"
+    if author.count(",") == 1:
+        last, first = (part.strip() for part in author.split(","))
+        if first and first.lower().rstrip(".") not in _NAME_SUFFIXES:
+            author = f"{first} {last}"
+    return author
+
+
+def normalize_author(author, aliases=None):
+    """
+    Folded words of the first author, with transliterations mapped to the
+    preferred form when an AliasIndex is given.
+    """
+    author = _first_author(author)
+    bracketed = " ".join(_BRACKETED.findall(author))
+    words = [word for word in tokenize(_BRACKETED.sub(" ", author)) if word not in _NAME_SUFFIXES]
+    if aliases is not None:
+        for candidate in (words, tokenize(bracketed), words[-1:]):
+            groups = [group for group in aliases.lookup(candidate) if group.kind == "author"]
+            if groups:
+                return tokenize(groups[0].names[0])
+    return words
+
+
+def author_key(words):
+    """Blocking key: the surname, or "" for anonymous works."""
+    if not words or " ".join(words) in _UNKNOWN_AUTHORS:
+        return ""
+    return words[-1]
+
+
+def _similar_words(a, b):
+    if a == b:
+        return True
+    return min(len(a), len(b)) >= 5 and SequenceMatcher(None, a, b).ratio() >= 0.85
+
+
+def title_similarity(a, b, floor=0.0):
+    """
+    Average of character similarity and fuzzy word overlap of two
+    normalised titles, so inflections ("theologica"/"theologiae") match
+    while different key words ("pure"/"practical") do not.
+
+    Pairs whose character similarity is below ``floor`` score 0 as soon
+    as the cheap upper bounds show it.
+    """
+    if a == b:
+        return 1.0
+    words_a = [word for word in a.split() if word not in STOPWORDS] or a.split()
+    words_b = [word for word in b.split() if word not in STOPWORDS] or b.split()
+    if not words_a or not words_b:
+        return 0.0
+    matcher = SequenceMatcher(None, " ".join(words_a), " ".join(words_b))
+    if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+        return 0.0
+    characters = matcher.ratio()
+    if characters < floor:
+        return 0.0
+    unmatched = list(words_b)
+    shared = 0
+    for word in words_a:
+        for other in unmatched:
+            if _similar_words(word, other):
+                unmatched.remove(other)
+                shared += 1
+                break
+    overlap = shared / max(len(words_a), len(words_b))
+    return (overlap + characters) / 2
+
+
+@dataclass
+class Provenance:
+    """Where one citation of a work came from, as it was written there."""
+
+    document: str
+    title: str
+    author: str
+    date: str
+
+
+@dataclass
+class _Features:
+    title: str
+    author: str
+    key: str
+    year: int = None
+
+
+@dataclass
+class Cluster:
+    """One work: the merged entry and every citation merged into it."""
+
+    entry: object
+    provenance: list = field(default_factory=list)
+    features: _Features = None
+
+    @property
+    def documents(self):
+        return list(dict.fromkeys(item.document for item in self.provenance if item.document))
+
+
+@dataclass
+class AddResult:
+    """Outcome of adding one document's entries to a collection."""
+
+    added: list = field(default_factory=list)
+    merged: list = field(default_factory=list)
+
+
+def merge_into(kept, entry):
+    """Fill ``kept``'s missing author and date from ``entry`` and add its themes."""
+    if not kept.author and entry.author:
+        kept.author = entry.author
+    if not kept.date and entry.date:
+        kept.date = entry.date
+    known = {theme.lower() for theme in kept.themes}
+    for theme in entry.themes:
+        if theme.lower() not in known:
+            kept.themes.append(theme)
+            known.add(theme.lower())
+
+
+class EntryCollection:
+    """
+    Entries merged across documents.
+
+    Args:
+        aliases: Optional AliasIndex for author transliterations
+        threshold: Minimum similarity to merge two entries
+    """
+
+    def __init__(self, aliases=None, threshold=MATCH_THRESHOLD):
+        self.aliases = aliases
+        self.threshold = threshold
+        # Titles less similar than this cannot reach the threshold whatever the author
+        self._title_floor = max(0.0, 2 * (threshold - 0.25) / 0.75 - 1)
+        self.clusters = []
+        self.comparisons = 0
+        self._blocks = {}
+        self._exact = {}
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def features(self, entry):
+        words = normalize_author(entry.author, self.aliases)
+        return _Features(normalize_title(entry.title, self.aliases), " ".join(words), author_key(words), entry.year)
+
+    def _block_keys(self, features):
+        keys = []
+        if features.key:
+            keys.append(("author", features.key))
+        if features.year is not None:
+            keys.append(("year", features.year // YEAR_BUCKET))
+        if features.title:
+            # Lets spellings of undated, anonymous works meet ("Rig Veda"/"Rigveda")
+            keys.append(("title", features.title.replace(" ", "")[:4]))
+        return keys
+
+    def _candidates(self, features):
+        keys = self._block_keys(features)
+        if features.year is not None:
+            bucket = features.year // YEAR_BUCKET
+            keys += [("year", bucket - 1), ("year", bucket + 1)]
+        seen = set()
+        for key in keys:
+            for index in self._blocks.get(key, ()):
+                if index not in seen:
+                    seen.add(index)
+                    yield index
+
+    def score(self, a, b):
+        """Similarity of two entries' features (0-1)."""
+        self.comparisons += 1
+        title = title_similarity(a.title, b.title, self._title_floor)
+        if a.key and a.key == b.key:
+            score = title
+        else:
+            author = SequenceMatcher(None, a.author, b.author).ratio() if a.author and b.author else 0.0
+            score = 0.75 * title + 0.25 * author
+        if a.year is not None and b.year is not None and abs(a.year - b.year) > YEAR_TOLERANCE:
+            score *= 0.9
+        return score
+
+    def find(self, entry):
+        """The cluster ``entry`` belongs to, or None."""
+        index = self._find(self.features(entry))
+        return self.clusters[index] if index is not None else None
+
+    def _find(self, features):
+        exact = self._exact.get((features.title, features.key))
+        if exact is not None:
+            return exact
+        best, best_score = None, self.threshold
+        for index in self._candidates(features):
+            score = self.score(features, self.clusters[index].features)
+            if score >= best_score:
+                best, best_score = index, score
+        return best
+
+    def _index(self, position, features):
+        if features.title:
+            self._exact.setdefault((features.title, features.key), position)
+        for key in self._block_keys(features):
+            # Dicts as insertion-ordered sets
+            self._blocks.setdefault(key, {})[position] = None
+
+    def add(self, entries, document=""):
+        """
+        Merge ``entries`` into the collection.
+
+        Args:
+            entries: Entry objects (not modified)
+            document: Name recorded as their provenance
+
+        Returns:
+            AddResult: New works, and (entry, merged entry) pairs for the rest
+        """
+        result = AddResult()
+        for entry in entries:
+            features = self.features(entry)
+            provenance = Provenance(document, entry.title, entry.author, entry.date)
+            index = self._find(features)
+            if index is None:
+                kept = replace(entry, themes=list(entry.themes))
+                cluster = Cluster(kept, [provenance], features)
+                self.clusters.append(cluster)
+                self._index(len(self.clusters) - 1, features)
+                result.added.append(kept)
+                continue
+            cluster = self.clusters[index]
+            merge_into(cluster.entry, entry)
+            cluster.provenance.append(provenance)
+            if cluster.features.year is None and cluster.entry.year is not None:
+                cluster.features = self.features(cluster.entry)
+                self._index(index, cluster.features)
+            result.merged.append((entry, cluster.entry))
+        return result
+
+    def entries(self):
+        """Merged entries in the order they were first seen."""
+        return [cluster.entry for cluster in self.clusters]
+
+    @property
+    def duplicates(self):
+        """Citations merged into an existing work."""
+        return sum(len(cluster.provenance) - 1 for cluster in self.clusters)
+
+    def rows(self):
+        """Table rows for display, with the documents each work appeared in."""
+        return [
+            {
+                "Author": cluster.entry.author,
+                "Title": cluster.entry.title,
+                "Date": cluster.entry.date,
+                "Found in": ", ".join(cluster.documents),
+                "Citations": len(cluster.provenance),
+            }
+            for cluster in self.clusters
+        ]
+
+    def clear(self):
+        self.clusters = []
+        self.comparisons = 0
+        self._blocks = {}
+        self._exact = {}
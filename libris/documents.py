@@ -0,0 +1,104 @@
+"""
+Content-addressed caches for uploaded documents.
+
+Uploads are identified by the SHA-256 of their bytes, so a rerun, a
+re-upload or another user sending the same syllabus all map to the same
+key. Extracted text is memoised per hash, and the model's extraction
+report and entries are kept per hash so a document is only ever sent to
+the model once. The entries of each finished chunk are kept too, so a
+cancelled or failed document resumes from the chunks it still needs.
+"""
+
+import hashlib
+import json
+from dataclasses import asdict
+
+from libris.records import Entry
+from libris.response_cache import MemoryBackend, ResponseCache, SqliteBackend, fingerprint
+from libris.settings import env_int, env_str
+
+
+def content_digest(data):
+    """SHA-256 hex digest of an upload's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def text_cache_from_env():
+    """In-memory cache of extracted text keyed by content digest."""
+    backend = MemoryBackend(
+        max_entries=env_int("LIBRIS_TEXT_CACHE_MAX_ENTRIES", 200),
+        max_bytes=env_int("LIBRIS_TEXT_CACHE_MAX_BYTES", 200_000_000),
+    )
+    return ResponseCache(backend, ttl=None)
+
+
+class DocumentStore:
+    """
+    Processing results per document, keyed by content digest.
+
+    Args:
+        cache: ResponseCache holding JSON-encoded results
+        version: Model/prompt fingerprint; results from other versions
+            are treated as missing
+    """
+
+    def __init__(self, cache, version=""):
+        self.cache = cache
+        self.version = version
+
+    @classmethod
+    def from_env(cls, version=""):
+        """Store described by ``LIBRIS_DOCUMENT_STORE`` ("memory" or a SQLite path)."""
+        location = env_str("LIBRIS_DOCUMENT_STORE", "memory")
+        max_entries = env_int("LIBRIS_DOCUMENT_STORE_MAX_ENTRIES", 5000)
+        if location == "memory":
+            backend = MemoryBackend(max_entries=max_entries, max_bytes=200_000_000)
+        else:
+            backend = SqliteBackend(location, table="documents", max_entries=max_entries,
+                                    max_bytes=1_000_000_000)
+        return cls(ResponseCache(backend, ttl=None), version)
+
+    def _key(self, digest):
+        return fingerprint(digest, self.version)
+
+    def get(self, digest):
+        """
+        Return the stored result for a document, or None.
+
+        Returns:
+            dict: ``report`` (markdown), ``entries`` (list of Entry) and
+            ``filename`` of the first upload
+        """
+        raw = self.cache.get(self._key(digest))
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        data["entries"] = [Entry(**entry) for entry in data["entries"]]
+        return data
+
+    def put(self, digest, filename, report, entries):
+        """Remember the processing result for a document."""
+        payload = {
+            "filename": filename,
+            "report": report,
+            "entries": [asdict(entry) for entry in entries],
+        }
+        self.cache.set(self._key(digest), json.dumps(payload, ensure_ascii=False))
+
+    def _chunk_key(self, digest, text):
+        return fingerprint(digest, self.version, "chunk", text)
+
+    def get_chunk(self, digest, text):
+        """Entries extracted from one chunk of a document, or None."""
+        raw = self.cache.get(self._chunk_key(digest, text))
+        if raw is None:
+            return None
+        return [Entry(**entry) for entry in json.loads(raw)]
+
+    def put_chunk(self, digest, text, entries):
+        """Remember the entries extracted from one chunk of a document."""
+        payload = [asdict(entry) for entry in entries]
+        self.cache.set(self._chunk_key(digest, text), json.dumps(payload, ensure_ascii=False))
+
+    def stats(self):
+        return self.cache.stats()
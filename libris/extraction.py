@@ -0,0 +1,178 @@
+"""
+Text extraction for uploaded PDF and Word documents.
+
+Large PDFs are split into page batches that are extracted in a process
+pool; pages are yielded back in order as each batch finishes so the UI can
+show progress. Text is collected in lists and joined once, instead of
+growing a string page by page.
+"""
+
+import io
+import os
+import tempfile
+from dataclasses import dataclass
+
+from libris.metrics import EXTRACTION_SECONDS, PDF_PAGES, REGISTRY, UPLOAD_BYTES
+from libris.settings import env_int
+
+PAGE_MARKER = "\n--- Page {} ---\n"
+
+
+class ExtractionLimitError(ValueError):
+    """Raised when an upload exceeds the configured extraction limits."""
+
+
+@dataclass(frozen=True)
+class ExtractionLimits:
+    """Size limits and parallelism for document extraction."""
+
+    max_bytes: int = 50_000_000
+    max_pages: int = 1000
+    batch_pages: int = 20
+    workers: int = min(4, os.cpu_count() or 1)
+
+    @classmethod
+    def from_env(cls):
+        """Build limits from ``LIBRIS_MAX_*`` / ``LIBRIS_EXTRACTION_*`` settings."""
+        return cls(
+            max_bytes=env_int("LIBRIS_MAX_UPLOAD_BYTES", cls.max_bytes),
+            max_pages=env_int("LIBRIS_MAX_PDF_PAGES", cls.max_pages),
+            batch_pages=max(1, env_int("LIBRIS_PDF_BATCH_PAGES", cls.batch_pages)),
+            workers=env_int("LIBRIS_EXTRACTION_WORKERS", cls.workers),
+        )
+
+    def check_size(self, data):
+        """Raise ExtractionLimitError if ``data`` is larger than allowed."""
+        if len(data) > self.max_bytes:
+            raise ExtractionLimitError(
+                f"File is {len(data) / 1e6:.1f} MB; the limit is {self.max_bytes / 1e6:.0f} MB."
+            )
+
+
+def _extract_page_range(path, start, stop):
+    """Worker: extract pages ``[start, stop)`` of the PDF at ``path``."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [(number, reader.pages[number].extract_text() or "") for number in range(start, stop)]
+
+
+def iter_pdf_pages(data, limits, executor=None):
+    """
+    Yield ``(page_number, text, pages_to_read, total_pages)`` in page order.
+
+    Args:
+        data: PDF bytes
+        limits: ExtractionLimits to enforce
+        executor: Optional ProcessPoolExecutor; without one (or for PDFs
+            that fit in a single batch) pages are extracted in-process
+    """
+    from pypdf import PdfReader
+
+    limits.check_size(data)
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    to_read = min(total, limits.max_pages)
+
+    if executor is None or to_read <= limits.batch_pages:
+        for number in range(to_read):
+            yield number + 1, reader.pages[number].extract_text() or "", to_read, total
+        return
+
+    # Workers re-open the file from disk rather than receiving the bytes
+    # once per batch through pickling
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as handle:
+        handle.write(data)
+        path = handle.name
+    futures = []
+    try:
+        futures = [
+            executor.submit(_extract_page_range, path, start, min(start + limits.batch_pages, to_read))
+            for start in range(0, to_read, limits.batch_pages)
+        ]
+        for future in futures:
+            for number, text in future.result():
+                yield number + 1, text, to_read, total
+    finally:
+        for future in futures:
+            future.cancel()
+        os.unlink(path)
+
+
+def pdf_text(data, limits, executor=None, on_page=None):
+    """
+    Extract the text of a PDF with ``--- Page N ---`` markers.
+
+    Args:
+        data: PDF bytes
+        limits: ExtractionLimits to enforce
+        executor: Optional process pool for large PDFs
+        on_page: Optional callback ``(pages_done, pages_to_read)``
+
+    Returns:
+        tuple: (text, pages read, total pages)
+    """
+    parts = []
+    to_read = total = 0
+    with REGISTRY.timer(EXTRACTION_SECONDS, format="pdf"):
+        for number, text, to_read, total in iter_pdf_pages(data, limits, executor):
+            if text:
+                parts.append(PAGE_MARKER.format(number))
+                parts.append(text)
+            if on_page is not None:
+                on_page(number, to_read)
+    UPLOAD_BYTES.observe(len(data), format="pdf")
+    PDF_PAGES.observe(to_read)
+    return "".join(parts), to_read, total
+
+
+def docx_text(data, limits):
+    """Extract paragraph and table text from a Word document."""
+    from docx import Document
+
+    with REGISTRY.timer(EXTRACTION_SECONDS, format="docx"):
+        limits.check_size(data)
+        doc = Document(io.BytesIO(data))
+
+        parts = [para.text for para in doc.paragraphs if para.text.strip()]
+        for table in doc.tables:
+            for row in table.rows:
+                parts.extend(cell.text for cell in row.cells if cell.text.strip())
+
+    UPLOAD_BYTES.observe(len(data), format="docx")
+    return "\n".join(parts) + "\n" if parts else ""
+
+
+def decode_text(data):
+    """Decode a plain-text upload as UTF-8, falling back to latin-1."""
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def plain_text(data, limits):
+    """Decode a plain-text upload after checking its size."""
+    with REGISTRY.timer(EXTRACTION_SECONDS, format="text"):
+        limits.check_size(data)
+        text = decode_text(data)
+    UPLOAD_BYTES.observe(len(data), format="text")
+    return text
+
+
+def extract_text(filename, data, limits, executor=None):
+    """
+    Extract the text of an upload by file extension.
+
+    Raises:
+        ExtractionLimitError: The upload exceeds ``limits``
+        ValueError: The file type is not supported
+    """
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        return pdf_text(data, limits, executor)[0]
+    if name.endswith(".docx"):
+        return docx_text(data, limits)
+    if name.endswith((".txt", ".md", ".csv")):
+        return plain_text(data, limits)
+    raise ValueError(f"Unsupported file type: {filename}")
@@ -0,0 +1,234 @@
+"""
+Token-budgeted conversation history.
+
+A processed document kept verbatim would be re-sent with every later
+request until the context window overflowed. ``compact_history`` keeps
+the most recent turns as they are, shrinks older document uploads to a
+short placeholder (the assistant's extraction report that follows it
+already summarises the entries), and drops the oldest turns until the
+request fits the configured input-token budget. ``build_request``
+assembles the next turn's request around it.
+"""
+
+import re
+from dataclasses import dataclass, replace
+
+from libris.prompt_cache import cached_system, with_cache_breakpoints
+from libris.settings import env_int, env_str
+
+# Rough characters-per-token ratio for English prose and markdown tables
+CHARS_PER_TOKEN = 4
+
+# Fixed per-message overhead (role markers, block framing)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TRUNCATION_NOTE = "\n\n[... truncated to fit the request budget ...]"
+
+_TABLE_ROW = re.compile(r"^\s*\|(.+)\|\s*$")
+_TABLE_RULE = re.compile(r"^\s*\|[\s:|-]+\|\s*$")
+
+
+@dataclass(frozen=True)
+class HistoryBudget:
+    """Limits applied to the history sent with each request."""
+
+    max_input_tokens: int = 60000
+    keep_turns: int = 6
+    counter: str = "estimate"
+
+    @classmethod
+    def from_env(cls):
+        """Build a budget from ``LIBRIS_HISTORY_*`` environment variables."""
+        return cls(
+            max_input_tokens=env_int("LIBRIS_HISTORY_TOKEN_BUDGET", cls.max_input_tokens),
+            keep_turns=max(1, env_int("LIBRIS_HISTORY_KEEP_TURNS", cls.keep_turns)),
+            counter=env_str("LIBRIS_TOKEN_COUNTER", cls.counter),
+        )
+
+
+def _text_of(content):
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def estimate_tokens(content):
+    """Cheap local token estimate for a string or list of content blocks."""
+    return len(_text_of(content)) // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message):
+    """Estimated tokens for one ``{"role", "content"}`` message."""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_tokens(messages):
+    """Estimated tokens for a list of messages."""
+    return sum(message_tokens(message) for message in messages)
+
+
+def count_tokens_api(client, request):
+    """
+    Count a request's input tokens with the API's token-counting endpoint.
+
+    Args:
+        client: anthropic.Anthropic client
+        request: Keyword arguments destined for ``messages.create``
+
+    Returns:
+        int: Exact input-token count for the request
+    """
+    result = client.messages.count_tokens(
+        model=request["model"],
+        system=request["system"],
+        messages=request["messages"],
+    )
+    return result.input_tokens
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut ``text`` so it fits in roughly ``max_tokens`` tokens."""
+    limit = max(0, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:max(0, limit - len(TRUNCATION_NOTE))] + TRUNCATION_NOTE
+
+
+def count_table_rows(text):
+    """Number of data rows in the markdown tables of ``text``."""
+    rows = [line for line in text.splitlines() if _TABLE_ROW.match(line)]
+    rules = [line for line in rows if _TABLE_RULE.match(line)]
+    # Each table contributes a header row and a separator row
+    return max(0, len(rows) - 2 * len(rules))
+
+
+def document_placeholder(message, reply=None):
+    """Compact stand-in for an old document upload."""
+    name = message.get("document", "document")
+    size = len(_text_of(message["content"]))
+    summary = f"[Earlier upload: '{name}' ({size:,} characters). Full text omitted"
+    if reply is not None:
+        entries = count_table_rows(_text_of(reply["content"]))
+        if entries:
+            summary += f"; the {entries} extracted entries are listed in your reply below"
+        else:
+            summary += "; see your processing report below"
+    return summary + ".]"
+
+
+def _split_turns(messages):
+    """Group messages into turns, each starting with a user message."""
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _compact_turn(turn):
+    """Replace a document payload in an old turn with its placeholder."""
+    compacted = []
+    for idx, message in enumerate(turn):
+        if message.get("document"):
+            reply = turn[idx + 1] if idx + 1 < len(turn) else None
+            compacted.append({"role": message["role"], "content": document_placeholder(message, reply)})
+        else:
+            compacted.append({"role": message["role"], "content": message["content"]})
+    return compacted
+
+
+def compact_history(messages, budget, reserved_tokens=0):
+    """
+    Return the history to send with the next request.
+
+    Turns are only compacted in blocks of ``budget.keep_turns`` so the
+    compacted prefix stays identical for several turns in a row and keeps
+    hitting the prompt cache.
+
+    Args:
+        messages: Stored conversation (dicts with ``role``, ``content`` and
+            optionally ``document``)
+        budget: HistoryBudget to enforce
+        reserved_tokens: Tokens already committed to the system prompt and
+            the new user message
+
+    Returns:
+        list: ``{"role", "content"}`` dicts that fit the budget
+    """
+    turns = _split_turns(messages)
+    keep = budget.keep_turns
+    cutoff = max(0, (len(turns) - keep) // keep * keep)
+
+    older = [_compact_turn(turn) for turn in turns[:cutoff]]
+    recent = [[{"role": m["role"], "content": m["content"], "document": m.get("document")} for m in turn]
+              for turn in turns[cutoff:]]
+
+    available = budget.max_input_tokens - reserved_tokens
+
+    def total():
+        return sum(history_tokens(turn) for turn in older + recent)
+
+    # Oldest compacted turns go first
+    while older and total() > available:
+        older.pop(0)
+
+    # Then whole documents in the verbatim turns, then the oldest turns
+    if total() > available:
+        for turn in recent:
+            for idx, message in enumerate(turn):
+                if message.get("document"):
+                    reply = turn[idx + 1] if idx + 1 < len(turn) else None
+                    message["content"] = document_placeholder(message, reply)
+    while len(recent) > 1 and total() > available:
+        recent.pop(0)
+
+    history = []
+    for turn in older + recent:
+        history.extend({"role": m["role"], "content": m["content"]} for m in turn)
+
+    overflow = history_tokens(history) - available
+    if overflow > 0 and history:
+        # Last resort: trim the oldest remaining message
+        first = history[0]
+        first["content"] = truncate_to_tokens(
+            _text_of(first["content"]), estimate_tokens(first["content"]) - overflow
+        )
+    return history
+
+
+def assemble_request(messages, user_message, route, budget, system_prompt):
+    """
+    messages.create arguments for ``route`` that send ``user_message``
+    after as much of the stored conversation ``messages`` as fits
+    ``budget``, with the stable prefix marked for prompt caching.
+    """
+    system_tokens = estimate_tokens(system_prompt)
+    user_message = truncate_to_tokens(user_message, budget.max_input_tokens - system_tokens)
+    history = compact_history(
+        messages,
+        budget,
+        reserved_tokens=system_tokens + estimate_tokens(user_message),
+    )
+    return {
+        "model": route.model,
+        "max_tokens": route.max_tokens,
+        "system": cached_system(system_prompt),
+        "messages": with_cache_breakpoints(history + [{"role": "user", "content": user_message}]),
+    }
+
+
+def build_request(client, messages, user_message, route, budget, system_prompt):
+    """
+    Like ``assemble_request``; with the "api" counter the request is
+    counted by the API and, if the local estimate was too low, rebuilt
+    once under a proportionally tighter budget.
+    """
+    request = assemble_request(messages, user_message, route, budget, system_prompt)
+    if budget.counter == "api":
+        # The local estimate can be off for non-English text; verify and tighten once
+        counted = count_tokens_api(client, request)
+        if counted > budget.max_input_tokens:
+            tighter = replace(budget, max_input_tokens=budget.max_input_tokens ** 2 // counted)
+            request = assemble_request(messages, user_message, route, tighter, system_prompt)
+    return request
@@ -0,0 +1,528 @@
+"""
+Background processing queue for bulk document uploads.
+
+Each uploaded file becomes a job that runs text extraction and the
+chunked model calls on a shared thread pool, so a folder of syllabi is
+processed concurrently without blocking the UI, and a rerun of the
+script never loses or repeats work in flight. Jobs only touch their own
+``Job`` object; the app reads the queue on each rerun to show progress
+and to move finished results into the session. A job can be cancelled:
+chunks not yet sent are skipped, and the entries of every finished chunk
+are kept in the document store, so processing the file again only sends
+the chunks still missing. Rate-limited and transient failures are
+retried with jittered exponential backoff, and large batches can instead
+go through the Message Batches API. A submitted batch is polled from a
+timer thread rather than a worker, so hours of batch processing leave
+the shared pool free for other sessions' jobs. Batched chunks whose
+replies fail validation are re-run on the extraction route's fallback
+model.
+"""
+
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, replace
+
+from libris.extraction import extract_text
+from libris.metrics import record_usage
+from libris.processing import (
+    ChunkResult,
+    DocumentResult,
+    chunk_result,
+    extract_chunk,
+    extract_chunks,
+    extract_halves,
+    extraction_request,
+    plan_document,
+)
+from libris.prompt_cache import add_usage, usage_from_response
+from libris.ratelimit import backoff_delay, is_retryable, retry_after
+from libris.routing import record_call, record_fallback
+from libris.settings import env_bool, env_float, env_int
+from libris.structured import Truncated, ValidationError
+
+QUEUED = "queued"
+EXTRACTING = "extracting"
+PROCESSING = "processing"
+WAITING = "waiting"
+BATCHED = "batched"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+STATUS_ICONS = {
+    QUEUED: "⏳",
+    EXTRACTING: "📖",
+    PROCESSING: "🔄",
+    WAITING: "⏸️",
+    BATCHED: "📦",
+    DONE: "✅",
+    FAILED: "❌",
+    CANCELLED: "⏹️",
+}
+
+
+@dataclass(frozen=True)
+class QueueConfig:
+    """Concurrency, retry and batch settings for the job queue."""
+
+    workers: int = 4
+    max_retries: int = 3
+    backoff_base: float = 2.0
+    backoff_cap: float = 60.0
+    use_batches: bool = False
+    batch_poll_seconds: float = 10.0
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from ``LIBRIS_JOB_*`` / ``LIBRIS_BATCH_*`` settings."""
+        return cls(
+            workers=max(1, env_int("LIBRIS_JOB_WORKERS", cls.workers)),
+            max_retries=env_int("LIBRIS_JOB_MAX_RETRIES", cls.max_retries),
+            backoff_base=env_float("LIBRIS_JOB_BACKOFF_BASE", cls.backoff_base),
+            backoff_cap=env_float("LIBRIS_JOB_BACKOFF_CAP", cls.backoff_cap),
+            use_batches=env_bool("LIBRIS_USE_BATCHES", cls.use_batches),
+            batch_poll_seconds=env_float("LIBRIS_BATCH_POLL_SECONDS", cls.batch_poll_seconds),
+        )
+
+
+@dataclass
+class Job:
+    """One uploaded file moving through the queue."""
+
+    filename: str
+    file_type: str
+    digest: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = QUEUED
+    progress: float = 0.0
+    detail: str = ""
+    entries: list = field(default_factory=list)
+    report: str = ""
+    text: str = ""
+    usage: list = field(default_factory=list)
+    error: Exception = None
+    cached: bool = False
+    sections: int = 0
+    sections_done: int = 0
+    # Add the report to the conversation when the job is collected
+    in_chat: bool = False
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: float = None
+    collected: bool = False
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancel_requested(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def icon(self):
+        return STATUS_ICONS.get(self.status, "")
+
+
+@dataclass
+class _BatchRun:
+    """A submitted message batch and the jobs waiting on it."""
+
+    batch_id: str
+    client: object
+    requests: int
+    # job id -> (job, local result, kept chunk results, batched chunks)
+    plans: dict
+    cancelling: bool = False
+
+
+class JobQueue:
+    """
+    A session's document jobs, run on a process-wide thread pool.
+
+    Args:
+        executor: ThreadPoolExecutor shared by every session
+        store: DocumentStore consulted before and updated after each job
+        route: Extraction Route (see ``libris.routing``)
+        chunking: ChunkingConfig
+        limits: ExtractionLimits
+        config: QueueConfig
+        extraction_executor: Optional process pool for PDF pages
+    """
+
+    def __init__(self, executor, store, route, chunking, limits, config, extraction_executor=None):
+        self.executor = executor
+        self.store = store
+        self.route = route
+        self.chunking = chunking
+        self.limits = limits
+        self.config = config
+        self.extraction_executor = extraction_executor
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _new_job(self, filename, file_type, digest):
+        with self._lock:
+            for key, job in list(self._jobs.items()):
+                if job.digest != digest:
+                    continue
+                if not job.finished or job.status == DONE and not job.collected:
+                    return job, False
+                # Replaced by the new job, which answers from the store or
+                # resumes from the kept chunks
+                del self._jobs[key]
+            job = Job(filename, file_type, digest)
+            self._jobs[job.id] = job
+            return job, True
+
+    def submit(self, client, filename, file_type, data, digest, text=None, in_chat=False):
+        """
+        Queue one file; a file already queued, running or waiting to be
+        collected in this session is not added twice, one that failed or
+        was cancelled resumes, and one already collected is queued again
+        and answered from the document store.
+
+        Args:
+            text: Text already extracted from ``data``, if any
+            in_chat: Add the report to the conversation when collected
+        """
+        job, new = self._new_job(filename, file_type, digest)
+        if new:
+            job.in_chat = in_chat
+            job.text = text or ""
+            self.executor.submit(self._run, job, client, data)
+        return job
+
+    def submit_batch(self, client, files):
+        """
+        Queue files for processing through the Message Batches API.
+
+        Args:
+            client: anthropic.Anthropic client
+            files: (filename, file_type, data, digest) tuples
+        """
+        pending = []
+        for filename, file_type, data, digest in files:
+            job, new = self._new_job(filename, file_type, digest)
+            if new:
+                pending.append((job, data))
+        if pending:
+            self.executor.submit(self._run_batch, pending, client)
+        return [job for job, _ in pending]
+
+    def jobs(self):
+        """All jobs in submission order."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.submitted_at)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self):
+        """True while any job is still running."""
+        return any(not job.finished for job in self.jobs())
+
+    def cancel(self, job_id):
+        """
+        Ask a job to stop. Chunks already sent finish and are kept; the
+        job ends as cancelled once they have, or at the next poll if it
+        is waiting on a message batch.
+
+        Returns:
+            bool: False if the job is unknown or already finished
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        job.detail = "cancelling"
+        return True
+
+    def collect_finished(self):
+        """Finished jobs not yet handed to the session; marks them collected."""
+        collected = []
+        with self._lock:
+            for job in self._jobs.values():
+                if job.finished and not job.collected:
+                    job.collected = True
+                    collected.append(job)
+        return sorted(collected, key=lambda job: job.submitted_at)
+
+    def clear_finished(self):
+        """Forget collected jobs."""
+        with self._lock:
+            self._jobs = {key: job for key, job in self._jobs.items() if not job.collected}
+
+    # Workers -----------------------------------------------------------
+
+    def _from_store(self, job, data):
+        stored = self.store.get(job.digest)
+        if stored is None:
+            return False
+        # The text is still read (without a model call) so its passages can be searched
+        job.text = self._extract(job, data)
+        job.entries = stored["entries"]
+        job.report = stored["report"]
+        job.cached = True
+        self._finish(job, DONE)
+        return True
+
+    def _extract(self, job, data):
+        if job.text:
+            return job.text
+        job.status = EXTRACTING
+        return extract_text(job.filename, data, self.limits, self.extraction_executor)
+
+    def _stored_chunks(self, job, chunks):
+        """Split chunks into results kept from an earlier run and chunks still to send."""
+        kept, missing = [], []
+        for chunk in chunks:
+            entries = self.store.get_chunk(job.digest, chunk.text)
+            if entries is None:
+                missing.append(chunk)
+            else:
+                kept.append(ChunkResult(chunk, entries))
+        return kept, missing
+
+    def _keep(self, job, result):
+        """Store a finished chunk's entries so it is never sent again."""
+        if result.error is None:
+            self.store.put_chunk(job.digest, result.chunk.text, result.entries)
+            job.sections_done += 1
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.progress = 1.0
+        job.detail = ""
+        job.finished_at = time.time()
+
+    def _complete(self, job, result):
+        """Record a DocumentResult on its job."""
+        job.usage = [chunk.usage for chunk in result.results if chunk.usage]
+        if job.cancel_requested and result.failed:
+            # Finished chunks are in the store; submitting the file again resumes
+            self._finish(job, CANCELLED)
+            return
+        if result.all_failed:
+            self._finish(job, FAILED, result.failed[0].error)
+            return
+        job.entries = result.entries
+        job.report = result.report()
+        if not result.failed:
+            self.store.put(job.digest, job.filename, job.report, job.entries)
+        self._finish(job, DONE)
+
+    def _run(self, job, client, data):
+        try:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+                return
+            if self._from_store(job, data):
+                return
+            text = job.text = self._extract(job, data)
+            local, chunks = plan_document(job.filename, text, self.chunking)
+            kept, missing = self._stored_chunks(job, chunks)
+            job.sections = len(chunks)
+            job.sections_done = len(kept)
+            job.status = PROCESSING
+
+            def on_result(result, done, total):
+                self._keep(job, result)
+                job.progress = job.sections_done / job.sections
+
+            results = self._extract_chunks(client, job, missing, on_result)
+            results = sorted(kept + results, key=lambda item: item.chunk.index)
+            result = self._retry(job, client, DocumentResult(job.filename, local, results))
+            self._complete(job, result)
+        except Exception as e:
+            self._finish(job, FAILED, e)
+
+    def _extract_chunks(self, client, job, chunks, on_result=None):
+        return extract_chunks(client, chunks, job.filename, self.route, self.chunking, on_result, job.cancel_event)
+
+    def _retry(self, job, client, result):
+        """Re-run chunks that failed with retryable errors, backing off between rounds."""
+        for attempt in range(self.config.max_retries):
+            retryable = [item for item in result.failed if is_retryable(item.error)]
+            if not retryable or job.cancel_requested:
+                break
+            hint = max((retry_after(item.error) or 0.0) for item in retryable)
+            delay = backoff_delay(attempt, self.config.backoff_base, self.config.backoff_cap, hint)
+            job.status = WAITING
+            job.detail = f"retry {attempt + 1} of {self.config.max_retries} in {delay:.0f}s"
+            if job.cancel_event.wait(delay):
+                break
+            job.status = PROCESSING
+            job.detail = ""
+
+            def on_result(item, done, total):
+                self._keep(job, item)
+                job.progress = job.sections_done / job.sections
+
+            retried = self._extract_chunks(client, job, [item.chunk for item in retryable], on_result)
+            by_index = {item.chunk.index: item for item in retried}
+            result.results = [by_index.get(item.chunk.index, item) for item in result.results]
+        return result
+
+    def _run_batch(self, pending, client):
+        plans = {}
+        for job, data in pending:
+            try:
+                if job.cancel_requested:
+                    self._finish(job, CANCELLED)
+                    continue
+                if self._from_store(job, data):
+                    continue
+                text = job.text = self._extract(job, data)
+                local, chunks = plan_document(job.filename, text, self.chunking)
+                kept, missing = self._stored_chunks(job, chunks)
+                job.sections = len(chunks)
+                job.sections_done = len(kept)
+                plans[job.id] = (job, local, kept, missing)
+                job.status = BATCHED
+            except Exception as e:
+                self._finish(job, FAILED, e)
+
+        requests = [
+            {
+                "custom_id": f"{job.id}-{chunk.index}",
+                "params": extraction_request(
+                    chunk, job.filename, self.route.model, self.route.max_tokens, self.chunking.structured
+                ),
+            }
+            for job, _, _, chunks in plans.values()
+            for chunk in chunks
+        ]
+        if not requests:
+            for job, local, kept, _ in plans.values():
+                self._complete(job, DocumentResult(job.filename, local, kept))
+            return
+        try:
+            batch = self._create_batch(client, requests)
+        except Exception as e:
+            for job, _, _, _ in plans.values():
+                self._finish(job, FAILED, e)
+            return
+        for job, _, _, _ in plans.values():
+            job.detail = f"batch {batch.id}"
+        self._wait_for_batch(_BatchRun(batch.id, client, len(requests), plans))
+
+    def _create_batch(self, client, requests):
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                return client.messages.batches.create(requests=requests)
+            except Exception as e:
+                if attempt == self.config.max_retries or not is_retryable(e):
+                    raise
+                time.sleep(backoff_delay(attempt, self.config.backoff_base, self.config.backoff_cap, retry_after(e)))
+
+    def _wait_for_batch(self, run):
+        """Poll a batch from a timer thread, so it holds no worker while the API processes it."""
+        timer = threading.Timer(self.config.batch_poll_seconds, self._poll_batch, args=(run,))
+        timer.daemon = True
+        timer.start()
+
+    def _poll_batch(self, run):
+        jobs = [plan[0] for plan in run.plans.values()]
+        for job in jobs:
+            if job.cancel_requested and not job.finished:
+                # Its answered requests are still kept when the batch ends
+                self._finish(job, CANCELLED)
+        try:
+            if not run.cancelling and all(job.cancel_requested for job in jobs):
+                # Requests already answered are still returned, and kept
+                run.client.messages.batches.cancel(run.batch_id)
+                run.cancelling = True
+            batch = run.client.messages.batches.retrieve(run.batch_id)
+        except Exception as e:
+            if is_retryable(e):
+                self._wait_for_batch(run)
+                return
+            for job in jobs:
+                if not job.finished:
+                    self._finish(job, FAILED, e)
+            return
+        counts = getattr(batch, "request_counts", None)
+        if counts is not None:
+            for job in jobs:
+                if not job.finished:
+                    job.progress = (run.requests - counts.processing) / run.requests
+        if batch.processing_status == "ended":
+            # Escalating cut-off or invalid replies makes model calls, so it runs on a worker
+            self.executor.submit(self._finish_batch, run)
+        else:
+            self._wait_for_batch(run)
+
+    def _finish_batch(self, run):
+        try:
+            results = self._batch_results(run.client, run.batch_id)
+        except Exception as e:
+            for job, _, _, _ in run.plans.values():
+                if not job.finished:
+                    self._finish(job, FAILED, e)
+            return
+
+        client = run.client
+        for job, local, kept, chunks in run.plans.values():
+            absent = RuntimeError("No result returned by the batch")
+            chunk_results = [
+                results.get(f"{job.id}-{chunk.index}", (None, absent)) for chunk in chunks
+            ]
+            answered = [
+                chunk_result(chunk, response, self.route.model) if response is not None
+                else ChunkResult(chunk, error=error)
+                for chunk, (response, error) in zip(chunks, chunk_results)
+            ]
+            if job.cancel_requested:
+                # Keep what was answered; submitting the file again resumes from it
+                for item in answered:
+                    self._keep(job, item)
+                if not job.finished:
+                    self._finish(job, CANCELLED)
+                continue
+            answered = [self._escalate(client, job, item) for item in answered]
+            for item in answered:
+                self._keep(job, item)
+            ordered = sorted(kept + answered, key=lambda item: item.chunk.index)
+            self._complete(job, DocumentResult(job.filename, local, ordered))
+
+    def _escalate(self, client, job, result):
+        """
+        Re-run a batched chunk whose reply was cut off in halves, or one
+        whose reply failed validation on the fallback model.
+        """
+        if not isinstance(result.error, ValidationError) or job.cancel_requested:
+            return result
+        if isinstance(result.error, Truncated):
+            halves = extract_halves(
+                client, result.chunk, job.filename, self.route, self.chunking.structured, job.cancel_event
+            )
+            if halves is None:
+                return result
+            halves.usage = add_usage(add_usage({}, result.usage), halves.usage)
+            return halves
+        if len(self.route.models) < 2:
+            return result
+        fallback = replace(self.route, model=self.route.fallback, fallback="")
+        record_fallback(self.route.task, self.route.model, fallback.model)
+        retried = extract_chunk(
+            client, result.chunk, job.filename, fallback, self.chunking.structured, job.cancel_event
+        )
+        retried.usage = add_usage(add_usage({}, result.usage), retried.usage)
+        return retried
+
+    def _batch_results(self, client, batch_id):
+        """Map the custom_id of each request in an ended batch to (response, error)."""
+        results = {}
+        for item in client.messages.batches.results(batch_id):
+            if item.result.type == "succeeded":
+                results[item.custom_id] = (item.result.message, None)
+                usage = usage_from_response(item.result.message)
+                record_usage("batch", usage)
+                record_call(self.route.task, self.route.model, None, usage, batch=True)
+            else:
+                results[item.custom_id] = (None, RuntimeError(f"Batch request {item.result.type}"))
+        return results
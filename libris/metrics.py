@@ -0,0 +1,316 @@
+"""
+Lightweight instrumentation for the hot paths.
+
+Extraction, model calls and the rate limiter record timings, sizes, token
+usage and error classes into process-wide histograms and counters. They
+are exposed in the Prometheus text format, optionally over HTTP on
+``LIBRIS_METRICS_PORT`` (bound to ``LIBRIS_METRICS_HOST``, loopback by
+default), and summarised in the admin panel. Histogram observations can
+be sampled with ``LIBRIS_METRICS_SAMPLE_RATE`` to keep overhead
+negligible; counters are always exact.
+"""
+
+import bisect
+import functools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from libris.settings import env_float
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+PAGES = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+TOKENS = (100, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, lock):
+        self.name = name
+        self.help = help
+        self._lock = lock
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_labels(key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Bucketed observations per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, lock, registry):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._lock = lock
+        self._registry = registry
+        self._series = {}
+
+    def observe(self, value, **labels):
+        """Record ``value``, subject to the registry's sample rate."""
+        if self._registry.sampled():
+            self._record(value, labels)
+
+    def _record(self, value, labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+    def quantile(self, counts, count, q):
+        """Estimate a quantile by interpolating within its bucket."""
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.samples().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(key, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Collection of metrics.
+
+    Args:
+        sample_rate: Share of histogram observations to keep (0-1)
+    """
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def counter(self, name, help):
+        """Get or create a counter."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Counter(name, help, threading.Lock())
+            return metric
+
+    def histogram(self, name, help, buckets=SECONDS):
+        """Get or create a histogram."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Histogram(name, help, buckets, threading.Lock(), self)
+            return metric
+
+    @contextmanager
+    def timer(self, histogram, **labels):
+        """
+        Time the block into ``histogram``.
+
+        Exceptions are counted in ``libris_errors_total`` by class and
+        re-raised; only successful blocks are timed.
+        """
+        sampled = self.sampled()
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            ERRORS.inc(operation=histogram.name, error=type(e).__name__)
+            raise
+        if sampled:
+            histogram._record(time.perf_counter() - start, labels)
+
+    def timed(self, histogram, **labels):
+        """Decorator form of ``timer``."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(histogram, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Rows for the admin panel: one per histogram series with count,
+        mean and estimated p50/p95/p99, and one per counter series.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        rows = []
+        for metric in metrics:
+            for key, value in sorted(metric.samples().items()):
+                labels = ", ".join(f"{name}={label}" for name, label in key)
+                if metric.kind == "counter":
+                    rows.append({"metric": metric.name, "labels": labels, "count": value})
+                    continue
+                counts, total, count = value
+                rows.append({
+                    "metric": metric.name,
+                    "labels": labels,
+                    "count": count,
+                    "mean": total / count if count else 0.0,
+                    "p50": metric.quantile(counts, count, 0.50),
+                    "p95": metric.quantile(counts, count, 0.95),
+                    "p99": metric.quantile(counts, count, 0.99),
+                })
+        return rows
+
+
+REGISTRY = Registry(sample_rate=env_float("LIBRIS_METRICS_SAMPLE_RATE", 1.0))
+
+UPLOAD_SECONDS = REGISTRY.histogram(
+    "libris_upload_seconds", "Time to read an upload in the app, including progress display"
+)
+EXTRACTION_SECONDS = REGISTRY.histogram(
+    "libris_extraction_seconds", "Time to extract text from an upload, by format"
+)
+UPLOAD_BYTES = REGISTRY.histogram("libris_upload_bytes", "Size of uploaded files, by format", BYTES)
+PDF_PAGES = REGISTRY.histogram("libris_pdf_pages", "Pages extracted per PDF", PAGES)
+API_SECONDS = REGISTRY.histogram("libris_api_seconds", "Model call latency, by call type")
+FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "libris_time_to_first_token_seconds", "Time until the first streamed text arrives"
+)
+INPUT_TOKENS = REGISTRY.histogram(
+    "libris_input_tokens", "Input tokens per call, including cached tokens", TOKENS
+)
+OUTPUT_TOKENS = REGISTRY.histogram("libris_output_tokens", "Output tokens per call", TOKENS)
+TOKENS_TOTAL = REGISTRY.counter("libris_tokens_total", "Tokens used, by call type and kind")
+API_CALLS = REGISTRY.counter("libris_api_calls_total", "Model calls, by call type and outcome")
+ERRORS = REGISTRY.counter("libris_errors_total", "Errors, by operation and exception class")
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "libris_rate_limit_wait_seconds", "Time requests spent queued behind the rate limiter"
+)
+TASK_SECONDS = REGISTRY.histogram("libris_task_seconds", "Model call latency, by task and model")
+TASK_CALLS = REGISTRY.counter("libris_task_calls_total", "Model calls, by task and model")
+TASK_COST = REGISTRY.counter("libris_cost_dollars_total", "Estimated spend in US dollars, by task and model")
+FALLBACKS = REGISTRY.counter(
+    "libris_model_fallbacks_total", "Replies that failed validation and were retried on the fallback model"
+)
+
+
+def record_usage(call, usage):
+    """Record one call's usage dict (see ``libris.prompt_cache.usage_from_response``)."""
+    prompt = (
+        usage.get("input_tokens", 0)
+        + usage.get("cache_read_input_tokens", 0)
+        + usage.get("cache_creation_input_tokens", 0)
+    )
+    INPUT_TOKENS.observe(prompt, call=call)
+    OUTPUT_TOKENS.observe(usage.get("output_tokens", 0), call=call)
+    for kind, value in usage.items():
+        if value:
+            TOKENS_TOTAL.inc(value, call=call, kind=kind)
+
+
+@contextmanager
+def api_call(call):
+    """Time a model call and count its outcome by exception class."""
+    try:
+        with REGISTRY.timer(API_SECONDS, call=call):
+            yield
+    except Exception as e:
+        API_CALLS.inc(call=call, outcome=type(e).__name__)
+        raise
+    API_CALLS.inc(call=call, outcome="ok")
+
+
+def serve(port, registry=REGISTRY, host="127.0.0.1"):
+    """
+    Serve ``/metrics`` from a daemon thread; returns the server.
+
+    The endpoint has no authentication, so it listens on the loopback
+    interface unless ``host`` says otherwise.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="libris-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,185 @@
+"""
+Rule-based parsers for structured reading lists.
+
+Plain-text lists written as ``Title - Author - Date`` lines with
+``Themes:`` lines under them, and CSV files with recognisable headers,
+don't need a model to read them. Each parsed entry carries a confidence
+score; entries at or above the threshold go straight into structured
+records and only the ambiguous lines are left for the model, in one
+batch.
+"""
+
+import csv
+import io
+import re
+from dataclasses import dataclass, field
+
+from libris.catalog import format_year
+from libris.records import USER_DOC_SOURCE, Entry, column_for, parse_year, split_themes
+from libris.settings import env_float
+
+MIN_CONFIDENCE = env_float("LIBRIS_PARSER_MIN_CONFIDENCE", 0.8)
+# Below this share of resolved lines the document is not treated as a list
+MIN_COVERAGE = 0.5
+
+STRUCTURED_EXTENSIONS = (".txt", ".md", ".csv")
+
+_SEPARATOR = re.compile(r"\s+[-–—]\s+")
+# Theme labels under a citation; "Note:" lines are commentary and are parsed like any other line
+_THEMES = re.compile(r"^(themes?|topics?|keywords?)\s*:\s*(.*)$", re.IGNORECASE)
+_HEADING = re.compile(r"^#{1,6}\s")
+_DATE = re.compile(
+    r"^(c\.\s*|ca\.\s*|circa\s+)?\d{1,4}(\s*(BCE|BC|B\.C\.|CE|AD|A\.D\.))?(\s*[-–/]\s*\d{1,4})?$",
+    re.IGNORECASE,
+)
+_BY = re.compile(r"^(.+?),?\s+by\s+(.+?)(?:\s*\((.+)\))?$", re.IGNORECASE)
+_LIST_MARK = re.compile(r"^(\s*([-*•]|\d+[.)])\s+)")
+# Lines worth asking the model about: they name a year or look like a citation
+_CITATION_HINT = re.compile(r"\d{3,4}|\s[-–—]\s|\sby\s|,.*[.:]", re.IGNORECASE)
+
+
+@dataclass
+class ParsedEntry:
+    """An entry read by the rules, with how sure the rules are about it."""
+
+    entry: Entry
+    confidence: float
+    line: str
+
+
+@dataclass
+class ParseResult:
+    """Outcome of rule-based parsing of one document."""
+
+    parsed: list = field(default_factory=list)
+    ambiguous: list = field(default_factory=list)
+    fmt: str = "text"
+
+    def entries(self, min_confidence=MIN_CONFIDENCE):
+        """Entries confident enough to use without the model."""
+        return [item.entry for item in self.parsed if item.confidence >= min_confidence]
+
+    def unresolved(self, min_confidence=MIN_CONFIDENCE):
+        """Lines the model still needs to read."""
+        return self.ambiguous + [item.line for item in self.parsed if item.confidence < min_confidence]
+
+    @property
+    def confidence(self):
+        """Share of candidate lines the rules resolved confidently."""
+        total = len(self.parsed) + len(self.ambiguous)
+        if not total:
+            return 0.0
+        return len(self.entries()) / total
+
+    @property
+    def structured(self):
+        """True if the rules read enough of the document to be trusted."""
+        return bool(self.entries()) and self.confidence >= MIN_COVERAGE
+
+
+def _parse_line(line):
+    """Parse one citation line into (Entry, confidence), or None."""
+    parts = _SEPARATOR.split(line)
+    if len(parts) >= 3 and _DATE.match(parts[-1]):
+        title = " - ".join(parts[:-2])
+        return Entry(author=parts[-2], title=title, date=parts[-1], source=USER_DOC_SOURCE), 1.0
+    if len(parts) >= 3 and parse_year(parts[-1]) is not None:
+        # A date with extra words ("1651, revised 1668")
+        title = " - ".join(parts[:-2])
+        return Entry(author=parts[-2], title=title, date=parts[-1], source=USER_DOC_SOURCE), 0.7
+    if len(parts) == 2:
+        # "Title - Author": the order is a guess
+        return Entry(author=parts[1], title=parts[0], source=USER_DOC_SOURCE), 0.5
+
+    match = _BY.match(line)
+    if match:
+        title, author, date = match.groups()
+        date = date or ""
+        confidence = 0.9 if _DATE.match(date) else 0.6
+        return Entry(author=author, title=title.strip("\"'“”*_"), date=date, source=USER_DOC_SOURCE), confidence
+    return None
+
+
+def parse_text(text):
+    """
+    Parse a ``Title - Author - Date`` reading list.
+
+    ``Themes:`` lines attach to the entry above them; ``#`` headings and
+    blank lines are skipped. Other lines that look like citations are
+    returned as ambiguous.
+    """
+    result = ParseResult(fmt="text")
+    last = None
+    for raw in text.splitlines():
+        line = _LIST_MARK.sub("", raw).strip()
+        if not line or _HEADING.match(line):
+            continue
+        themes = _THEMES.match(line)
+        if themes:
+            if last is not None:
+                last.entry.themes.extend(split_themes(themes.group(2)))
+            continue
+        parsed = _parse_line(line)
+        if parsed is not None:
+            last = ParsedEntry(parsed[0], parsed[1], line)
+            result.parsed.append(last)
+        else:
+            last = None
+            if _CITATION_HINT.search(line):
+                result.ambiguous.append(line)
+    return result
+
+
+def parse_csv(text):
+    """
+    Parse a CSV reading list whose headers name the columns.
+
+    Rows with a title, author and date are certain; rows missing the
+    author or date are kept at lower confidence.
+    """
+    result = ParseResult(fmt="csv")
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader, None)
+    if not header:
+        return result
+    # A display "date" column wins over a numeric "year" column
+    columns = ["year" if cell.strip().lower() == "year" else column_for(cell) for cell in header]
+    if "title" not in columns:
+        # Not a recognisable table; treat each row as a line of text
+        result.ambiguous = [", ".join(row) for row in [header, *reader] if any(row)]
+        return result
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        values = {}
+        for name, cell in zip(columns, row):
+            if name and cell.strip() and name not in values:
+                values[name] = cell.strip()
+        if "date" not in values and re.fullmatch(r"-?\d{1,4}", values.get("year", "")):
+            values["date"] = format_year(int(values["year"]))
+        line = ", ".join(row)
+        if not values.get("title"):
+            result.ambiguous.append(line)
+            continue
+        entry = Entry(
+            author=values.get("author", ""),
+            title=values["title"],
+            date=values.get("date", ""),
+            themes=split_themes(values.get("themes", "")),
+            source=USER_DOC_SOURCE,
+        )
+        confidence = 1.0
+        if not entry.author:
+            confidence -= 0.3
+        if entry.year is None:
+            confidence -= 0.2
+        result.parsed.append(ParsedEntry(entry, confidence, line))
+    return result
+
+
+def parse_document(filename, text):
+    """Parse ``text`` with the rules matching the file's extension."""
+    if filename.lower().endswith(".csv"):
+        return parse_csv(text)
+    return parse_text(text)
@@ -0,0 +1,422 @@
+"""
+Chunked map-reduce processing of uploaded documents.
+
+A document is split along its ``--- Page N ---`` markers (or section
+headings and paragraphs for other formats) into chunks that fit a token
+budget. Each chunk is sent to the model concurrently under a concurrency
+limit, the returned tables are parsed into entries, and the entries are
+merged and de-duplicated into one report whose counts and date range are
+computed locally. Chunks go to the extraction route's model (see
+``libris.routing``); a reply that fails validation is retried once on the
+route's fallback model, and one cut off at the route's output-token cap
+is split into halves that are extracted separately. Chunks not yet sent when a cancel event is set
+are skipped, including those waiting in the rate limiter's queue, and
+those already answered are returned as usual.
+"""
+
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from libris.catalog import records_to_markdown
+from libris.dedup import EntryCollection
+from libris.history import estimate_tokens
+from libris.metrics import api_call, record_usage
+from libris.parsers import STRUCTURED_EXTENSIONS, parse_document
+from libris.prompt_cache import add_usage, cached_system, usage_from_response, with_cache_breakpoints
+from libris.ratelimit import Cancelled, cancellable
+from libris.records import USER_DOC_SOURCE
+from libris.routing import record_call, record_fallback
+from libris.settings import env_bool, env_int
+from libris.structured import Truncated, ValidationError, parse_reply, with_tool
+
+EXTRACTION_SYSTEM_PROMPT = """You are LIBRIS's bibliographic extraction engine.
+
+You receive one section of a larger document (a syllabus, reading list or
+bibliography). List every work cited in the section as a markdown table:
+
+| Publication Date | Author | Book Title | Key Themes / Notes | Source |
+|-----------------|--------|------------|-------------------|--------|
+| [date] | [author] | [title] | [themes] | 📄 |
+
+Rules:
+- Output only the table, with no commentary before or after it.
+- One row per distinct work; use the original publication date when known
+  (e.g. "380 BC", "1651"), otherwise leave the date empty.
+- Use full author names and the work's usual title.
+- If the section cites no works, output only the header row.
+"""
+
+# Used instead when extraction answers through the record_entries tool
+STRUCTURED_EXTRACTION_PROMPT = """You are LIBRIS's bibliographic extraction engine.
+
+You receive one section of a larger document (a syllabus, reading list or
+bibliography). Record every work cited in the section with the
+record_entries tool.
+
+Rules:
+- One entry per distinct work; use the original publication date when known
+  (e.g. "380 BC", "1651"), otherwise leave the date empty.
+- Use full author names and the work's usual title.
+- Set every source to user_document and leave the summary empty.
+- If the section cites no works, record an empty list.
+"""
+
+_PAGE_SPLIT = re.compile(r"\n--- Page (\d+) ---\n")
+_HEADING = re.compile(r"^(#{1,6}\s|[A-Z][A-Z0-9 ,:&'-]{3,}$)")
+
+
+@dataclass(frozen=True)
+class ChunkingConfig:
+    """Chunk size and concurrency for document processing."""
+
+    chunk_tokens: int = 6000
+    concurrency: int = 4
+    structured: bool = True
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from ``LIBRIS_CHUNK_*`` settings."""
+        return cls(
+            chunk_tokens=max(500, env_int("LIBRIS_CHUNK_TOKENS", cls.chunk_tokens)),
+            concurrency=max(1, env_int("LIBRIS_CHUNK_CONCURRENCY", cls.concurrency)),
+            structured=env_bool("LIBRIS_STRUCTURED_OUTPUT", cls.structured),
+        )
+
+
+@dataclass
+class Chunk:
+    """A contiguous piece of a document."""
+
+    index: int
+    label: str
+    text: str
+
+
+@dataclass
+class ChunkResult:
+    """Outcome of extracting one chunk."""
+
+    chunk: Chunk
+    entries: list = field(default_factory=list)
+    usage: dict = field(default_factory=dict)
+    error: Exception = None
+    model: str = ""
+
+
+@dataclass
+class DocumentResult:
+    """Entries parsed locally plus the per-chunk model results of one document."""
+
+    filename: str
+    local: list = field(default_factory=list)
+    results: list = field(default_factory=list)
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.error is None]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.error is not None]
+
+    @property
+    def entries(self):
+        """Merged, de-duplicated entries from every source."""
+        return merge_entries(self.local + [entry for result in self.results for entry in result.entries])
+
+    @property
+    def all_failed(self):
+        """True if nothing could be extracted because every request failed."""
+        return bool(self.results) and not self.succeeded and not self.local
+
+    def report(self):
+        return build_report(self.filename, self.entries, len(self.results), len(self.failed), len(self.local))
+
+
+def _units(text):
+    """Split text into (label, text) units at page or section boundaries."""
+    parts = _PAGE_SPLIT.split(text)
+    if len(parts) > 1:
+        units = [("", parts[0])] if parts[0].strip() else []
+        units.extend((f"page {parts[i]}", parts[i + 1]) for i in range(1, len(parts) - 1, 2))
+        return units
+
+    units = []
+    current = []
+    for line in text.splitlines(keepends=True):
+        if _HEADING.match(line.strip()) and current:
+            units.append(("", "".join(current)))
+            current = []
+        current.append(line)
+    if current:
+        units.append(("", "".join(current)))
+    return units
+
+
+def _split_oversized(text, max_tokens):
+    """Break a single unit that is larger than a chunk at line boundaries."""
+    pieces, current, size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        tokens = estimate_tokens(line)
+        if current and size + tokens > max_tokens:
+            pieces.append("".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += tokens
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def split_chunk(chunk):
+    """
+    ``chunk`` cut in half at a line boundary, or an empty list if it is a
+    single line.
+    """
+    pieces = _split_oversized(chunk.text, estimate_tokens(chunk.text) // 2 + 1)
+    if len(pieces) < 2:
+        return []
+    return [Chunk(chunk.index, f"{chunk.label}, part {number}", piece) for number, piece in enumerate(pieces, 1)]
+
+
+def split_document(text, max_tokens):
+    """
+    Pack a document into chunks of at most ``max_tokens`` estimated tokens.
+
+    Page markers are kept in the chunk text so the model sees them too.
+    """
+    chunks = []
+    current, labels, size = [], [], 0
+
+    def flush():
+        if current and "".join(current).strip():
+            if not labels:
+                label = f"section {len(chunks) + 1}"
+            elif len(labels) == 1:
+                label = labels[0]
+            else:
+                label = f"pages {labels[0].split()[-1]}–{labels[-1].split()[-1]}"
+            chunks.append(Chunk(len(chunks), label, "".join(current)))
+
+    for label, unit in _units(text):
+        body = f"\n--- Page {label.split()[-1]} ---\n{unit}" if label else unit
+        for piece in _split_oversized(body, max_tokens):
+            tokens = estimate_tokens(piece)
+            if current and size + tokens > max_tokens:
+                flush()
+                current, labels, size = [], [], 0
+            current.append(piece)
+            if label and label not in labels:
+                labels.append(label)
+            size += tokens
+    flush()
+    return chunks
+
+
+def extraction_request(chunk, filename, model, max_tokens, structured=False):
+    """
+    messages.create arguments for extracting one chunk, answered with a
+    markdown table or, if ``structured``, through the record_entries tool.
+    """
+    message = f"Document: {filename} ({chunk.label})\n\n{chunk.text}"
+    request = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": cached_system(STRUCTURED_EXTRACTION_PROMPT if structured else EXTRACTION_SYSTEM_PROMPT),
+        "messages": with_cache_breakpoints([{"role": "user", "content": message}]),
+    }
+    return with_tool(request) if structured else request
+
+
+def extract_chunk(client, chunk, filename, route, structured=False, cancel=None):
+    """
+    Map step: extract the entries cited in one chunk with ``route``'s
+    model, retrying on its fallback model if the reply fails validation.
+    A reply cut off at ``route.max_tokens`` is not escalated, since the
+    fallback has the same cap: the chunk is split and each half extracted
+    instead. A chunk still queued for the rate limit when ``cancel`` is
+    set fails with Cancelled.
+    """
+    usage = {}
+    result = None
+    for model in route.models:
+        if result is not None:
+            record_fallback(route.task, result.model, model)
+        started = time.perf_counter()
+        try:
+            with cancellable(cancel), api_call("extract"):
+                response = client.messages.create(
+                    **extraction_request(chunk, filename, model, route.max_tokens, structured)
+                )
+        except Exception as e:
+            return ChunkResult(chunk, usage=usage, error=e, model=model)
+        result = chunk_result(chunk, response, model)
+        record_usage("extract", result.usage)
+        record_call(route.task, model, time.perf_counter() - started, result.usage)
+        usage = add_usage(usage, result.usage)
+        if isinstance(result.error, Truncated):
+            halves = extract_halves(client, chunk, filename, route, structured, cancel)
+            if halves is not None:
+                result = halves
+                usage = add_usage(usage, halves.usage)
+            break
+        if not isinstance(result.error, ValidationError):
+            break
+    result.usage = usage
+    return result
+
+
+def extract_halves(client, chunk, filename, route, structured=False, cancel=None):
+    """
+    Extract the halves of a chunk whose reply was cut off at max_tokens
+    and merge them into one ChunkResult, failed if either half failed;
+    None if the chunk cannot be split.
+    """
+    parts = [extract_chunk(client, part, filename, route, structured, cancel) for part in split_chunk(chunk)]
+    if not parts:
+        return None
+    usage = {}
+    for part in parts:
+        usage = add_usage(usage, part.usage)
+    return ChunkResult(
+        chunk,
+        [entry for part in parts for entry in part.entries],
+        usage,
+        next((part.error for part in parts if part.error is not None), None),
+        parts[0].model,
+    )
+
+
+def chunk_result(chunk, response, model=""):
+    """
+    Parse the model's reply for one chunk into a ChunkResult; a malformed
+    record_entries call, or any reply cut off at max_tokens, is recorded
+    as the chunk's error.
+    """
+    usage = usage_from_response(response)
+    try:
+        entries = parse_reply(response, USER_DOC_SOURCE).entries
+    except ValidationError as e:
+        return ChunkResult(chunk, usage=usage, error=e, model=model)
+    if getattr(response, "stop_reason", None) == "max_tokens":
+        # A table cut off mid-row loses the rest of the section
+        return ChunkResult(chunk, usage=usage, error=Truncated("reply was cut off at max_tokens"), model=model)
+    for entry in entries:
+        entry.source = USER_DOC_SOURCE
+    return ChunkResult(chunk, entries, usage, model=model)
+
+
+def extract_chunks(client, chunks, filename, route, config, on_result=None, cancel=None):
+    """
+    Run the map step over all chunks with at most ``config.concurrency``
+    requests in flight.
+
+    Args:
+        client: anthropic.Anthropic client (shared across threads)
+        chunks: Chunks from ``split_document``
+        filename: Document name, included in each prompt
+        route: Route for extraction (see ``libris.routing``)
+        config: ChunkingConfig
+        on_result: Optional callback ``(ChunkResult, done, total)`` called
+            from the calling thread as results arrive
+        cancel: Optional threading.Event; chunks not yet sent when it is
+            set, or still waiting for the rate limit, fail with Cancelled
+
+    Returns:
+        list: ChunkResult objects in document order
+    """
+    def run(chunk):
+        if cancel is not None and cancel.is_set():
+            return ChunkResult(chunk, error=Cancelled())
+        return extract_chunk(client, chunk, filename, route, config.structured, cancel)
+
+    results = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=config.concurrency, thread_name_prefix="libris-chunk") as pool:
+        futures = {pool.submit(run, chunk): position for position, chunk in enumerate(chunks)}
+        done = 0
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            done += 1
+            if on_result is not None:
+                on_result(result, done, len(chunks))
+    return results
+
+
+def plan_document(filename, content, config):
+    """
+    Decide what the model has to read.
+
+    Structured reading lists are parsed by the rules first and only the
+    lines they could not resolve are chunked for the model.
+
+    Returns:
+        tuple: (entries parsed locally, chunks for the model)
+    """
+    local = []
+    if filename.lower().endswith(STRUCTURED_EXTENSIONS):
+        parsed = parse_document(filename, content)
+        if parsed.structured:
+            local = parsed.entries()
+            content = "\n".join(parsed.unresolved())
+    chunks = split_document(content, config.chunk_tokens) if content.strip() else []
+    return local, chunks
+
+
+def extract_document(client, filename, content, route, config, on_result=None):
+    """Parse and extract one document; see ``extract_chunks`` for ``on_result``."""
+    local, chunks = plan_document(filename, content, config)
+    results = extract_chunks(client, chunks, filename, route, config, on_result) if chunks else []
+    return DocumentResult(filename, local, results)
+
+
+def merge_entries(entries, aliases=None):
+    """
+    Reduce step: merge entries that cite the same work, keeping the first
+    occurrence and filling its missing author, date and themes from later
+    ones.
+    """
+    return EntryCollection(aliases).add(entries).added
+
+
+def build_report(filename, entries, chunk_count=1, failed=0, parsed_locally=0, max_themes=6):
+    """Render the "Document Processing Complete" report from entries."""
+    dated = sorted((entry for entry in entries if entry.year is not None), key=lambda e: e.year)
+    if dated:
+        date_range = f"{dated[0].date} to {dated[-1].date}"
+    else:
+        date_range = "n/a"
+    themes = Counter(theme.lower() for entry in entries for theme in entry.themes)
+    primary = ", ".join(theme for theme, _ in themes.most_common(max_themes)) or "n/a"
+
+    lines = [
+        "📚 **Document Processing Complete**",
+        f"**File:** {filename}",
+        f"**Entries Extracted:** {len(entries)} works",
+        f"**Date Range:** {date_range}",
+        f"**Primary Themes:** {primary}",
+    ]
+    if parsed_locally:
+        lines.append(f"**Read Without the Model:** {parsed_locally} entries")
+    if chunk_count > 1:
+        lines.append(f"**Sections Processed:** {chunk_count - failed} of {chunk_count}")
+    if failed:
+        lines.append(f"⚠️ {failed} section(s) could not be processed; their entries are missing.")
+
+    report = "\n\n".join(lines)
+    if entries:
+        rows = [
+            {
+                "date": entry.date,
+                "author": entry.author,
+                "title": entry.title,
+                "themes": ";".join(entry.themes),
+                "source": entry.source,
+            }
+            for entry in entries
+        ]
+        report += "\n\n" + records_to_markdown(rows)
+    return report
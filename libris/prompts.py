@@ -0,0 +1,179 @@
+"""
+Prompts and static page markup.
+
+Streamlit re-executes the app script on every rerun, so constants defined
+there are rebuilt for each interaction. Defined here they are built once
+per process, when the module is first imported, together with the prompt
+fingerprint that versions cached analyses.
+"""
+
+from libris.response_cache import ResponseCache, fingerprint
+
+LIBRIS_SYSTEM_PROMPT = """You are LIBRIS, an expert librarian and document analysis system specializing in historical and philosophical collections.
+
+CORE CAPABILITIES:
+1. Document Processing: Extract bibliographic data from uploaded documents
+2. Intelligent Search: Search across a catalog of ~200 historical/philosophical works
+3. Thematic Analysis: Identify patterns and connections across texts
+4. Export Formats: Provide results as BibTeX, CSV, JSON, or plain text
+
+DOCUMENT PROCESSING PROTOCOL:
+When a user uploads a document:
+1. Extract bibliographic data (author, title, date, themes)
+2. Structure into standardized entries
+3. Integrate with existing knowledge
+4. Provide processing statistics
+
+Always respond with:
+📚 **Document Processing Complete**
+**File:** [filename]
+**Entries Extracted:** [X] works
+**Date Range:** [earliest] to [latest]
+**Primary Themes:** [list themes]
+
+SEARCH PROTOCOL:
+Return results in markdown table format:
+
+| Publication Date | Author | Book Title | Key Themes / Notes | Source |
+|-----------------|--------|------------|-------------------|--------|
+| [date] | [author] | [title] | [themes] | 📚/📄 |
+
+Source indicators:
+- 📚 Base = From LIBRIS core knowledge
+- 📄 User Doc = From uploaded documents
+
+ANALYSIS:
+After each search, provide:
+- Patterns observed (chronological, thematic)
+- Insights from uploaded documents
+- Suggested next steps
+- Export options
+
+TONE:
+Professional but approachable, like a knowledgeable university librarian. Be precise, transparent about limitations, and enthusiastic about intellectual connections.
+
+SPECIAL FEATURES:
+- Transliteration-aware (match "Confucius" with "Kong Fuzi")
+- Conceptual search (match "justice" with "dharma", "dikaiosyne")
+- Multi-lingual titles (show original and translation)
+- Cross-cultural perspectives
+
+REMEMBER: You're helping make knowledge accessible to the world. Be helpful, educational, and inclusive of all intellectual traditions.
+"""
+
+ANALYSIS_INSTRUCTIONS = (
+    "Do not repeat the table. Provide only your analysis of these results: "
+    "patterns observed (chronological, thematic) and suggested next steps."
+)
+
+# Cached analyses are invalidated whenever the prompts change
+ANALYSIS_PROMPT_VERSION = fingerprint(LIBRIS_SYSTEM_PROMPT, ANALYSIS_INSTRUCTIONS)
+
+DOCUMENT_PROMPT = (
+    "I'm uploading a document called '{filename}'. Please process it and extract "
+    "bibliographic information.\n\nDocument content:\n{content}"
+)
+
+QUICK_SEARCHES = [
+    "Ancient Greek philosophy",
+    "Social contract theory",
+    "Buddhist ethics",
+    "Medieval Islamic philosophy",
+    "Confucian virtue",
+    "Natural law"
+]
+
+EXAMPLE_QUERIES = [
+    "Ancient Greek philosophy",
+    "Social contract theory",
+    "Buddhist ethics",
+    "Medieval Islamic philosophy",
+    "Confucian virtue ethics",
+    "Natural law tradition"
+]
+
+
+def analysis_message(query, table, passages=""):
+    """Prompt asking LIBRIS to analyse catalog results and retrieved document passages"""
+    grounding = (
+        f"These passages from the user's uploaded documents are relevant; "
+        f"cite them by number where you use them:\n\n{passages}\n\n"
+        if passages else ""
+    )
+    return (
+        f"Search for: {query}\n\n"
+        f"The LIBRIS catalog returned these works:\n\n{table}\n\n"
+        f"{grounding}"
+        f"{ANALYSIS_INSTRUCTIONS}"
+    )
+
+
+def analysis_key(query, model, table, passages=""):
+    """Response-cache key of the analysis of ``table`` (and any passages) for ``query``"""
+    return ResponseCache.make_key(query, model, ANALYSIS_PROMPT_VERSION, table, *([passages] if passages else []))
+
+
+# Page markup (rendered with unsafe_allow_html where it contains HTML)
+
+HEADER_HTML = """
+<h1 style='text-align: center; color: #6366f1;'>
+    📚 LIBRIS
+</h1>
+<p style='text-align: center; font-size: 1.2em; color: #94a3b8;'>
+    Advanced Librarian AI Agent
+</p>
+<p style='text-align: center; color: #64748b;'>
+    Free for the world to use • Powered by Claude AI
+</p>
+"""
+
+HOW_TO_USE = """
+1. **Search**: Enter queries in the search box
+2. **Upload**: Upload reading lists or bibliographies
+3. **Chat**: Ask questions about texts
+4. **Export**: Request BibTeX, CSV, or JSON
+"""
+
+FOOTER_HTML = """
+<div style='text-align: center; font-size: 0.8em; color: #64748b;'>
+Made with ❤️ for the world<br>
+Open source • Free forever<br>
+v1.1 - PDF & Word Support
+</div>
+"""
+
+WELCOME_HTML = """
+<div style='padding: 2rem; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+            border-radius: 10px; color: white; text-align: center; margin: 2rem 0;'>
+    <h2>👋 Welcome to LIBRIS!</h2>
+    <p style='font-size: 1.1em;'>Your advanced AI librarian for historical and philosophical research</p>
+</div>
+"""
+
+WELCOME_COLUMNS = (
+    """
+### 🔍 **Search**
+Find books and texts across thousands of years of human thought. Search by:
+- Author names
+- Time periods
+- Themes & concepts
+- Cultural traditions
+""",
+    """
+### 📄 **Process Documents**
+Upload your reading lists, syllabi, or bibliographies. LIBRIS will:
+- Extract bibliographic data
+- Categorize by theme
+- Identify patterns
+- Build your collection
+""",
+    """
+### 📚 **Learn & Explore**
+Discover connections across:
+- Ancient Greek & Roman
+- Islamic Golden Age
+- Chinese classics
+- Indian philosophy
+- Modern thought
+""",
+)
@@ -0,0 +1,334 @@
+"""
+Process-wide rate limiting for Anthropic API calls.
+
+Every session in the process shares one API key's limits, so a spike in
+traffic from one session affects all of them. Each pooled client is
+wrapped in a ``LimitedClient`` whose message requests first pass a
+``RateLimiter``: token buckets for requests and input tokens per minute,
+refilled continuously and corrected from the ``anthropic-ratelimit-*``
+response headers. Callers wait in FIFO order instead of being rejected,
+and can register a callback to be told their position in the queue or
+an event that, once set, takes them out of it. The wait happens before
+the SDK is called, so a ``QueueTimeout`` reaches the caller as itself
+rather than as a connection error.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from libris.metrics import RATE_LIMIT_WAIT
+from libris.settings import env_float, env_int
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+_local = threading.local()
+
+
+def is_retryable(error):
+    """True for rate limits, overload and connection failures."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=2.0, cap=60.0, hint=None):
+    """Full-jitter exponential backoff; a server ``retry-after`` is a floor."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, hint or 0.0)
+
+
+@contextmanager
+def reporting(callback):
+    """
+    Call ``callback(position)`` while this thread waits in a limiter queue.
+
+    Position 1 means the request is next. The callback runs in the
+    waiting thread, outside the limiter's lock.
+    """
+    previous = getattr(_local, "callback", None)
+    _local.callback = callback
+    try:
+        yield
+    finally:
+        _local.callback = previous
+
+
+@contextmanager
+def cancellable(event):
+    """Leave any limiter queue this thread waits in once ``event`` is set."""
+    previous = getattr(_local, "cancel", None)
+    _local.cancel = event
+    try:
+        yield
+    finally:
+        _local.cancel = previous
+
+
+class QueueTimeout(TimeoutError):
+    """Raised when a request waited longer than the queue timeout."""
+
+
+class Cancelled(Exception):
+    """Raised when a request was cancelled before it was sent."""
+
+
+@dataclass(frozen=True)
+class RateLimitConfig:
+    """Initial limits and retry policy; limits are replaced by header values."""
+
+    requests_per_minute: int = 50
+    tokens_per_minute: int = 30000
+    max_retries: int = 4
+    backoff_base: float = 1.0
+    backoff_cap: float = 30.0
+    queue_timeout: float = 300.0
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from ``LIBRIS_RATE_*`` settings (RPM 0 disables the limiter)."""
+        return cls(
+            requests_per_minute=env_int("LIBRIS_RATE_RPM", cls.requests_per_minute),
+            tokens_per_minute=env_int("LIBRIS_RATE_TPM", cls.tokens_per_minute),
+            max_retries=env_int("LIBRIS_RATE_MAX_RETRIES", cls.max_retries),
+            backoff_base=env_float("LIBRIS_RATE_BACKOFF_BASE", cls.backoff_base),
+            backoff_cap=env_float("LIBRIS_RATE_BACKOFF_CAP", cls.backoff_cap),
+            queue_timeout=env_float("LIBRIS_RATE_QUEUE_TIMEOUT", cls.queue_timeout),
+        )
+
+    @property
+    def enabled(self):
+        return self.requests_per_minute > 0
+
+
+class TokenBucket:
+    """A bucket of ``capacity`` that refills to full over one minute. Not locked."""
+
+    def __init__(self, capacity):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` is available (0 if it is now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def consume(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def observe(self, limit, remaining):
+        """Adopt the server's view of the limit and what is left of it."""
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_request_tokens(request):
+    """Rough input-token count of a messages request's arguments (4 bytes per token)."""
+    text = json.dumps(request.get("system", ""), default=str) + json.dumps(
+        request.get("messages", []), default=str
+    )
+    return len(text) // 4
+
+
+class RateLimiter:
+    """
+    FIFO gate in front of one API key's requests.
+
+    Args:
+        config: RateLimitConfig with the initial limits
+    """
+
+    def __init__(self, config=None):
+        self.config = config or RateLimitConfig()
+        self.requests = TokenBucket(self.config.requests_per_minute)
+        self.tokens = TokenBucket(self.config.tokens_per_minute)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._blocked_until = 0.0
+        self._waited = 0
+        self._wait_seconds = 0.0
+        self._throttled = 0
+
+    def acquire(self, tokens=0):
+        """
+        Block until a request of ``tokens`` input tokens may be sent.
+
+        Raises:
+            QueueTimeout: The request waited longer than ``queue_timeout``
+            Cancelled: The event set with ``cancellable`` was set first
+        """
+        if not self.config.enabled:
+            return
+        ticket = object()
+        callback = getattr(_local, "callback", None)
+        cancel = getattr(_local, "cancel", None)
+        started = time.monotonic()
+        reported = None
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    position = self._queue.index(ticket) + 1
+                    wait = max(0.0, self._blocked_until - time.monotonic())
+                    if position == 1 and not wait:
+                        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                        if not wait:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            self._queue.popleft()
+                            self._cond.notify_all()
+                            break
+                    if time.monotonic() - started > self.config.queue_timeout:
+                        raise QueueTimeout(
+                            f"Request waited more than {self.config.queue_timeout:.0f}s for the rate limit"
+                        )
+                if cancel is not None and cancel.is_set():
+                    raise Cancelled()
+                if callback is not None and position != reported:
+                    reported = position
+                    callback(position)
+                with self._cond:
+                    self._cond.wait(min(max(wait, 0.05), 0.5))
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            raise
+        waited = time.monotonic() - started
+        RATE_LIMIT_WAIT.observe(waited)
+        if waited > 0.01:
+            with self._cond:
+                self._waited += 1
+                self._wait_seconds += waited
+
+    def observe(self, headers, status_code=200):
+        """Update the buckets from a response's rate-limit headers."""
+        with self._cond:
+            self.requests.observe(
+                _header_int(headers, "anthropic-ratelimit-requests-limit"),
+                _header_int(headers, "anthropic-ratelimit-requests-remaining"),
+            )
+            token_limit = _header_int(headers, "anthropic-ratelimit-input-tokens-limit")
+            if token_limit is None:
+                token_limit = _header_int(headers, "anthropic-ratelimit-tokens-limit")
+                remaining = _header_int(headers, "anthropic-ratelimit-tokens-remaining")
+            else:
+                remaining = _header_int(headers, "anthropic-ratelimit-input-tokens-remaining")
+            self.tokens.observe(token_limit, remaining)
+
+            if status_code == 429:
+                self._throttled += 1
+                try:
+                    pause = float(headers.get("retry-after"))
+                except (TypeError, ValueError):
+                    pause = 1.0
+                self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+            self._cond.notify_all()
+
+    def event_hooks(self):
+        """httpx event hooks that read every response's rate-limit headers."""
+
+        def on_response(response):
+            self.observe(response.headers, response.status_code)
+
+        return {"response": [on_response]}
+
+    def stats(self):
+        """Queue length, current bucket levels and wait counters."""
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "requests_per_minute": int(self.requests.capacity),
+                "requests_available": int(self.requests.level),
+                "tokens_per_minute": int(self.tokens.capacity),
+                "tokens_available": int(self.tokens.level),
+                "waited": self._waited,
+                "wait_seconds": self._wait_seconds,
+                "throttled": self._throttled,
+            }
+
+
+class _LimitedMessages:
+    """``client.messages`` whose ``create`` and ``stream`` wait for the limiter."""
+
+    def __init__(self, messages, single_attempt, limiter):
+        self._messages = messages
+        self._single_attempt = single_attempt
+        self._limiter = limiter
+
+    def _acquire(self, kwargs):
+        if self._limiter is not None:
+            self._limiter.acquire(estimate_request_tokens(kwargs))
+
+    def create(self, **kwargs):
+        self._acquire(kwargs)
+        return self._single_attempt.create(**kwargs)
+
+    def stream(self, **kwargs):
+        self._acquire(kwargs)
+        return self._single_attempt.stream(**kwargs)
+
+    def __getattr__(self, name):
+        # Token counting and batches have their own limits
+        return getattr(self._messages, name)
+
+
+class LimitedClient:
+    """
+    An Anthropic client whose message requests pass ``limiter`` first.
+
+    ``messages.create`` and ``messages.stream`` are sent once, through a
+    copy of the client with the SDK's retries off; callers retry them
+    with ``backoff_delay``, queueing behind the limiter before each
+    attempt. Everything else, such as token counting and batches, is the
+    wrapped client's own and keeps the SDK's retries.
+
+    Args:
+        client: anthropic.Anthropic client
+        limiter: RateLimiter for the client's key, or None for no limits
+    """
+
+    def __init__(self, client, limiter=None):
+        self._wrapped = client
+        self.limiter = limiter
+        single_attempt = client.with_options(max_retries=0).messages
+        self.messages = _LimitedMessages(client.messages, single_attempt, limiter)
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
@@ -0,0 +1,194 @@
+"""
+Structured bibliographic entries.
+
+Search results and document-processing reports are parsed into ``Entry``
+objects once, so exports and later processing never need another model
+call to re-read a table the app has already shown.
+"""
+
+import re
+from dataclasses import asdict, dataclass, field
+
+BASE_SOURCE = "📚"
+USER_DOC_SOURCE = "📄"
+
+SOURCE_LABELS = {BASE_SOURCE: "LIBRIS base", USER_DOC_SOURCE: "User document"}
+
+# Header cells (folded) mapped to Entry fields
+_COLUMN_ALIASES = {
+    "date": "date",
+    "publication date": "date",
+    "year": "date",
+    "author": "author",
+    "authors": "author",
+    "title": "title",
+    "book title": "title",
+    "work": "title",
+    "themes": "themes",
+    "key themes / notes": "themes",
+    "key themes": "themes",
+    "notes": "themes",
+    "source": "source",
+}
+
+_TABLE_ROW = re.compile(r"^\s*\|(.+)\|\s*$")
+_TABLE_RULE = re.compile(r"^\s*\|?[\s:|-]+\|?\s*$")
+# A number that is not part of a longer number or an ordinal ("4th")
+_YEAR = re.compile(r"\b(\d{1,4})(?!\d|st\b|nd\b|rd\b|th\b)\s*(BCE|BC|B\.C\.|CE|AD|A\.D\.)?", re.IGNORECASE)
+# A date that is nothing but a short year ("65", "c. 65")
+_SHORT_YEAR = re.compile(r"(?:c\.|ca\.|circa)?\s*\d{1,2}", re.IGNORECASE)
+CENTURY = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)\s+century(\s+(?:bc|bce))?\b", re.IGNORECASE)
+
+
+def century_years(century, bc=False):
+    """First and last year of an ordinal century: (5, bc=True) -> (-500, -401)."""
+    if bc:
+        return -century * 100, -(century - 1) * 100 - 1
+    return (century - 1) * 100, century * 100 - 1
+
+
+def parse_year(date):
+    """
+    Best-effort numeric year for a display date.
+
+    "380 BC" -> -380, "c. 1750 BC" -> -1750, "170 AD" -> 170, "1274" -> 1274,
+    "4th century BC" -> -350 (the middle of the century). Returns None when
+    no year can be found, or when the only numbers are ordinals or short
+    numbers among other words ("2nd edition", "vol. 12").
+    """
+    date = date or ""
+    match = CENTURY.search(date)
+    if match:
+        first, last = century_years(int(match.group(1)), bool(match.group(2)))
+        return (first + last + 1) // 2
+    for match in _YEAR.finditer(date):
+        era = (match.group(2) or "").upper().replace(".", "")
+        if not era and len(match.group(1)) < 3 and not _SHORT_YEAR.fullmatch(date.strip()):
+            continue
+        year = int(match.group(1))
+        return -year if era in ("BC", "BCE") else year
+    return None
+
+
+def column_for(header):
+    """Entry field named by a table or CSV header cell, or None."""
+    return _COLUMN_ALIASES.get(header.lower().strip("* "))
+
+
+def normalize_source(cell):
+    """Map a table's source cell ("📄 User Doc", "Base") to a source marker."""
+    if USER_DOC_SOURCE in cell or "user" in cell.lower():
+        return USER_DOC_SOURCE
+    return BASE_SOURCE
+
+
+def split_themes(text):
+    """Split a themes cell on commas or semicolons."""
+    return [theme.strip() for theme in re.split(r"[;,]", text or "") if theme.strip()]
+
+
+@dataclass
+class Entry:
+    """One bibliographic record."""
+
+    author: str
+    title: str
+    date: str = ""
+    themes: list = field(default_factory=list)
+    source: str = BASE_SOURCE
+
+    @property
+    def year(self):
+        return parse_year(self.date)
+
+    @property
+    def source_label(self):
+        return SOURCE_LABELS.get(self.source, self.source)
+
+    def to_dict(self):
+        data = asdict(self)
+        data["year"] = self.year
+        return data
+
+    @classmethod
+    def from_catalog(cls, record):
+        """Build an entry from a ``libris.catalog`` record dict."""
+        return cls(
+            author=record["author"],
+            title=record["title"],
+            date=record["date"],
+            themes=split_themes(record["themes"]),
+            source=record["source"],
+        )
+
+
+def _cells(line):
+    return [cell.strip() for cell in _TABLE_ROW.match(line).group(1).split("|")]
+
+
+def parse_markdown_table(text):
+    """
+    Extract entries from every LIBRIS-style markdown table in ``text``.
+
+    Columns are matched by header name, so reordered or partial tables
+    still parse. Rows without a title are skipped.
+
+    Returns:
+        list: Entry objects in table order
+    """
+    entries = []
+    columns = None
+    lines = text.splitlines()
+    for idx, line in enumerate(lines):
+        if not _TABLE_ROW.match(line):
+            columns = None
+            continue
+        if _TABLE_RULE.match(line):
+            continue
+        following = lines[idx + 1] if idx + 1 < len(lines) else ""
+        if columns is None or (_TABLE_RULE.match(following) and _TABLE_ROW.match(following)):
+            # Header row: the next line is the |---|---| separator
+            columns = [column_for(cell) for cell in _cells(line)]
+            continue
+
+        values = {}
+        for name, cell in zip(columns, _cells(line)):
+            if name and name not in values:
+                values[name] = cell.replace("**", "").strip()
+        if not values.get("title"):
+            continue
+        entries.append(Entry(
+            author=values.get("author", ""),
+            title=values["title"],
+            date=values.get("date", ""),
+            themes=split_themes(values.get("themes", "")),
+            source=normalize_source(values.get("source", "")),
+        ))
+    return entries
+
+
+def entries_to_markdown(entries):
+    """Render entries as the LIBRIS results table (for history and prompts)."""
+    lines = [
+        "| Publication Date | Author | Book Title | Key Themes / Notes | Source |",
+        "|-----------------|--------|------------|-------------------|--------|",
+    ]
+    for entry in entries:
+        cells = [entry.date, entry.author, entry.title, ", ".join(entry.themes), entry.source]
+        lines.append("| " + " | ".join(cell.replace("|", "/") for cell in cells) + " |")
+    return "\n".join(lines)
+
+
+def entry_rows(entries):
+    """Rows for ``st.dataframe``; the numeric year makes dates sortable."""
+    return [
+        {
+            "Year": entry.year,
+            "Date": entry.date,
+            "Author": entry.author,
+            "Title": entry.title,
+            "Themes": ", ".join(entry.themes),
+            "Source": f"{entry.source} {entry.source_label}",
+        }
+        for entry in entries
+    ]
@@ -0,0 +1,202 @@
+"""
+Cross-session response cache.
+
+Popular searches (the quick-search buttons above all) are answered from a
+process-wide cache instead of a fresh model call. Entries are keyed by the
+normalised query, the model and a prompt-version hash, expire after a TTL
+and are evicted least-recently-used once the size bound is reached. The
+cache lives in memory or, for persistence across restarts, in SQLite.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from libris.settings import env_int, env_str
+from libris.text import fold
+
+
+def normalize_query(query):
+    """Fold case, accents, punctuation and spacing out of a query."""
+    return " ".join(re.findall(r"[a-z0-9]+", fold(query)))
+
+
+def fingerprint(*parts):
+    """Short stable hash of some text, used as a prompt version."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class MemoryBackend:
+    """LRU store in an ordered dict, bounded by entry count and bytes."""
+
+    def __init__(self, max_entries=1000, max_bytes=50_000_000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def set(self, key, value, stored_at):
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._items[key] = (value, stored_at, size)
+            self._bytes += size
+            while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+
+    def delete(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self._bytes -= item[2]
+
+    def size(self):
+        with self._lock:
+            return len(self._items), self._bytes
+
+
+class SqliteBackend:
+    """LRU store in a SQLite table, shared by every process using the file."""
+
+    def __init__(self, path, table="responses", max_entries=1000, max_bytes=50_000_000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.table = table
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)"
+            )
+
+    def get(self, key):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value, stored_at, size FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                )
+            return row
+
+    def set(self, key, value, stored_at):
+        size = len(value.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)",
+                (key, value, stored_at, time.time(), size),
+            )
+            count, total = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+            for evict_key, evict_size in self._conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY accessed_at"
+            ).fetchall():
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (evict_key,))
+                count -= 1
+                total -= evict_size
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+
+
+class ResponseCache:
+    """
+    TTL cache of model responses in front of a storage backend.
+
+    Args:
+        backend: MemoryBackend or SqliteBackend
+        ttl: Seconds before an entry expires (None keeps entries forever)
+    """
+
+    def __init__(self, backend=None, ttl=86400):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache described by ``LIBRIS_RESPONSE_CACHE*`` settings."""
+        max_entries = env_int("LIBRIS_RESPONSE_CACHE_MAX_ENTRIES", 1000)
+        max_bytes = env_int("LIBRIS_RESPONSE_CACHE_MAX_BYTES", 50_000_000)
+        location = env_str("LIBRIS_RESPONSE_CACHE", "memory")
+        if location == "memory":
+            backend = MemoryBackend(max_entries, max_bytes)
+        else:
+            backend = SqliteBackend(location, max_entries=max_entries, max_bytes=max_bytes)
+        return cls(backend, ttl=env_int("LIBRIS_RESPONSE_CACHE_TTL", 86400))
+
+    @staticmethod
+    def make_key(query, model, prompt_version, *extra):
+        """Cache key for a normalised query under a model and prompt version."""
+        return fingerprint(normalize_query(query), model, prompt_version, *extra)
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None on a miss."""
+        item = self.backend.get(key)
+        if item is not None and self.ttl is not None and time.time() - item[1] > self.ttl:
+            self.backend.delete(key)
+            item = None
+        with self._lock:
+            if item is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return item[0]
+
+    def contains(self, key):
+        """True if ``key`` holds a live entry (does not count as a lookup)."""
+        item = self.backend.get(key)
+        return item is not None and (self.ttl is None or time.time() - item[1] <= self.ttl)
+
+    def set(self, key, value):
+        """Store ``value`` under ``key``."""
+        self.backend.set(key, value, time.time())
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        entries, size = self.backend.size()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": size,
+            }
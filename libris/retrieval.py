@@ -0,0 +1,484 @@
+"""
+Local semantic retrieval over the catalog and uploaded documents.
+
+Conceptual queries ("natural law tradition") often share few words with
+the catalog rows that answer them. ``VectorIndex`` keeps one embedding
+per catalog record or document passage in a NumPy array that grows as
+items are added and answers top-k queries in a single pass over it.
+Embeddings come from a CPU sentence-transformers model when the optional
+package is installed, otherwise from hashed BM25 term weights, which are
+stored sparsely so a session's passages cost a few bytes per term rather
+than a dense row of every column. A catalog index can be saved and
+reopened memory-mapped, so restarts skip re-embedding. The retrieved
+rows and passages are what the model is asked to comment on, each marked
+with its 📚/📄 source.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
+
+from libris.catalog import era_of, records_to_markdown
+from libris.prompts import analysis_key
+from libris.records import USER_DOC_SOURCE
+from libris.settings import env_float, env_int, env_str
+from libris.text import GENERIC_TERMS, STOPWORDS, stem, tokenize
+
+LEXICAL = "lexical"
+
+_PAGE_MARKER = re.compile(r"^--- Page (\d+) ---$")
+
+# One non-zero weight of a sparse (lexical) index
+SPARSE_ENTRY = np.dtype([("row", np.int32), ("column", np.int32), ("weight", np.float32)])
+
+
+@dataclass(frozen=True)
+class RetrievalConfig:
+    """Embedding model, index location and result sizes."""
+
+    model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    dimensions: int = 4096
+    index_path: str = ""
+    top_k: int = 8
+    passage_words: int = 120
+    max_passages: int = 2000
+    # Lowest score of a related work; None uses the encoder's own threshold
+    min_score: float = None
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from ``LIBRIS_EMBEDDING_MODEL`` / ``LIBRIS_RETRIEVAL_*`` settings."""
+        return cls(
+            model=env_str("LIBRIS_EMBEDDING_MODEL", cls.model),
+            dimensions=env_int("LIBRIS_RETRIEVAL_DIMENSIONS", cls.dimensions),
+            index_path=env_str("LIBRIS_VECTOR_INDEX", cls.index_path),
+            top_k=env_int("LIBRIS_RETRIEVAL_TOP_K", cls.top_k),
+            passage_words=env_int("LIBRIS_PASSAGE_WORDS", cls.passage_words),
+            max_passages=env_int("LIBRIS_MAX_PASSAGES", cls.max_passages),
+            min_score=env_float("LIBRIS_RETRIEVAL_MIN_SCORE", cls.min_score),
+        )
+
+
+class LexicalEncoder:
+    """
+    BM25, used when no embedding model is available.
+
+    Each stemmed term gets its own column until all ``dimensions`` are
+    taken; later terms share columns by hash. Stopwords and words that
+    describe nearly every record ("philosophy", "theory") are not indexed.
+    Document rows hold saturated term frequencies; a query vector holds
+    its terms' IDF, computed from the current document frequencies so
+    scores stay right as documents are added, and divided by their sum.
+    A score is then roughly the share of the query a row matches: about 1
+    for a row of average length containing every query term once. Document rows are returned as ``SPARSE_ENTRY`` arrays of
+    their non-zero weights. Each index needs its own encoder.
+    """
+
+    k1 = 1.2
+    b = 0.75
+    sparse = True
+    # Related works must match about half of the query
+    min_score = 0.5
+
+    def __init__(self, dimensions=RetrievalConfig.dimensions):
+        self.name = LEXICAL
+        self.dimensions = dimensions
+        self.vocabulary = {}
+        self.document_frequency = np.zeros(dimensions, dtype=np.float32)
+        self.documents = 0
+        self.total_terms = 0
+
+    def _slot(self, term, add):
+        slot = self.vocabulary.get(term)
+        if slot is not None:
+            return slot
+        if len(self.vocabulary) < self.dimensions:
+            if not add:
+                # Never indexed, so it cannot match anything
+                return None
+            slot = self.vocabulary[term] = len(self.vocabulary)
+            return slot
+        # crc32 rather than hash(), which is salted per process
+        return zlib.crc32(term.encode("utf-8")) % self.dimensions
+
+    def _counts(self, text, add=False):
+        counts = {}
+        for token in tokenize(text):
+            if token not in STOPWORDS and token not in GENERIC_TERMS:
+                slot = self._slot(stem(token), add)
+                if slot is not None:
+                    counts[slot] = counts.get(slot, 0) + 1
+        return counts
+
+    def embed_documents(self, texts):
+        counts = [self._counts(text, add=True) for text in texts]
+        for terms in counts:
+            self.documents += 1
+            self.total_terms += sum(terms.values())
+            self.document_frequency[list(terms)] += 1
+        average = self.total_terms / max(self.documents, 1)
+        entries = []
+        for row, terms in enumerate(counts):
+            length = sum(terms.values())
+            norm = self.k1 * (1 - self.b + self.b * length / average) if average else self.k1
+            for slot, frequency in terms.items():
+                entries.append((row, slot, frequency * (self.k1 + 1) / (frequency + norm)))
+        return np.array(entries, dtype=SPARSE_ENTRY)
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for slot in self._counts(text):
+            frequency = self.document_frequency[slot]
+            vector[slot] = math.log(1 + (self.documents - frequency + 0.5) / (frequency + 0.5))
+        total = vector.sum()
+        return vector / total if total else vector
+
+    def state(self):
+        return {
+            "vocabulary": self.vocabulary,
+            "document_frequency": self.document_frequency.tolist(),
+            "documents": self.documents,
+            "total_terms": self.total_terms,
+        }
+
+    def load_state(self, state):
+        self.vocabulary = state["vocabulary"]
+        self.document_frequency = np.asarray(state["document_frequency"], dtype=np.float32)
+        self.documents = state["documents"]
+        self.total_terms = state["total_terms"]
+
+
+@lru_cache(maxsize=None)
+def _sentence_model(name):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(name, device="cpu")
+
+
+class SentenceEncoder:
+    """Normalised sentence-transformers embeddings, compared by cosine similarity."""
+
+    sparse = False
+    min_score = 0.3
+
+    def __init__(self, model):
+        self.name = model
+        self._model = _sentence_model(model)
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+
+    def embed_documents(self, texts):
+        vectors = self._model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimensions)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        pass
+
+
+def make_encoder(config):
+    """
+    A SentenceEncoder for ``config.model``, or a LexicalEncoder when the
+    model is "lexical", sentence-transformers is not installed or the
+    model cannot be loaded.
+    """
+    if config.model and config.model != LEXICAL:
+        try:
+            return SentenceEncoder(config.model)
+        except (ImportError, OSError):
+            pass
+    return LexicalEncoder(config.dimensions)
+
+
+@dataclass
+class Hit:
+    """A retrieved item and its similarity to the query."""
+
+    score: float
+    item: dict = field(default_factory=dict)
+
+
+class VectorIndex:
+    """
+    Embedded items searched by dot product.
+
+    Dense rows live in a float32 matrix, and a sparse encoder's weights in
+    a ``SPARSE_ENTRY`` array; either's capacity doubles as items are
+    added. An index opened with ``load`` is memory-mapped read-only and
+    copied into memory on the first ``add``.
+
+    Args:
+        encoder: LexicalEncoder or SentenceEncoder
+    """
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.items = []
+        if encoder.sparse:
+            self._vectors = np.zeros(0, dtype=SPARSE_ENTRY)
+        else:
+            self._vectors = np.zeros((0, encoder.dimensions), dtype=np.float32)
+        self._filled = 0
+        self._item_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the vectors, items and encoder state."""
+        with self._lock:
+            size = self._item_bytes
+            if self._vectors.flags.writeable:
+                size += self._vectors.nbytes
+            if self.encoder.sparse:
+                size += self.encoder.document_frequency.nbytes
+                size += sum(len(term) + 64 for term in self.encoder.vocabulary)
+            return size
+
+    def add(self, texts, items):
+        """Embed ``texts`` and store them with their ``items`` (JSON-serialisable dicts)."""
+        if not texts:
+            return
+        with self._lock:
+            vectors = self.encoder.embed_documents(texts)
+            if self.encoder.sparse:
+                vectors["row"] += len(self.items)
+            size = self._filled
+            needed = size + len(vectors)
+            if needed > self._vectors.shape[0] or not self._vectors.flags.writeable:
+                shape = (max(needed, 2 * self._vectors.shape[0]),) + self._vectors.shape[1:]
+                grown = np.zeros(shape, dtype=self._vectors.dtype)
+                grown[:size] = self._vectors[:size]
+                self._vectors = grown
+            self._vectors[size:needed] = vectors
+            self._filled = needed
+            self.items.extend(items)
+            self._item_bytes += sum(len(json.dumps(item, ensure_ascii=False)) for item in items)
+
+    def search(self, query, k=RetrievalConfig.top_k, accept=None, min_score=0.0):
+        """
+        Items most similar to ``query``, best first.
+
+        Args:
+            query: Free text
+            k: Maximum number of hits
+            accept: Optional predicate on items (e.g. a date filter)
+            min_score: Lowest score returned
+
+        Returns:
+            list: Hit objects scoring above ``min_score`` (and above 0)
+        """
+        with self._lock:
+            size = len(self.items)
+            if not size or k <= 0:
+                return []
+            vector = self.encoder.embed_query(query)
+            if self.encoder.sparse:
+                entries = self._vectors[:self._filled]
+                weights = entries["weight"] * vector[entries["column"]]
+                scores = np.bincount(entries["row"], weights=weights, minlength=size)
+            else:
+                scores = self._vectors[:size] @ vector
+            if accept is None and k < size:
+                order = np.argpartition(-scores, k - 1)[:k]
+                order = order[np.argsort(-scores[order])]
+            else:
+                order = np.argsort(-scores)
+            hits = []
+            for position in order:
+                if scores[position] <= max(min_score, 0) or len(hits) == k:
+                    break
+                item = self.items[position]
+                if accept is None or accept(item):
+                    hits.append(Hit(float(scores[position]), item))
+            return hits
+
+    def save(self, path):
+        """Write ``path``.npy (vectors) and ``path``.json (items and encoder state)."""
+        with self._lock:
+            np.save(f"{path}.npy", self._vectors[:self._filled])
+            meta = {
+                "encoder": self.encoder.name,
+                "dimensions": self.encoder.dimensions,
+                "state": self.encoder.state(),
+                "items": self.items,
+            }
+        with open(f"{path}.json", "w", encoding="utf-8") as handle:
+            json.dump(meta, handle, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, encoder):
+        """
+        Reopen a saved index memory-mapped, or return None if it is missing
+        or was built with a different encoder.
+        """
+        if not (os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")):
+            return None
+        with open(f"{path}.json", encoding="utf-8") as handle:
+            meta = json.load(handle)
+        if meta["encoder"] != encoder.name or meta["dimensions"] != encoder.dimensions:
+            return None
+        vectors = np.load(f"{path}.npy", mmap_mode="r")
+        if (vectors.dtype == SPARSE_ENTRY) != encoder.sparse:
+            # Saved before lexical indexes were sparse
+            return None
+        encoder.load_state(meta["state"])
+        index = cls(encoder)
+        index._vectors = vectors
+        index._filled = len(vectors)
+        index.items = meta["items"]
+        return index
+
+
+def record_text(record):
+    """Text embedded for a catalog record."""
+    parts = [record["title"], record["author"], record["themes"].replace(";", ","), record["tradition"]]
+    return ". ".join(part for part in parts + [era_of(record["year"])] if part)
+
+
+def catalog_index(catalog, config):
+    """
+    Index of every catalog record, reopened from ``config.index_path``
+    when it was saved for the same records and encoder.
+    """
+    records = catalog.records()
+    encoder = make_encoder(config)
+    if config.index_path:
+        index = VectorIndex.load(config.index_path, encoder)
+        if index is not None and [item["id"] for item in index.items] == [record["id"] for record in records]:
+            return index
+        encoder = make_encoder(config)
+    index = VectorIndex(encoder)
+    index.add([record_text(record) for record in records], records)
+    if config.index_path:
+        index.save(config.index_path)
+    return index
+
+
+def expand_query(query, expansions):
+    """``query`` followed by the alias alternatives found in it (see ``libris.aliases``)."""
+    return " ".join([query] + [name for expansion in expansions for name in expansion.added])
+
+
+@dataclass
+class CatalogSearch:
+    """Keyword matches, related works and the table the model is asked to analyse."""
+
+    result: object
+    related: list
+    table: str
+
+    @property
+    def records(self):
+        return self.result.records + self.related
+
+    def analysis_key(self, model, passages=""):
+        """Response-cache key of this search's analysis (see ``libris.prompts``)."""
+        return analysis_key(self.result.query, model, self.table, passages)
+
+
+def related_records(index, query, result, config):
+    """
+    Catalog records similar in meaning to ``query`` that keyword search
+    missed, within the same date range and scoring above
+    ``config.min_score`` (or the encoder's threshold).
+    """
+    found = {record["id"] for record in result.records}
+
+    def accept(record):
+        year = record["year"]
+        if result.year_from is not None and (year is None or year < result.year_from):
+            return False
+        if result.year_to is not None and (year is None or year > result.year_to):
+            return False
+        return record["id"] not in found
+
+    wanted = config.top_k - len(result.records)
+    min_score = config.min_score if config.min_score is not None else index.encoder.min_score
+    hits = index.search(expand_query(query, result.expansions), wanted, accept, min_score)
+    return [hit.item for hit in hits]
+
+
+def catalog_search(catalog, index, query, config, year_from=None, year_to=None):
+    """
+    Keyword matches for ``query``, followed by related works from
+    ``index`` when there are fewer than ``config.top_k`` of them. Every
+    search path builds its table (and so its cache key) here, so warmed
+    and live analyses agree.
+    """
+    result = catalog.search(query, year_from, year_to)
+    related = related_records(index, query, result, config) if len(result.records) < config.top_k else []
+    return CatalogSearch(result, related, records_to_markdown(result.records + related))
+
+
+def split_passages(text, words=RetrievalConfig.passage_words):
+    """
+    Split document text into passages of about ``words`` words at line
+    boundaries, each noting the page it starts on (from ``--- Page N ---``
+    markers) when there is one.
+
+    Returns:
+        list: ``{"page", "text"}`` dicts
+    """
+    passages = []
+    lines = []
+    count = 0
+    page = start = None
+    for line in text.splitlines():
+        line = line.strip()
+        marker = _PAGE_MARKER.match(line)
+        if marker:
+            page = int(marker.group(1))
+            continue
+        if not line:
+            continue
+        if not lines:
+            start = page
+        lines.append(line)
+        count += len(line.split())
+        if count >= words:
+            passages.append({"page": start, "text": " ".join(lines)})
+            lines, count = [], 0
+    if lines:
+        passages.append({"page": start, "text": " ".join(lines)})
+    return passages
+
+
+def add_document(index, filename, text, config):
+    """
+    Index the passages of an uploaded document, up to ``config.max_passages``
+    in the index.
+
+    Returns:
+        int: Passages added
+    """
+    passages = split_passages(text, config.passage_words)
+    passages = passages[:max(0, config.max_passages - len(index))]
+    index.add(
+        [passage["text"] for passage in passages],
+        [dict(passage, document=filename, source=USER_DOC_SOURCE) for passage in passages],
+    )
+    return len(passages)
+
+
+def passages_to_markdown(hits):
+    """Numbered passages for grounding, each citing its document and page."""
+    lines = []
+    for number, hit in enumerate(hits, 1):
+        item = hit.item
+        where = f"{item['document']}, p. {item['page']}" if item.get("page") else item["document"]
+        lines.append(f"[{number}] {item['source']} {where}: \"{item['text']}\"")
+    return "\n".join(lines)
@@ -0,0 +1,184 @@
+"""
+Model routing by task.
+
+Reading a syllabus for citations needs a cheaper model and a different
+output cap than a research answer. ``ModelRouter`` maps each kind of
+operation (chat, catalog search, document extraction) to a ``Route``: a
+model, an output-token cap and an optional, more capable fallback model
+that is tried when a reply fails validation. Routes are read from
+``LIBRIS_<TASK>_*`` settings, and each call's latency and estimated cost
+are recorded per task and model so the routing can be tuned from the
+admin panel or ``/metrics``. Exports are rendered locally and make no
+model calls, so they have no route.
+"""
+
+from dataclasses import dataclass
+
+from libris.metrics import FALLBACKS, TASK_CALLS, TASK_COST, TASK_SECONDS
+from libris.settings import env_int, env_str
+
+CHAT = "chat"
+SEARCH = "search"
+EXTRACTION = "extraction"
+
+TASKS = (CHAT, SEARCH, EXTRACTION)
+
+DEFAULT_MODEL = "claude-sonnet-4-5-20250929"
+FAST_MODEL = "claude-haiku-4-5-20251001"
+
+# US dollars per million (input, output) tokens, matched by model id prefix
+PRICES = {
+    "claude-opus-4-5": (5.0, 25.0),
+    "claude-opus-4": (15.0, 75.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-haiku": (0.25, 1.25),
+}
+
+# Cache writes and reads, relative to the input price
+CACHE_WRITE_RATE = 1.25
+CACHE_READ_RATE = 0.1
+
+# Message Batches requests, relative to the same call made directly
+BATCH_RATE = 0.5
+
+
+def price_of(model):
+    """(input, output) dollars per million tokens for ``model``, or None if unknown."""
+    matches = [prefix for prefix in PRICES if model.startswith(prefix)]
+    return PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model, usage, batch=False):
+    """
+    Dollar cost of one call's usage dict; 0 for models without a known price.
+    ``batch`` applies the Message Batches discount.
+    """
+    price = price_of(model)
+    if price is None:
+        return 0.0
+    input_price, output_price = price
+    tokens = (
+        usage.get("input_tokens", 0) * input_price
+        + usage.get("cache_creation_input_tokens", 0) * input_price * CACHE_WRITE_RATE
+        + usage.get("cache_read_input_tokens", 0) * input_price * CACHE_READ_RATE
+        + usage.get("output_tokens", 0) * output_price
+    )
+    return tokens / 1_000_000 * (BATCH_RATE if batch else 1.0)
+
+
+def record_call(task, model, seconds, usage, batch=False):
+    """
+    Record one model call's latency and estimated cost under ``task``;
+    ``seconds`` is None for batch results, which have no latency of their own.
+    """
+    TASK_CALLS.inc(task=task, model=model)
+    if seconds is not None:
+        TASK_SECONDS.observe(seconds, task=task, model=model)
+    cost = estimate_cost(model, usage, batch)
+    if cost:
+        TASK_COST.inc(cost, task=task, model=model)
+
+
+def record_fallback(task, model, fallback):
+    """Count a reply from ``model`` that was retried on ``fallback``."""
+    FALLBACKS.inc(task=task, model=model, fallback=fallback)
+
+
+@dataclass(frozen=True)
+class Route:
+    """Model, output-token cap and optional fallback model for one task."""
+
+    task: str
+    model: str
+    max_tokens: int
+    fallback: str = ""
+
+    @property
+    def models(self):
+        """Models to try in order."""
+        if self.fallback and self.fallback != self.model:
+            return (self.model, self.fallback)
+        return (self.model,)
+
+
+DEFAULT_ROUTES = {
+    CHAT: Route(CHAT, DEFAULT_MODEL, 4000),
+    SEARCH: Route(SEARCH, DEFAULT_MODEL, 4000),
+    EXTRACTION: Route(EXTRACTION, FAST_MODEL, 4000, fallback=DEFAULT_MODEL),
+}
+
+
+class ModelRouter:
+    """
+    Routes by task.
+
+    Args:
+        routes: {task: Route}; tasks without a route use the chat route
+    """
+
+    def __init__(self, routes=None):
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build routes from ``LIBRIS_MODEL`` (default for every task) and
+        ``LIBRIS_<TASK>_MODEL`` / ``_MAX_TOKENS`` / ``_FALLBACK_MODEL``.
+        """
+        default = env_str("LIBRIS_MODEL", "")
+        routes = {}
+        for task, route in DEFAULT_ROUTES.items():
+            prefix = f"LIBRIS_{task.upper()}"
+            max_tokens = route.max_tokens
+            if task == EXTRACTION:
+                # The setting this route replaced
+                max_tokens = env_int("LIBRIS_CHUNK_MAX_TOKENS", max_tokens)
+            routes[task] = Route(
+                task,
+                env_str(f"{prefix}_MODEL", default or route.model),
+                env_int(f"{prefix}_MAX_TOKENS", max_tokens),
+                env_str(f"{prefix}_FALLBACK_MODEL", route.fallback),
+            )
+        return cls(routes)
+
+    def route(self, task):
+        """The Route for ``task``."""
+        return self.routes.get(task) or self.routes[CHAT]
+
+    def report(self):
+        """
+        Rows for the admin panel: calls, latency and estimated cost per
+        task and model, with the number of fallbacks each model caused.
+        Calls are counted exactly, batch results included; latencies come
+        from the (possibly sampled) timings of direct calls.
+        """
+        def by_pair(samples):
+            return {(dict(key)["task"], dict(key)["model"]): value for key, value in samples.items()}
+
+        calls = by_pair(TASK_CALLS.samples())
+        latencies = by_pair(TASK_SECONDS.samples())
+        costs = by_pair(TASK_COST.samples())
+        fallbacks = {}
+        for key, value in FALLBACKS.samples().items():
+            labels = dict(key)
+            pair = (labels["task"], labels["model"])
+            fallbacks[pair] = fallbacks.get(pair, 0) + value
+        rows = []
+        for pair in sorted(set(calls) | set(latencies) | set(costs)):
+            counts, total, timed = latencies.get(pair, ([], 0.0, 0))
+            count = calls.get(pair, 0)
+            cost = costs.get(pair, 0.0)
+            rows.append({
+                "task": pair[0],
+                "model": pair[1],
+                "calls": count,
+                "mean_s": total / timed if timed else 0.0,
+                "p95_s": TASK_SECONDS.quantile(counts, timed, 0.95),
+                "cost_usd": cost,
+                "usd_per_call": cost / count if count else 0.0,
+                "fallbacks": fallbacks.get(pair, 0),
+            })
+        return rows
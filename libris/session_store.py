@@ -0,0 +1,272 @@
+"""
+Bounded per-session conversation storage.
+
+A session's conversation includes each uploaded document's full text and
+lives as long as the session, which adds up on a pod serving hundreds of
+sessions. ``SessionStore`` caps the bytes a session keeps resident. Once
+over the cap it spills old document payloads, then whole old turns,
+compressed into a process-wide SQLite file (``SpillStore``), leaving
+small stubs behind. Spilled turns are left out of requests (the history
+budget would have dropped them anyway) and are read back only when the
+Chat tab asks for them.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+from libris.history import document_placeholder
+from libris.settings import env_int, env_str
+
+PAYLOAD = "payload"
+TURN = "turn"
+
+MISSING = "[This message is no longer available.]"
+
+
+@dataclass(frozen=True)
+class SessionStoreConfig:
+    """Resident-memory cap per session and where spilled messages go."""
+
+    max_resident_bytes: int = 2_000_000
+    path: str = os.path.join(tempfile.gettempdir(), "libris_sessions.sqlite3")
+    ttl: int = 7 * 86400
+    compress_level: int = 6
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from ``LIBRIS_SESSION_*`` settings (a cap of 0 disables spilling)."""
+        return cls(
+            max_resident_bytes=env_int("LIBRIS_SESSION_MAX_BYTES", cls.max_resident_bytes),
+            path=env_str("LIBRIS_SESSION_STORE", cls.path),
+            ttl=env_int("LIBRIS_SESSION_TTL", cls.ttl),
+        )
+
+
+def message_bytes(message):
+    """Approximate memory held by a message's content."""
+    return len(message["content"].encode("utf-8"))
+
+
+class SpillStore:
+    """
+    Compressed messages in a SQLite file, shared by every session.
+
+    Rows of sessions that have not spilled anything for ``ttl`` seconds
+    are purged when the store opens and every few hundred writes.
+    """
+
+    PURGE_EVERY = 200
+
+    def __init__(self, path, ttl=SessionStoreConfig.ttl, compress_level=SessionStoreConfig.compress_level):
+        self.ttl = ttl
+        self.compress_level = compress_level
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS spilled ("
+                " session_id TEXT NOT NULL, seq INTEGER NOT NULL, payload BLOB NOT NULL,"
+                " raw_size INTEGER NOT NULL, stored_at REAL NOT NULL,"
+                " PRIMARY KEY (session_id, seq))"
+            )
+        self.purge()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.path, config.ttl, config.compress_level)
+
+    def put(self, session_id, seq, message):
+        raw = json.dumps(message, ensure_ascii=False).encode("utf-8")
+        payload = zlib.compress(raw, self.compress_level)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO spilled VALUES (?, ?, ?, ?, ?)",
+                (session_id, seq, payload, len(raw), time.time()),
+            )
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self.purge()
+
+    def get(self, session_id, seq):
+        """The spilled message, or None if it was purged."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM spilled WHERE session_id = ? AND seq = ?", (session_id, seq)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def delete_session(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM spilled WHERE session_id = ?", (session_id,))
+
+    def purge(self):
+        """Drop the rows of sessions idle for longer than the TTL."""
+        if not self.ttl:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM spilled WHERE session_id IN ("
+                " SELECT session_id FROM spilled GROUP BY session_id HAVING MAX(stored_at) < ?)",
+                (time.time() - self.ttl,),
+            )
+
+    def stats(self):
+        """Sessions and messages on disk, compressed and raw bytes."""
+        with self._lock:
+            sessions, rows, stored, raw = self._conn.execute(
+                "SELECT COUNT(DISTINCT session_id), COUNT(*),"
+                " COALESCE(SUM(LENGTH(payload)), 0), COALESCE(SUM(raw_size), 0) FROM spilled"
+            ).fetchone()
+        return {"sessions": sessions, "messages": rows, "stored_bytes": stored, "raw_bytes": raw}
+
+
+class SessionStore:
+    """
+    One session's conversation, with at most ``max_resident_bytes`` of
+    message content kept in memory.
+
+    Messages are ``{"role", "content"}`` dicts, optionally with
+    ``document`` naming an uploaded file. Spilled messages are replaced
+    by stubs carrying ``spilled`` (``"payload"`` or ``"turn"``), ``seq``
+    and ``bytes``; a payload stub keeps a short placeholder as content.
+
+    Args:
+        session_id: Key of this session's rows in the spill store
+        spill: SpillStore, or None to keep everything in memory
+        config: SessionStoreConfig
+    """
+
+    def __init__(self, session_id, spill=None, config=None):
+        self.session_id = session_id
+        self.spill = spill
+        self.config = config or SessionStoreConfig()
+        self._messages = []
+        self._resident = 0
+        self._spilled_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        """Messages as held in memory, stubs included, copied under the lock."""
+        with self._lock:
+            messages = [dict(message) for message in self._messages]
+        return iter(messages)
+
+    def append(self, message):
+        with self._lock:
+            self._messages.append(dict(message))
+            self._resident += message_bytes(message)
+            self._enforce()
+
+    def clear(self):
+        with self._lock:
+            self._messages = []
+            self._resident = 0
+            self._spilled_bytes = 0
+        if self.spill is not None:
+            self.spill.delete_session(self.session_id)
+
+    def _turn_starts(self):
+        return [idx for idx, message in enumerate(self._messages) if message["role"] == "user"] or [0]
+
+    def _spill(self, idx, kind):
+        message = self._messages[idx]
+        if message.get("spilled") == PAYLOAD:
+            # Already on disk; only the placeholder is left to drop
+            self._resident -= message_bytes(message)
+            self._messages[idx] = dict(message, content="", spilled=kind)
+            return
+        self.spill.put(self.session_id, idx, message)
+        size = message_bytes(message)
+        stub = {"role": message["role"], "spilled": kind, "seq": idx, "bytes": size}
+        if message.get("document"):
+            stub["document"] = message["document"]
+        if kind == PAYLOAD:
+            reply = self._messages[idx + 1] if idx + 1 < len(self._messages) else None
+            stub["content"] = document_placeholder(message, reply)
+        else:
+            stub["content"] = ""
+        self._messages[idx] = stub
+        self._resident += message_bytes(stub) - size
+        self._spilled_bytes += size
+
+    def _enforce(self):
+        """Spill oldest-first until under the cap; the latest turn always stays."""
+        cap = self.config.max_resident_bytes
+        if self.spill is None or not cap or self._resident <= cap:
+            return
+        starts = self._turn_starts()
+        protected = starts[-1]
+        for idx in range(protected):
+            if self._resident <= cap:
+                return
+            message = self._messages[idx]
+            if message.get("document") and not message.get("spilled"):
+                self._spill(idx, PAYLOAD)
+        for start, stop in zip(starts, starts[1:]):
+            for idx in range(start, stop):
+                if self._resident <= cap:
+                    return
+                if self._messages[idx].get("spilled") != TURN:
+                    self._spill(idx, TURN)
+
+    def load(self, message):
+        """The full message behind ``message``, read from disk if it was spilled."""
+        if not message.get("spilled"):
+            return message
+        stored = self.spill.get(self.session_id, message["seq"]) if self.spill is not None else None
+        return stored or {"role": message["role"], "content": MISSING}
+
+    def iter_messages(self, load=False):
+        """
+        Messages for display, oldest first.
+
+        Args:
+            load: Read spilled messages back from disk; otherwise payload
+                stubs show their placeholder and spilled turns are skipped
+        """
+        for message in self:
+            if load:
+                yield self.load(message)
+            elif message.get("spilled") != TURN:
+                yield message
+
+    def for_request(self):
+        """History for ``libris.history.compact_history``, without spilled turns."""
+        history = []
+        for message in self:
+            if message.get("spilled") == TURN:
+                continue
+            entry = {"role": message["role"], "content": message["content"]}
+            if message.get("document") and not message.get("spilled"):
+                entry["document"] = message["document"]
+            history.append(entry)
+        return history
+
+    @property
+    def spilled_turn_messages(self):
+        with self._lock:
+            return sum(1 for message in self._messages if message.get("spilled") == TURN)
+
+    def stats(self):
+        """Resident and spilled bytes of this session."""
+        with self._lock:
+            return {
+                "messages": len(self._messages),
+                "resident_bytes": self._resident,
+                "max_resident_bytes": self.config.max_resident_bytes,
+                "spilled_messages": sum(1 for message in self._messages if message.get("spilled")),
+                "spilled_bytes": self._spilled_bytes,
+            }
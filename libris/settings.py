@@ -0,0 +1,39 @@
+"""
+Runtime settings for LIBRIS.
+
+Every tunable is read from a ``LIBRIS_*`` environment variable. Streamlit
+Cloud exports root-level secrets as environment variables, so the same
+names can be set in ``.streamlit/secrets.toml`` or the app's Secrets panel.
+"""
+
+import os
+
+
+def env_str(name, default=""):
+    """Return the string value of ``name`` or ``default`` when unset/blank."""
+    value = os.environ.get(name, "").strip()
+    return value if value else default
+
+
+def env_int(name, default):
+    """Return ``name`` parsed as an int, falling back to ``default``."""
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def env_float(name, default):
+    """Return ``name`` parsed as a float, falling back to ``default``."""
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def env_bool(name, default=False):
+    """Return ``name`` interpreted as a boolean flag."""
+    value = os.environ.get(name, "").strip().lower()
+    if not value:
+        return default
+    return value in ("1", "true", "yes", "on")
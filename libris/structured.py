@@ -0,0 +1,166 @@
+"""
+Structured output through tool use.
+
+Markdown tables in replies had to be re-parsed by every consumer, and a
+stray pipe or a reordered column could silently lose rows. In structured
+mode the model is made to call ``record_entries``, whose JSON schema
+describes typed entries (date, author, title, themes, source) and an
+optional markdown summary. The tool input is validated into ``Entry``
+objects once, and the app keeps those. Replies without the tool call
+fall back to parsing any table in the text.
+"""
+
+from dataclasses import dataclass, field
+
+from libris.records import BASE_SOURCE, Entry, normalize_source, parse_markdown_table, split_themes
+
+TOOL_NAME = "record_entries"
+
+RECORD_ENTRIES_TOOL = {
+    "name": TOOL_NAME,
+    "description": (
+        "Record the bibliographic works in your answer. Call this exactly once, "
+        "listing every work, one per distinct title."
+    ),
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "entries": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "date": {
+                            "type": "string",
+                            "description": 'Original publication date, e.g. "380 BC" or "1651"; empty if unknown',
+                        },
+                        "author": {"type": "string", "description": "Full author name"},
+                        "title": {"type": "string", "description": "The work's usual title"},
+                        "themes": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Key themes, a few words each",
+                        },
+                        "source": {
+                            "type": "string",
+                            "enum": ["base", "user_document"],
+                            "description": "base for LIBRIS knowledge, user_document for works from an uploaded document",
+                        },
+                    },
+                    "required": ["author", "title"],
+                },
+            },
+            "summary": {
+                "type": "string",
+                "description": "Optional markdown analysis to show with the entries (no table)",
+            },
+        },
+        "required": ["entries"],
+    },
+}
+
+
+class ValidationError(ValueError):
+    """The tool input does not match the ``record_entries`` schema."""
+
+
+class Truncated(ValidationError):
+    """The reply was cut off at the output-token cap."""
+
+
+@dataclass
+class StructuredReply:
+    """Validated entries and summary of one structured reply."""
+
+    entries: list = field(default_factory=list)
+    summary: str = ""
+    rejected: int = 0
+    from_tool: bool = True
+
+
+def with_tool(request, tool=RECORD_ENTRIES_TOOL):
+    """Copy of a messages.create ``request`` that must answer through ``tool``."""
+    return dict(request, tools=[tool], tool_choice={"type": "tool", "name": tool["name"]})
+
+
+def _text(value, name):
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        raise ValidationError(f"{name} must be a string")
+    return value.strip()
+
+
+def validate_entry(item, default_source=BASE_SOURCE):
+    """
+    Build an Entry from one item of the tool input.
+
+    Raises:
+        ValidationError: If the item is not an object or has no title
+    """
+    if not isinstance(item, dict):
+        raise ValidationError("entry must be an object")
+    title = _text(item.get("title"), "title")
+    if not title:
+        raise ValidationError("entry has no title")
+    themes = item.get("themes") or []
+    if isinstance(themes, str):
+        themes = split_themes(themes)
+    elif not isinstance(themes, list):
+        raise ValidationError("themes must be a list of strings")
+    source = _text(item.get("source"), "source")
+    return Entry(
+        author=_text(item.get("author"), "author"),
+        title=title,
+        date=_text(item.get("date"), "date"),
+        themes=[theme for theme in (_text(theme, "theme") for theme in themes) if theme],
+        source=normalize_source(source) if source else default_source,
+    )
+
+
+def validate_entries(data, default_source=BASE_SOURCE):
+    """
+    Validate a ``record_entries`` tool input.
+
+    Invalid items are dropped and counted; a malformed input as a whole
+    raises.
+
+    Returns:
+        StructuredReply
+
+    Raises:
+        ValidationError: If ``data`` has no ``entries`` list
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("entries"), list):
+        raise ValidationError("tool input must have an entries list")
+    reply = StructuredReply(summary=_text(data.get("summary"), "summary"))
+    for item in data["entries"]:
+        try:
+            reply.entries.append(validate_entry(item, default_source))
+        except ValidationError:
+            reply.rejected += 1
+    return reply
+
+
+def parse_reply(response, default_source=BASE_SOURCE):
+    """
+    Entries of a messages.create response: from the ``record_entries``
+    call when there is one, otherwise from tables in its text.
+
+    Raises:
+        ValidationError: If the tool was called with malformed input or
+            the call was cut off at the output-token cap
+    """
+    texts = []
+    for block in response.content:
+        if block.type == "tool_use" and block.name == TOOL_NAME:
+            if getattr(response, "stop_reason", None) == "max_tokens":
+                raise Truncated("tool call was cut off at max_tokens")
+            return validate_entries(block.input, default_source)
+        if block.type == "text":
+            texts.append(block.text)
+    text = "\n".join(texts)
+    return StructuredReply(parse_markdown_table(text), text, from_tool=False)
+
@@ -0,0 +1,48 @@
+"""
+Text normalisation shared by the catalog, alias and dedup code.
+"""
+
+import re
+import unicodedata
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at by de der des du for from in into is la le of on or "
+    "the to von with".split()
+)
+
+# Words that describe nearly every record in a philosophy catalog
+GENERIC_TERMS = frozenset(
+    "book books philosophy philosophical text texts theory thought tradition "
+    "traditions work works writing writings".split()
+)
+
+_SUFFIXES = ("ical", "ism", "ist", "ian", "ic", "al", "ies", "es", "s")
+
+
+def fold(text):
+    """Lowercase ``text`` and strip diacritics ("Søren" -> "soren")."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    # Letters that NFKD does not decompose
+    return stripped.translate(str.maketrans({"ø": "o", "æ": "ae", "œ": "oe", "ß": "ss", "đ": "d", "ł": "l"}))
+
+
+def tokenize(text):
+    """Folded word tokens of ``text``."""
+    return _WORD.findall(fold(text))
+
+
+def stem(token):
+    """
+    Crude suffix stripping used for prefix matching.
+
+    "ethical" -> "ethic", "buddhist" -> "buddh", "confucian" -> "confuc"; the
+    stem is matched as a prefix, so it only has to be short enough to
+    cover the word's relatives.
+    """
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+            return token[: -len(suffix)]
+    return token
@@ -9,16 +9,74 @@ VERSION 1.1 - Now with PDF and Word Document Support!
 """
 
 import streamlit as st
-import anthropic
+import hmac
+import multiprocessing
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 
-# ============================================================================
-# NEW: Import libraries for PDF and Word document processing
-# ============================================================================
-from pypdf import PdfReader
-from docx import Document
-import io
+from libris.aliases import AliasIndex
+from libris.catalog import Catalog
+from libris.client import ClientPool, ClientPoolConfig
+from libris.dedup import EntryCollection
+from libris.documents import DocumentStore, content_digest, text_cache_from_env
+from libris.exporters import EXPORT_FORMATS
+from libris.extraction import ExtractionLimitError, ExtractionLimits, docx_text, pdf_text, plain_text
+from libris.history import HistoryBudget, build_request
+from libris.jobs import CANCELLED, DONE, FAILED, JobQueue, QueueConfig
+from libris.metrics import (
+    FIRST_TOKEN_SECONDS,
+    REGISTRY as METRICS,
+    UPLOAD_SECONDS,
+    api_call,
+    record_usage,
+    serve as serve_metrics,
+)
+from libris.parsers import MIN_CONFIDENCE as PARSER_MIN_CONFIDENCE
+from libris.processing import (
+    EXTRACTION_SYSTEM_PROMPT,
+    STRUCTURED_EXTRACTION_PROMPT,
+    ChunkingConfig,
+)
+from libris.prompt_cache import (
+    add_usage,
+    cache_hit_ratio,
+    cached_system,
+    usage_from_response,
+    with_cache_breakpoints,
+)
+from libris.prompts import (
+    DOCUMENT_PROMPT,
+    EXAMPLE_QUERIES,
+    FOOTER_HTML,
+    HEADER_HTML,
+    HOW_TO_USE,
+    LIBRIS_SYSTEM_PROMPT,
+    QUICK_SEARCHES,
+    WELCOME_COLUMNS,
+    WELCOME_HTML,
+    analysis_message,
+)
+from libris.ratelimit import QueueTimeout, RateLimitConfig, backoff_delay, is_retryable, reporting, retry_after
+from libris.records import Entry, entries_to_markdown, entry_rows, parse_markdown_table
+from libris.response_cache import ResponseCache, fingerprint
+from libris.retrieval import (
+    RetrievalConfig,
+    VectorIndex,
+    add_document,
+    catalog_index,
+    catalog_search,
+    expand_query,
+    make_encoder,
+    passages_to_markdown,
+)
+from libris.routing import CHAT, EXTRACTION, SEARCH, ModelRouter, record_call, record_fallback
+from libris.session_store import SessionStore, SessionStoreConfig, SpillStore
+from libris.settings import env_bool, env_int, env_str
+from libris.structured import RECORD_ENTRIES_TOOL, ValidationError, parse_reply, with_tool
 
 # ============================================================================
 # PAGE CONFIGURATION
@@ -32,64 +90,24 @@ st.set_page_config(
 )
 
 # ============================================================================
-# LIBRIS SYSTEM PROMPT
+# NEW: Document Processing Functions
 # ============================================================================
 
-LIBRIS_SYSTEM_PROMPT = """You are LIBRIS, an expert librarian and document analysis system specializing in historical and philosophical collections.
-
-CORE CAPABILITIES:
-1. Document Processing: Extract bibliographic data from uploaded documents
-2. Intelligent Search: Search across ~1,100 historical/philosophical works
-3. Thematic Analysis: Identify patterns and connections across texts
-4. Export Formats: Provide results as BibTeX, CSV, JSON, or plain text
-
-DOCUMENT PROCESSING PROTOCOL:
-When a user uploads a document:
-1. Extract bibliographic data (author, title, date, themes)
-2. Structure into standardized entries
-3. Integrate with existing knowledge
-4. Provide processing statistics
-
-Always respond with:
-📚 **Document Processing Complete**
-**File:** [filename]
-**Entries Extracted:** [X] works
-**Date Range:** [earliest] to [latest]
-**Primary Themes:** [list themes]
-
-SEARCH PROTOCOL:
-Return results in markdown table format:
-
-| Publication Date | Author | Book Title | Key Themes / Notes | Source |
-|-----------------|--------|------------|-------------------|--------|
-| [date] | [author] | [title] | [themes] | 📚/📄 |
-
-Source indicators:
-- 📚 Base = From LIBRIS core knowledge
-- 📄 User Doc = From uploaded documents
-
-ANALYSIS:
-After each search, provide:
-- Patterns observed (chronological, thematic)
-- Insights from uploaded documents
-- Suggested next steps
-- Export options
-
-TONE:
-Professional but approachable, like a knowledgeable university librarian. Be precise, transparent about limitations, and enthusiastic about intellectual connections.
-
-SPECIAL FEATURES:
-- Transliteration-aware (match "Confucius" with "Kong Fuzi")
-- Conceptual search (match "justice" with "dharma", "dikaiosyne")
-- Multi-lingual titles (show original and translation)
-- Cross-cultural perspectives
-
-REMEMBER: You're helping make knowledge accessible to the world. Be helpful, educational, and inclusive of all intellectual traditions.
-"""
+# Upload size/page limits and extraction parallelism (see libris.extraction)
+EXTRACTION_LIMITS = ExtractionLimits.from_env()
+
+
+@st.cache_resource
+def get_extraction_pool():
+    """Process pool shared by every session for extracting large PDFs"""
+    if EXTRACTION_LIMITS.workers <= 1:
+        return None
+    # Spawned workers only import libris.extraction, never this script
+    return ProcessPoolExecutor(
+        max_workers=EXTRACTION_LIMITS.workers,
+        mp_context=multiprocessing.get_context("spawn")
+    )
 
-# ============================================================================
-# NEW: Document Processing Functions
-# ============================================================================
 
 def extract_text_from_pdf(uploaded_file):
     """
@@ -102,22 +120,27 @@ def extract_text_from_pdf(uploaded_file):
         str: Extracted text from the PDF
     """
     try:
-        # Read PDF
-        pdf_reader = PdfReader(uploaded_file)
+        progress = st.progress(0.0, text=f"Reading {uploaded_file.name}...")
         
-        # Extract text from all pages
-        text = ""
-        for page_num, page in enumerate(pdf_reader.pages, 1):
-            page_text = page.extract_text()
-            if page_text:
-                text += f"\n--- Page {page_num} ---\n"
-                text += page_text
+        def on_page(done, to_read):
+            progress.progress(done / to_read, text=f"Reading page {done} of {to_read}...")
+        
+        # Extract text from all pages (in parallel batches for large PDFs)
+        text, pages_read, total_pages = pdf_text(
+            uploaded_file.getvalue(), EXTRACTION_LIMITS, get_extraction_pool(), on_page
+        )
+        progress.empty()
         
         if not text.strip():
             return "⚠️ Could not extract text from PDF. The PDF might be image-based or encrypted."
         
+        if pages_read < total_pages:
+            text += f"\n\n[Only the first {pages_read} of {total_pages} pages were extracted.]"
+        
         return text
     
+    except ExtractionLimitError as e:
+        return f"⚠️ File too large: {str(e)}"
     except Exception as e:
         return f"⚠️ Error reading PDF: {str(e)}"
 
@@ -133,31 +156,62 @@ def extract_text_from_docx(uploaded_file):
         str: Extracted text from the document
     """
     try:
-        # Read Word document
-        doc = Document(uploaded_file)
-        
-        # Extract text from all paragraphs
-        text = ""
-        for para in doc.paragraphs:
-            if para.text.strip():
-                text += para.text + "\n"
-        
-        # Also extract text from tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    if cell.text.strip():
-                        text += cell.text + "\n"
+        # Extract text from all paragraphs, then tables
+        text = docx_text(uploaded_file.getvalue(), EXTRACTION_LIMITS)
         
         if not text.strip():
             return "⚠️ Could not extract text from Word document. The document might be empty."
         
         return text
     
+    except ExtractionLimitError as e:
+        return f"⚠️ File too large: {str(e)}"
     except Exception as e:
         return f"⚠️ Error reading Word document: {str(e)}"
 
 
+@st.cache_resource
+def get_text_cache():
+    """Process-wide cache of extracted document text, keyed by content hash"""
+    return text_cache_from_env()
+
+
+def upload_digest(uploaded_file):
+    """Content digest of an upload, remembered per uploaded file"""
+    file_key = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+    digest = st.session_state.upload_digests.get(file_key)
+    if digest is None:
+        digest = content_digest(uploaded_file.getvalue())
+        st.session_state.upload_digests[file_key] = digest
+    return digest
+
+
+def read_upload(uploaded_file):
+    """
+    Hash an upload and return its extracted text.
+    
+    The digest is remembered per uploaded file and the text per digest, so
+    reruns and re-uploads of the same bytes skip extraction entirely.
+    
+    Returns:
+        tuple: (content digest, extracted text)
+    """
+    digest = upload_digest(uploaded_file)
+    
+    # The same bytes can be read differently depending on the extension
+    cache_key = f"{digest}:{os.path.splitext(uploaded_file.name.lower())[1]}"
+    cache = get_text_cache()
+    content = cache.get(cache_key)
+    if content is None:
+        with st.spinner(f"Reading {uploaded_file.name}..."):
+            content = process_uploaded_file(uploaded_file)
+        if not content.startswith("⚠️"):
+            cache.set(cache_key, content)
+    
+    return digest, content
+
+
+@METRICS.timed(UPLOAD_SECONDS)
 def process_uploaded_file(uploaded_file):
     """
     Process an uploaded file based on its type.
@@ -181,14 +235,9 @@ def process_uploaded_file(uploaded_file):
     # Text-based files (txt, md, csv)
     elif filename.endswith(('.txt', '.md', '.csv')):
         try:
-            # Try UTF-8 first
-            content = uploaded_file.read().decode('utf-8')
-            return content
-        except UnicodeDecodeError:
-            # Fallback to latin-1
-            uploaded_file.seek(0)  # Reset file pointer
-            content = uploaded_file.read().decode('latin-1')
-            return content
+            return plain_text(uploaded_file.getvalue(), EXTRACTION_LIMITS)
+        except ExtractionLimitError as e:
+            return f"⚠️ File too large: {str(e)}"
     
     else:
         return f"⚠️ Unsupported file type: {filename}"
@@ -197,54 +246,625 @@ def process_uploaded_file(uploaded_file):
 # SESSION STATE INITIALIZATION
 # ============================================================================
 
+# Per-session memory cap; older turns spill to disk (see libris.session_store)
+SESSION_STORE_CONFIG = SessionStoreConfig.from_env()
+
+
+@st.cache_resource
+def get_spill_store():
+    """Process-wide SQLite file holding spilled conversation turns"""
+    return SpillStore.from_config(SESSION_STORE_CONFIG)
+
+
 def init_session_state():
     """Initialize session state variables"""
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if 'history' not in st.session_state:
+        st.session_state.history = SessionStore(
+            st.session_state.session_id, get_spill_store(), SESSION_STORE_CONFIG
+        )
     if 'documents' not in st.session_state:
         st.session_state.documents = []
     if 'api_key' not in st.session_state:
         st.session_state.api_key = os.environ.get("ANTHROPIC_API_KEY", "")
     if 'conversation_count' not in st.session_state:
         st.session_state.conversation_count = 0
+    if 'usage' not in st.session_state:
+        st.session_state.usage = {}
+    if 'last_results' not in st.session_state:
+        st.session_state.last_results = []
+    if 'upload_digests' not in st.session_state:
+        st.session_state.upload_digests = {}
+    if 'collection' not in st.session_state:
+        st.session_state.collection = EntryCollection(get_alias_index())
 
 # ============================================================================
 # ANTHROPIC API FUNCTIONS
 # ============================================================================
 
-def chat_with_libris(user_message, api_key):
-    """Send message to LIBRIS and get response"""
+@st.cache_resource
+def get_client_pool():
+    """Process-wide Anthropic client pool shared by every session"""
+    return ClientPool(ClientPoolConfig.from_env(), RATE_LIMITS)
+
+
+# Requests queue behind a per-key rate limiter and retry when throttled (see libris.ratelimit)
+RATE_LIMITS = RateLimitConfig.from_env()
+
+
+# Model, output-token cap and fallback per task (see libris.routing)
+ROUTER = ModelRouter.from_env()
+
+# Stream answers token by token (set LIBRIS_STREAMING=0 to wait for full replies)
+STREAMING_ENABLED = env_bool("LIBRIS_STREAMING", True)
+
+# Ask for works through the record_entries tool instead of markdown tables (see libris.structured)
+STRUCTURED_OUTPUT = env_bool("LIBRIS_STRUCTURED_OUTPUT", True)
+
+
+# Input-token budget for each request (see libris.history)
+HISTORY_BUDGET = HistoryBudget.from_env()
+
+# Documents are split into chunks that are extracted concurrently (see libris.processing)
+CHUNKING = ChunkingConfig.from_env()
+
+DOCUMENT_PROMPT_VERSION = fingerprint(
+    *ROUTER.route(EXTRACTION).models, ROUTER.route(EXTRACTION).max_tokens,
+    EXTRACTION_SYSTEM_PROMPT, STRUCTURED_EXTRACTION_PROMPT, RECORD_ENTRIES_TOOL,
+    CHUNKING.chunk_tokens, CHUNKING.structured, PARSER_MIN_CONFIDENCE
+)
+
+
+def build_libris_request(user_message, client, route):
+    """Build the messages.create arguments for the next LIBRIS turn"""
+    return build_request(
+        client,
+        st.session_state.history.for_request(),
+        user_message,
+        route,
+        HISTORY_BUDGET,
+        LIBRIS_SYSTEM_PROMPT
+    )
+
+
+def record_turn(user_message, assistant_message, response=None, document=None):
+    """Append a completed exchange to the conversation history"""
+    if response is not None:
+        add_usage(st.session_state.usage, usage_from_response(response))
+    
+    user_entry = {"role": "user", "content": user_message}
+    if document:
+        # Lets the history manager swap the payload for a summary later
+        user_entry["document"] = document
+    
+    st.session_state.history.append(user_entry)
+    st.session_state.history.append({"role": "assistant", "content": assistant_message})
+    st.session_state.conversation_count += 1
+
+
+def describe_api_error(error):
+    """Turn an API exception into a user-facing message"""
+    # Checked by status code so the anthropic package is only imported with the first client
+    status = getattr(error, "status_code", None)
+    if status == 401:
+        return "❌ **Authentication Error**: Invalid API key. Please check your API key in the sidebar."
+    if status == 429 or isinstance(error, QueueTimeout):
+        return "⚠️ **Rate Limit**: LIBRIS is very busy right now. Please wait a moment and try again."
+    return f"❌ **Error**: {str(error)}"
+
+
+def queue_notice(status):
+    """Callback that shows the user's place in the rate limiter's queue"""
+    def show(position):
+        if position > 1:
+            status.info(f"⏳ LIBRIS is busy: your request is number {position} in the queue...")
+    return show
+
+
+def wait_to_retry(error, attempt, status):
+    """
+    Back off before retrying a throttled call.
+    
+    Returns:
+        bool: False if the error is not retryable or retries are used up
+    """
+    if attempt >= RATE_LIMITS.max_retries or not is_retryable(error):
+        return False
+    delay = backoff_delay(attempt, RATE_LIMITS.backoff_base, RATE_LIMITS.backoff_cap, retry_after(error))
+    status.info(f"⏳ LIBRIS is busy; retrying in {delay:.1f}s (attempt {attempt + 2} of {RATE_LIMITS.max_retries + 1})...")
+    time.sleep(delay)
+    return True
+
+
+def call_libris(client, request, status, task):
+    """
+    Make one messages.create call, queued behind the rate limiter and
+    retried with backoff when throttled, and record its usage, latency and
+    cost under task
+    """
+    attempt = 0
+    while True:
+        try:
+            started = time.perf_counter()
+            with reporting(queue_notice(status)), api_call(task):
+                response = client.messages.create(**request)
+            break
+        except Exception as e:
+            if not wait_to_retry(e, attempt, status):
+                raise
+            attempt += 1
+    status.empty()
+    usage = usage_from_response(response)
+    record_usage(task, usage)
+    record_call(task, request["model"], time.perf_counter() - started, usage)
+    return response
+
+
+def chat_with_libris(user_message, api_key, document=None, request=None, on_complete=None, structured=False,
+                     task=CHAT):
+    """
+    Send message to LIBRIS and get response.
+    
+    The request goes to the model routed for task, waits its turn behind
+    the process-wide rate limiter and is retried with backoff when
+    throttled. request overrides the default history-based request;
+    on_complete is called with the reply text when the call succeeds.
+    
+    In structured mode LIBRIS answers through the record_entries tool and
+    a StructuredReply with validated entries is returned instead of text;
+    a reply that fails validation is asked again of the route's fallback
+    model. Errors are still returned as text.
+    """
+    status = st.empty()
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        
-        # Build message history
-        messages = st.session_state.messages + [
-            {"role": "user", "content": user_message}
-        ]
+        client = get_client_pool().get(api_key)
+        route = ROUTER.route(task)
+        request = request or build_libris_request(user_message, client, route)
+        if structured:
+            request = with_tool(request)
         
         # Call Claude API
-        response = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=4000,
-            system=LIBRIS_SYSTEM_PROMPT,
-            messages=messages
-        )
+        response = call_libris(client, request, status, task)
+        reply = None
+        if structured:
+            try:
+                reply = parse_reply(response)
+            except ValidationError:
+                if len(route.models) < 2 or request["model"] == route.fallback:
+                    raise
+                # The failed reply was billed too
+                add_usage(st.session_state.usage, usage_from_response(response))
+                record_fallback(task, request["model"], route.fallback)
+                request = dict(request, model=route.fallback)
+                response = call_libris(client, request, status, task)
+                reply = parse_reply(response)
         
-        assistant_message = response.content[0].text
+        if reply is not None and reply.from_tool:
+            # The history keeps the table form so later turns can refer to the works
+            assistant_message = "\n\n".join(filter(None, [reply.summary, entries_to_markdown(reply.entries)]))
+        else:
+            assistant_message = response.content[0].text
+        record_turn(user_message, assistant_message, response, document)
+        if on_complete is not None:
+            on_complete(assistant_message)
         
-        # Update conversation history
-        st.session_state.messages.append({"role": "user", "content": user_message})
-        st.session_state.messages.append({"role": "assistant", "content": assistant_message})
-        st.session_state.conversation_count += 1
+        return reply if structured else assistant_message
         
-        return assistant_message
+    except Exception as e:
+        status.empty()
+        return describe_api_error(e)
+
+
+def stream_libris(user_message, api_key, document=None, request=None, on_complete=None, task=CHAT):
+    """
+    Stream LIBRIS's reply as text chunks, for use with st.write_stream.
+    
+    The full reply is added to the conversation history once the stream
+    finishes. Throttled requests are queued and retried as in
+    chat_with_libris until the first text arrives. If the stream breaks
+    part-way, the text received so far is kept (marked as interrupted)
+    and the error is appended to the output. request, on_complete and
+    task behave as in chat_with_libris.
+    """
+    chunks = []
+    status = st.empty()
+    try:
+        client = get_client_pool().get(api_key)
+        request = request or build_libris_request(user_message, client, ROUTER.route(task))
+        
+        attempt = 0
+        while True:
+            try:
+                started = time.perf_counter()
+                with reporting(queue_notice(status)), api_call("stream"), client.messages.stream(**request) as stream:
+                    status.empty()
+                    for text in stream.text_stream:
+                        if not chunks:
+                            FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                        chunks.append(text)
+                        yield text
+                    response = stream.get_final_message()
+                break
+            except Exception as e:
+                # Text already shown can't be taken back, so only retry before the first chunk
+                if chunks or not wait_to_retry(e, attempt, status):
+                    raise
+                attempt += 1
+        
+        usage = usage_from_response(response)
+        record_usage("stream", usage)
+        record_call(task, request["model"], time.perf_counter() - started, usage)
+        record_turn(user_message, "".join(chunks), response, document)
+        if on_complete is not None:
+            on_complete("".join(chunks))
         
-    except anthropic.AuthenticationError:
-        return "❌ **Authentication Error**: Invalid API key. Please check your API key in the sidebar."
-    except anthropic.RateLimitError:
-        return "⚠️ **Rate Limit**: Too many requests. Please wait a moment and try again."
     except Exception as e:
-        return f"❌ **Error**: {str(e)}"
+        status.empty()
+        if chunks:
+            record_turn(user_message, "".join(chunks) + "\n\n_(response interrupted)_", document=document)
+        yield "\n\n" + describe_api_error(e)
+
+
+def remember_results(entries):
+    """Keep the latest structured results for the Export tab"""
+    if entries:
+        st.session_state.last_results = entries
+
+
+def render_entries(entries):
+    """Show entries as a sortable, filterable table"""
+    st.dataframe(entry_rows(entries), use_container_width=True, hide_index=True)
+
+
+def add_to_collection(entries, document):
+    """
+    Merge a document's entries into the session's collection of works.
+    
+    Returns:
+        AddResult: New works, and the entries merged into ones already collected
+    """
+    return st.session_state.collection.add(entries, document)
+
+
+@st.cache_resource
+def get_response_cache():
+    """Process-wide cache of search analyses shared by every session"""
+    return ResponseCache.from_env()
+
+
+@st.cache_resource
+def get_document_store():
+    """Process-wide store of document processing results, keyed by content hash"""
+    return DocumentStore.from_env(version=DOCUMENT_PROMPT_VERSION)
+
+
+def document_message(filename, content):
+    """Prompt asking LIBRIS to process an uploaded document"""
+    return DOCUMENT_PROMPT.format(filename=filename, content=content)
+
+
+def process_document(filename, file_type, content, digest):
+    """
+    Extract bibliographic entries from an uploaded document.
+    
+    The document is processed on the background queue like bulk uploads,
+    so reruns of the page neither interrupt nor repeat it; its report is
+    added to the conversation when it finishes. A document whose bytes
+    were processed before (by anyone) is answered from the document store
+    without another model call, and one that was cancelled resumes from
+    the sections already extracted.
+    """
+    client = get_client_pool().get(st.session_state.api_key)
+    job = get_job_queue().submit(client, filename, file_type, None, digest, text=content, in_chat=True)
+    if not job.finished:
+        st.info(f"⏳ Processing {filename} in the background; you can keep using LIBRIS meanwhile")
+
+
+# Bulk uploads run on a background queue (see libris.jobs)
+QUEUE_CONFIG = QueueConfig.from_env()
+
+# Seconds between refreshes of the queue panel while documents are processing
+QUEUE_REFRESH_SECONDS = 2
+
+
+@st.cache_resource
+def get_job_executor():
+    """Thread pool shared by every session for bulk document jobs"""
+    return ThreadPoolExecutor(max_workers=QUEUE_CONFIG.workers, thread_name_prefix="libris-job")
+
+
+def get_job_queue():
+    """This session's queue of bulk document jobs"""
+    if 'job_queue' not in st.session_state:
+        st.session_state.job_queue = JobQueue(
+            get_job_executor(),
+            get_document_store(),
+            ROUTER.route(EXTRACTION),
+            CHUNKING,
+            EXTRACTION_LIMITS,
+            QUEUE_CONFIG,
+            get_extraction_pool()
+        )
+    return st.session_state.job_queue
+
+
+def queue_uploads(uploaded_files, use_batches=False):
+    """Submit uploaded files to the background queue"""
+    queue = get_job_queue()
+    client = get_client_pool().get(st.session_state.api_key)
+    files = [
+        (uploaded_file.name, uploaded_file.type, uploaded_file.getvalue(), upload_digest(uploaded_file))
+        for uploaded_file in uploaded_files
+    ]
+    if use_batches:
+        queue.submit_batch(client, files)
+    else:
+        for filename, file_type, data, digest in files:
+            queue.submit(client, filename, file_type, data, digest)
+
+
+def collect_finished_jobs(queue):
+    """Move results of finished jobs into the session"""
+    finished = queue.collect_finished()
+    for job in finished:
+        for usage in job.usage:
+            add_usage(st.session_state.usage, usage)
+        if job.status == DONE:
+            added = add_to_collection(job.entries, job.filename)
+            if added.merged:
+                job.detail = f"🔗 {len(added.merged)} already in your collection, merged"
+            if job.in_chat:
+                record_turn(document_message(job.filename, job.text), job.report, document=job.filename)
+                remember_results(job.entries)
+            indexed = any(doc['digest'] == job.digest for doc in st.session_state.documents)
+            if job.text and not indexed:
+                index_passages(job.filename, job.text)
+            job.text = ""
+            st.session_state.documents.append({
+                'filename': job.filename,
+                'processed_at': datetime.now().isoformat(),
+                'file_type': job.file_type,
+                'digest': job.digest,
+                'entries': len(job.entries)
+            })
+    
+    if any(job.status == DONE and not job.in_chat for job in finished):
+        # Export every work collected so far, each once
+        remember_results(st.session_state.collection.entries())
+
+
+def render_job_queue():
+    """Show the background queue, refreshed in place while documents are processing"""
+    if 'job_queue' not in st.session_state:
+        return
+    # Only the panel reruns, so search results and analyses stay on screen
+    refresh = QUEUE_REFRESH_SECONDS if st.session_state.job_queue.active() else None
+    st.fragment(job_queue_panel, run_every=refresh)()
+
+
+def job_queue_panel():
+    """Show per-file progress of the background queue"""
+    queue = st.session_state.job_queue
+    collect_finished_jobs(queue)
+    jobs = queue.jobs()
+    if not jobs:
+        return
+    
+    st.markdown("#### 📋 Processing Queue")
+    finished = sum(job.finished for job in jobs)
+    st.caption(f"{finished} of {len(jobs)} files finished")
+    
+    for job in jobs:
+        label = f"{job.icon} {job.filename} — {job.status}"
+        if job.status == DONE:
+            label += f" ({len(job.entries)} works{', saved result' if job.cached else ''})"
+        if job.detail:
+            label += f" · {job.detail}"
+        st.progress(job.progress, text=label)
+        if not job.finished and not job.cancel_requested:
+            if st.button("⏹️ Cancel", key=f"cancel_{job.id}"):
+                queue.cancel(job.id)
+                st.rerun(scope="fragment")
+        elif job.status == CANCELLED:
+            st.caption(
+                f"Stopped with {job.sections_done} of {job.sections} sections extracted; "
+                "process the file again to finish the rest"
+            )
+        elif job.status == FAILED:
+            st.caption(describe_api_error(job.error))
+        elif job.status == DONE:
+            with st.expander(f"Report: {job.filename}", expanded=job.in_chat):
+                st.markdown(job.report)
+                if job.cached:
+                    st.caption("⚡ This document was processed before; showing the saved result")
+                if job.entries:
+                    render_entries(job.entries)
+    
+    if finished and st.button("🧹 Clear finished"):
+        queue.clear_finished()
+        st.rerun(scope="fragment")
+
+
+def standalone_request(user_message, route):
+    """Request for route that sends user_message without the conversation history"""
+    return {
+        "model": route.model,
+        "max_tokens": route.max_tokens,
+        "system": cached_system(LIBRIS_SYSTEM_PROMPT),
+        "messages": with_cache_breakpoints([{"role": "user", "content": user_message}]),
+    }
+
+
+@st.cache_resource
+def get_alias_index():
+    """Process-wide transliteration and synonym table"""
+    return AliasIndex.from_csv()
+
+
+@st.cache_resource
+def get_catalog():
+    """Process-wide bibliographic catalog (LIBRIS_CATALOG_DB to keep it on disk)"""
+    return Catalog.from_csv(
+        db_path=env_str("LIBRIS_CATALOG_DB", ":memory:"),
+        aliases=get_alias_index()
+    )
+
+
+# Semantic retrieval over the catalog and uploaded documents (see libris.retrieval)
+RETRIEVAL_CONFIG = RetrievalConfig.from_env()
+
+
+@st.cache_resource(show_spinner="Indexing the catalog...")
+def get_catalog_index():
+    """Process-wide vector index of the catalog (LIBRIS_VECTOR_INDEX to keep it on disk)"""
+    return catalog_index(get_catalog(), RETRIEVAL_CONFIG)
+
+
+def get_passage_index():
+    """This session's vector index of uploaded document passages"""
+    if 'passages' not in st.session_state:
+        st.session_state.passages = VectorIndex(make_encoder(RETRIEVAL_CONFIG))
+    return st.session_state.passages
+
+
+def index_passages(filename, content):
+    """Make an uploaded document's passages searchable alongside the catalog"""
+    return add_document(get_passage_index(), filename, content, RETRIEVAL_CONFIG)
+
+
+def search_catalog(query, year_from=None, year_to=None, include_analysis=True):
+    """
+    Search the local catalog and render the results table.
+    
+    The table comes straight from the catalog: keyword matches first, then
+    works related in meaning when there are few of those. Passages of the
+    user's documents related to the query are retrieved as well. The model
+    is only asked for the narrative analysis of what was retrieved.
+    Queries with no local matches fall back to LIBRIS's wider knowledge.
+    """
+    search = catalog_search(get_catalog(), get_catalog_index(), query, RETRIEVAL_CONFIG, year_from, year_to)
+    result, related, records = search.result, search.related, search.records
+    passages = []
+    if len(st.session_state.get('passages') or ()):
+        passages = st.session_state.passages.search(expand_query(query, result.expansions), RETRIEVAL_CONFIG.top_k)
+    
+    if not records:
+        st.info("No matches in the local catalog. Asking LIBRIS to search its wider knowledge...")
+        if STRUCTURED_OUTPUT:
+            entries = respond_structured(f"Search for: {query}", "🔍 Searching LIBRIS knowledge base...", task=SEARCH)
+            remember_results(entries)
+            return entries_to_markdown(entries)
+        response = respond(f"Search for: {query}", "🔍 Searching LIBRIS knowledge base...", task=SEARCH)
+        remember_results(parse_markdown_table(response))
+        return response
+    
+    entries = [Entry.from_catalog(record) for record in records]
+    remember_results(entries)
+    if result.records:
+        st.caption(f"📚 {len(result.records)} works found in {result.elapsed_ms:.0f} ms")
+    if related:
+        st.caption(f"🧭 {len(related)} related works found by meaning")
+    expanded = [
+        f"{expansion.phrase} → {', '.join(expansion.added)}"
+        for expansion in result.expansions if expansion.added
+    ]
+    if expanded:
+        st.caption("🔤 Also searched: " + "; ".join(expanded))
+    # The model reads the table; the user gets a sortable view of the same rows
+    table = search.table
+    render_entries(entries)
+    
+    grounding = passages_to_markdown(passages)
+    if passages:
+        with st.expander(f"📄 {len(passages)} passages from your documents"):
+            st.markdown(grounding)
+    
+    if include_analysis:
+        message = analysis_message(query, table, grounding)
+        route = ROUTER.route(SEARCH)
+        cache = get_response_cache()
+        key = search.analysis_key(route.model, grounding)
+        
+        cached = cache.get(key)
+        if cached is not None:
+            st.markdown(cached)
+            st.caption("⚡ Cached analysis")
+            record_turn(message, cached)
+        else:
+            respond(
+                message,
+                "🧠 Analysing results...",
+                request=standalone_request(message, route),
+                on_complete=lambda text: cache.set(key, text),
+                task=SEARCH
+            )
+    
+    return table
+
+
+@st.cache_resource
+def prewarm_quick_searches():
+    """Fill the response cache with the quick-search analyses, once per process"""
+    api_key = os.environ.get("ANTHROPIC_API_KEY", "")
+    if not api_key:
+        return None
+    
+    catalog = get_catalog()
+    index = get_catalog_index()
+    cache = get_response_cache()
+    client = get_client_pool().get(api_key)
+    route = ROUTER.route(SEARCH)
+    
+    def warm():
+        for query in QUICK_SEARCHES:
+            search = catalog_search(catalog, index, query, RETRIEVAL_CONFIG)
+            key = search.analysis_key(route.model)
+            if cache.contains(key):
+                continue
+            message = analysis_message(query, search.table)
+            try:
+                started = time.perf_counter()
+                response = client.messages.create(**standalone_request(message, route))
+            except Exception:
+                # Warming is best-effort; live requests will fill the cache instead
+                return
+            record_call(SEARCH, route.model, time.perf_counter() - started, usage_from_response(response))
+            cache.set(key, response.content[0].text)
+    
+    thread = threading.Thread(target=warm, name="libris-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def respond_structured(user_message, spinner_text="LIBRIS is thinking...", task=CHAT):
+    """
+    Render LIBRIS's reply to user_message as a table of entries and its
+    summary, and return the entries (empty on error)
+    """
+    with st.spinner(spinner_text):
+        reply = chat_with_libris(user_message, st.session_state.api_key, structured=True, task=task)
+    if isinstance(reply, str):
+        st.markdown(reply)
+        return []
+    if reply.entries:
+        render_entries(reply.entries)
+    if reply.summary:
+        st.markdown(reply.summary)
+    return reply.entries
+
+
+def respond(user_message, spinner_text="LIBRIS is thinking...", document=None, request=None, on_complete=None,
+            task=CHAT):
+    """Render LIBRIS's reply to user_message, made by the model routed for task, and return its text"""
+    api_key = st.session_state.api_key
+    if STREAMING_ENABLED:
+        return st.write_stream(stream_libris(user_message, api_key, document, request, on_complete, task))
+    
+    with st.spinner(spinner_text):
+        response = chat_with_libris(user_message, api_key, document, request, on_complete, task=task)
+    st.markdown(response)
+    return response
 
 # ============================================================================
 # UI COMPONENTS
@@ -255,17 +875,65 @@ def render_header():
     col1, col2, col3 = st.columns([1, 2, 1])
     
     with col2:
-        st.markdown("""
-        <h1 style='text-align: center; color: #6366f1;'>
-            📚 LIBRIS
-        </h1>
-        <p style='text-align: center; font-size: 1.2em; color: #94a3b8;'>
-            Advanced Librarian AI Agent
-        </p>
-        <p style='text-align: center; color: #64748b;'>
-            Free for the world to use • Powered by Claude AI
-        </p>
-        """, unsafe_allow_html=True)
+        st.markdown(HEADER_HTML, unsafe_allow_html=True)
+
+# Admin panel in the sidebar and /metrics endpoint (see libris.metrics)
+ADMIN_TOKEN = env_str("LIBRIS_ADMIN_TOKEN")
+METRICS_PORT = env_int("LIBRIS_METRICS_PORT", 0)
+# The endpoint has no authentication, so it only listens locally unless told otherwise
+METRICS_HOST = env_str("LIBRIS_METRICS_HOST", "127.0.0.1")
+
+
+@st.cache_resource
+def start_metrics_server():
+    """Serve Prometheus metrics on METRICS_HOST:METRICS_PORT once per process"""
+    return serve_metrics(METRICS_PORT, host=METRICS_HOST)
+
+
+def render_admin_panel():
+    """Metrics summary for administrators holding LIBRIS_ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        return
+    
+    st.markdown("---")
+    with st.expander("🛠️ Admin"):
+        if not st.session_state.get('admin'):
+            token = st.text_input("Admin token", type="password")
+            if not token:
+                return
+            if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+                st.error("Invalid admin token")
+                return
+            st.session_state.admin = True
+        
+        rows = METRICS.summary()
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("No metrics recorded yet")
+        
+        st.markdown("**Model routing**")
+        st.caption(" · ".join(
+            f"{route.task}: {route.model} ({route.max_tokens} tokens"
+            + (f", falls back to {route.fallback})" if route.fallback else ")")
+            for route in ROUTER.routes.values()
+        ))
+        routing = ROUTER.report()
+        if routing:
+            st.dataframe(routing, use_container_width=True, hide_index=True)
+        
+        spilled = get_spill_store().stats()
+        st.markdown(f"""
+        - **Spilled conversations:** {spilled['sessions']} sessions, {spilled['messages']} messages
+        - **Spill store size:** {spilled['stored_bytes'] / 1e6:.1f} MB ({spilled['raw_bytes'] / 1e6:.1f} MB uncompressed)
+        """)
+        st.download_button(
+            "Download Prometheus metrics",
+            data=METRICS.render(),
+            file_name="libris_metrics.txt",
+            mime="text/plain"
+        )
+
 
 def render_sidebar():
     """Render the sidebar with info and stats"""
@@ -276,15 +944,47 @@ def render_sidebar():
         - 📄 Document processing
         - 🔍 Intelligent search
         - 🌍 Cross-cultural perspectives
-        - 📚 ~1,100 historical & philosophical works
+        - 📚 ~200 historical & philosophical works
         """)
         
         st.markdown("---")
         
         st.markdown("### 📊 Your Session")
         st.metric("Documents Processed", len(st.session_state.documents))
+        collection = st.session_state.collection
+        st.metric(
+            "Works in Collection",
+            len(collection),
+            help=f"{collection.duplicates} repeated citations merged across your documents"
+        )
         st.metric("Queries Made", st.session_state.conversation_count)
         
+        memory = st.session_state.history.stats()
+        passages = st.session_state.get('passages')
+        index_bytes = passages.nbytes if passages is not None else 0
+        st.metric(
+            "Session Memory",
+            f"{(memory['resident_bytes'] + index_bytes) / 1e6:.1f} MB",
+            help=(
+                f"Conversation {memory['resident_bytes'] / 1e6:.1f} MB of a "
+                f"{memory['max_resident_bytes'] / 1e6:.1f} MB limit, "
+                f"{memory['spilled_messages']} messages ({memory['spilled_bytes'] / 1e6:.1f} MB) kept on disk; "
+                f"document passages {index_bytes / 1e6:.1f} MB ({len(passages or ())} indexed)"
+            )
+        )
+        
+        usage = st.session_state.usage
+        if usage.get("requests"):
+            st.metric(
+                "Prompt Cache Hit Rate",
+                f"{cache_hit_ratio(usage):.0%}",
+                help=(
+                    f"{usage.get('cache_read_input_tokens', 0):,} input tokens read from cache, "
+                    f"{usage.get('cache_creation_input_tokens', 0):,} written, "
+                    f"{usage.get('input_tokens', 0):,} uncached"
+                )
+            )
+        
         st.markdown("---")
         
         st.markdown("### 🔑 API Configuration")
@@ -293,10 +993,38 @@ def render_sidebar():
         if st.session_state.api_key:
             st.success("✅ API key configured")
             if st.button("🔄 Reset Session"):
-                st.session_state.messages = []
+                st.session_state.history.clear()
                 st.session_state.documents = []
                 st.session_state.conversation_count = 0
+                st.session_state.usage = {}
+                st.session_state.last_results = []
+                st.session_state.collection.clear()
+                st.session_state.pop('passages', None)
                 st.rerun()
+            
+            cache_stats = get_response_cache().stats()
+            if cache_stats["hits"] + cache_stats["misses"]:
+                st.metric(
+                    "Response Cache Hit Rate",
+                    f"{cache_stats['hit_rate']:.0%}",
+                    help=f"{cache_stats['entries']} cached answers shared by all sessions"
+                )
+            
+            with st.expander("🔌 Connection Pool"):
+                pool_stats = get_client_pool().stats()
+                st.markdown(f"""
+                - **Clients:** {pool_stats['clients']}
+                - **Open connections:** {pool_stats['open_connections']} / {pool_stats['max_connections']}
+                - **Keep-alive slots:** {pool_stats['max_keepalive_connections']}
+                - **Reused / created:** {pool_stats['hits']} / {pool_stats['misses']}
+                """)
+                for limits in pool_stats['rate_limits']:
+                    st.markdown(f"""
+                    - **Requests available:** {limits['requests_available']} / {limits['requests_per_minute']} per min
+                    - **Input tokens available:** {limits['tokens_available']:,} / {limits['tokens_per_minute']:,} per min
+                    - **Waiting in queue:** {limits['queued']}
+                    - **Requests delayed / throttled:** {limits['waited']} / {limits['throttled']}
+                    """)
         else:
             st.warning("⚠️ No API key configured")
             st.markdown("""
@@ -312,83 +1040,30 @@ def render_sidebar():
                 st.session_state.api_key = temp_key
                 st.rerun()
         
+        render_admin_panel()
+        
         st.markdown("---")
         
         st.markdown("### 💡 Example Queries")
-        examples = [
-            "Ancient Greek philosophy",
-            "Social contract theory",
-            "Buddhist ethics",
-            "Medieval Islamic philosophy",
-            "Confucian virtue ethics",
-            "Natural law tradition"
-        ]
-        
-        for example in examples:
+        for example in EXAMPLE_QUERIES:
             st.markdown(f"- {example}")
         
         st.markdown("---")
         
         st.markdown("### ℹ️ How to Use")
-        st.markdown("""
-        1. **Search**: Enter queries in the search box
-        2. **Upload**: Upload reading lists or bibliographies
-        3. **Chat**: Ask questions about texts
-        4. **Export**: Request BibTeX, CSV, or JSON
-        """)
+        st.markdown(HOW_TO_USE)
         
         st.markdown("---")
         
-        st.markdown("""
-        <div style='text-align: center; font-size: 0.8em; color: #64748b;'>
-        Made with ❤️ for the world<br>
-        Open source • Free forever<br>
-        v1.1 - PDF & Word Support
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(FOOTER_HTML, unsafe_allow_html=True)
 
 def render_welcome():
     """Render welcome message when no conversation exists"""
-    st.markdown("""
-    <div style='padding: 2rem; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                border-radius: 10px; color: white; text-align: center; margin: 2rem 0;'>
-        <h2>👋 Welcome to LIBRIS!</h2>
-        <p style='font-size: 1.1em;'>Your advanced AI librarian for historical and philosophical research</p>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.markdown("""
-        ### 🔍 **Search**
-        Find books and texts across thousands of years of human thought. Search by:
-        - Author names
-        - Time periods
-        - Themes & concepts
-        - Cultural traditions
-        """)
-    
-    with col2:
-        st.markdown("""
-        ### 📄 **Process Documents**
-        Upload your reading lists, syllabi, or bibliographies. LIBRIS will:
-        - Extract bibliographic data
-        - Categorize by theme
-        - Identify patterns
-        - Build your collection
-        """)
+    st.markdown(WELCOME_HTML, unsafe_allow_html=True)
     
-    with col3:
-        st.markdown("""
-        ### 📚 **Learn & Explore**
-        Discover connections across:
-        - Ancient Greek & Roman
-        - Islamic Golden Age
-        - Chinese classics
-        - Indian philosophy
-        - Modern thought
-        """)
+    for column, markup in zip(st.columns(3), WELCOME_COLUMNS):
+        with column:
+            st.markdown(markup)
 
 # ============================================================================
 # MAIN APP
@@ -400,6 +1075,12 @@ def main():
     # Initialize session state
     init_session_state()
     
+    if env_bool("LIBRIS_PREWARM_QUICK_SEARCHES"):
+        prewarm_quick_searches()
+    
+    if METRICS_PORT:
+        start_metrics_server()
+    
     # Render header and sidebar
     render_header()
     render_sidebar()
@@ -427,45 +1108,53 @@ def main():
         with col2:
             search_button = st.button("🔍 Search", use_container_width=True)
         
-        if search_button and search_query:
-            with st.spinner("🔍 Searching LIBRIS knowledge base..."):
-                response = chat_with_libris(f"Search for: {search_query}", st.session_state.api_key)
-                st.markdown(response)
+        with st.expander("📅 Filters"):
+            fcol1, fcol2, fcol3 = st.columns(3)
+            with fcol1:
+                year_from = st.number_input("From year (negative = BC)", value=None, step=1)
+            with fcol2:
+                year_to = st.number_input("To year (negative = BC)", value=None, step=1)
+            with fcol3:
+                include_analysis = st.checkbox("Include LIBRIS analysis", value=True)
+        
+        query_to_run = search_query if search_button and search_query else None
         
         # Quick search buttons
         st.markdown("**Quick searches:**")
         quick_cols = st.columns(3)
-        quick_searches = [
-            "Ancient Greek philosophy",
-            "Social contract theory", 
-            "Buddhist ethics",
-            "Medieval Islamic philosophy",
-            "Confucian virtue",
-            "Natural law"
-        ]
-        
-        for idx, qs in enumerate(quick_searches):
+        
+        for idx, qs in enumerate(QUICK_SEARCHES):
             with quick_cols[idx % 3]:
                 if st.button(qs, key=f"quick_{idx}"):
-                    with st.spinner(f"Searching for {qs}..."):
-                        response = chat_with_libris(f"Search for: {qs}", st.session_state.api_key)
-                        st.markdown(response)
+                    query_to_run = qs
+        
+        if query_to_run:
+            search_catalog(query_to_run, year_from, year_to, include_analysis)
     
     # TAB 2: UPLOAD DOCUMENT (UPDATED!)
     with tab2:
         st.markdown("### 📄 Upload Document for Processing")
         
-        # UPDATED: Now accepts PDF and Word documents!
-        uploaded_file = st.file_uploader(
-            "Choose a file",
-            type=['txt', 'md', 'csv', 'pdf', 'docx'],  # UPDATED: Added 'pdf' and 'docx'
+        uploaded_files = st.file_uploader(
+            "Choose files",
+            type=['txt', 'md', 'csv', 'pdf', 'docx'],
+            accept_multiple_files=True,
             help="Upload reading lists, syllabi, bibliographies, PDFs, or Word documents"
         )
         
-        if uploaded_file is not None:
-            # Process the file based on type
-            with st.spinner(f"Reading {uploaded_file.name}..."):
-                content = process_uploaded_file(uploaded_file)
+        if len(uploaded_files or []) > 1:
+            st.success(f"✅ {len(uploaded_files)} files selected")
+            use_batches = st.checkbox(
+                "Use the Message Batches API (lower cost, results can take longer)",
+                value=QUEUE_CONFIG.use_batches
+            )
+            if st.button(f"📚 Process {len(uploaded_files)} Documents", type="primary"):
+                queue_uploads(uploaded_files, use_batches)
+        
+        elif uploaded_files:
+            uploaded_file = uploaded_files[0]
+            # Process the file based on type (memoised by content hash)
+            digest, content = read_upload(uploaded_file)
             
             # Check if extraction was successful
             if content.startswith("⚠️"):
@@ -488,18 +1177,15 @@ def main():
                         st.text(content)
                 
                 if st.button("📚 Process Document", type="primary"):
-                    with st.spinner(f"Processing {uploaded_file.name}..."):
-                        message = f"I'm uploading a document called '{uploaded_file.name}'. Please process it and extract bibliographic information.\n\nDocument content:\n{content}"
-                        response = chat_with_libris(message, st.session_state.api_key)
-                        
-                        # Store document info
-                        st.session_state.documents.append({
-                            'filename': uploaded_file.name,
-                            'processed_at': datetime.now().isoformat(),
-                            'file_type': uploaded_file.type
-                        })
-                        
-                        st.markdown(response)
+                    process_document(uploaded_file.name, uploaded_file.type, content, digest)
+        
+        render_job_queue()
+        
+        collection = st.session_state.collection
+        if len(collection):
+            with st.expander(f"📚 Your Collection ({len(collection)} works from {len(st.session_state.documents)} documents)"):
+                st.caption("Works cited in several documents appear once, with every document they were found in")
+                st.dataframe(collection.rows(), use_container_width=True, hide_index=True)
         
         st.markdown("---")
         st.markdown("""
@@ -524,8 +1210,15 @@ def main():
     with tab3:
         st.markdown("### 💬 Chat with LIBRIS")
         
-        # Display chat history
-        for message in st.session_state.messages:
+        # Display chat history; turns spilled to disk are only read back on request
+        history = st.session_state.history
+        show_spilled = False
+        if history.spilled_turn_messages:
+            show_spilled = st.checkbox(
+                f"🗄️ Show {history.spilled_turn_messages} earlier messages",
+                help="Older messages are kept on disk to save memory and are not sent to LIBRIS"
+            )
+        for message in history.iter_messages(load=show_spilled):
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
         
@@ -537,9 +1230,7 @@ def main():
             
             # Get and display assistant response
             with st.chat_message("assistant"):
-                with st.spinner("LIBRIS is thinking..."):
-                    response = chat_with_libris(prompt, st.session_state.api_key)
-                    st.markdown(response)
+                respond(prompt)
     
     # TAB 4: EXPORT
     with tab4:
@@ -550,32 +1241,54 @@ def main():
         First perform a search, then come here to export the results.
         """)
         
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("📑 Export as BibTeX", use_container_width=True):
-                with st.spinner("Generating BibTeX..."):
-                    response = chat_with_libris("Export the last results as BibTeX", st.session_state.api_key)
-                    st.markdown(response)
+        entries = st.session_state.last_results
+        if len(st.session_state.collection):
+            source = st.radio(
+                "Export",
+                ["Latest results", "Whole collection"],
+                horizontal=True,
+                help="The collection holds every work from your processed documents, each once"
+            )
+            if source == "Whole collection":
+                entries = st.session_state.collection.entries()
+        if not entries:
+            st.info("💡 No results to export yet. Run a search or process a document first.")
+        else:
+            st.caption(f"{len(entries)} entries from your last search or processed document")
             
-            if st.button("📄 Export as JSON", use_container_width=True):
-                with st.spinner("Generating JSON..."):
-                    response = chat_with_libris("Export the last results as JSON", st.session_state.api_key)
-                    st.markdown(response)
-        
-        with col2:
-            if st.button("📊 Export as CSV", use_container_width=True):
-                with st.spinner("Generating CSV..."):
-                    response = chat_with_libris("Export the last results as CSV", st.session_state.api_key)
-                    st.markdown(response)
+            exports = {
+                name: renderer(entries)
+                for name, (label, renderer, extension, mime) in EXPORT_FORMATS.items()
+            }
+            
+            col1, col2 = st.columns(2)
+            buttons = [
+                (col1, "bibtex", "📑 Export as BibTeX"),
+                (col2, "csv", "📊 Export as CSV"),
+                (col1, "json", "📄 Export as JSON"),
+                (col2, "text", "📝 Export as Plain Text"),
+            ]
+            for column, name, button_label in buttons:
+                label, renderer, extension, mime = EXPORT_FORMATS[name]
+                with column:
+                    st.download_button(
+                        button_label,
+                        data=exports[name],
+                        file_name=f"libris_export.{extension}",
+                        mime=mime,
+                        use_container_width=True
+                    )
             
-            if st.button("📝 Export as Plain Text", use_container_width=True):
-                with st.spinner("Generating plain text..."):
-                    response = chat_with_libris("Export the last results as plain text", st.session_state.api_key)
-                    st.markdown(response)
+            with st.expander("Preview"):
+                preview = st.selectbox(
+                    "Format",
+                    list(EXPORT_FORMATS),
+                    format_func=lambda name: EXPORT_FORMATS[name][0]
+                )
+                st.code(exports[preview], language="bibtex" if preview == "bibtex" else preview)
     
     # Show welcome message if no conversation
-    if len(st.session_state.messages) == 0:
+    if len(st.session_state.history) == 0:
         st.markdown("---")
         render_welcome()
 